@@ -0,0 +1,74 @@
+"""
+Offline benchmark of the website enrichment stage.
+
+Enriches businesses whose websites are served by a local stand-in
+(benchmarks/fake_sites.py), first with an empty page cache and then again
+from the cache, and reports sites/sec and the enrichment figures of each
+run. --serial adds a run with one connection at a time for comparison.
+
+All fake sites share one host, so the per-host limit defaults to the total
+connection limit here.
+
+Usage:
+    python benchmarks/bench_enrich.py --sites 300 --latency-ms 200
+    python benchmarks/bench_enrich.py --sites 100 --page-kb 2000 --max-bytes 500000 --serial
+"""
+import argparse
+import asyncio
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import lead_agent  # noqa: E402
+from fake_sites import FakeSites  # noqa: E402
+
+
+def enrich_run(urls, cache, concurrency, per_host, max_bytes, timeout):
+    """Enriches one Business per URL and returns (seconds, EnrichStats)"""
+    businesses = [lead_agent.Business(name=f"Business {n}", website=url)
+                  for n, url in enumerate(urls)]
+    start = time.perf_counter()
+    stats = asyncio.run(lead_agent.enrich_businesses(
+        businesses, concurrency=concurrency, per_host=per_host,
+        timeout=timeout, max_bytes=max_bytes, cache=cache))
+    return time.perf_counter() - start, stats
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sites", type=int, default=200,
+                        help="Websites to enrich (default: 200)")
+    parser.add_argument("--latency-ms", type=int, default=100,
+                        help="Fake site response latency (default: 100)")
+    parser.add_argument("--page-kb", type=int, default=20,
+                        help="Home page size (default: 20)")
+    parser.add_argument("--concurrency", type=int, default=lead_agent.ENRICH_CONCURRENCY,
+                        help=f"Connections in total (default: {lead_agent.ENRICH_CONCURRENCY})")
+    parser.add_argument("--per-host", type=int,
+                        help="Connections per host (default: --concurrency)")
+    parser.add_argument("--max-bytes", type=int, default=lead_agent.ENRICH_MAX_BYTES,
+                        help=f"Bytes read per page (default: {lead_agent.ENRICH_MAX_BYTES})")
+    parser.add_argument("--timeout", type=float, default=lead_agent.ENRICH_TIMEOUT,
+                        help=f"Seconds per page (default: {lead_agent.ENRICH_TIMEOUT})")
+    parser.add_argument("--serial", action="store_true",
+                        help="Also run with a single connection")
+    args = parser.parse_args()
+
+    runs = [("pooled", args.concurrency, args.per_host or args.concurrency, True)]
+    if args.serial:
+        runs.insert(0, ("serial", 1, 1, False))
+    with FakeSites(args.sites, args.latency_ms, args.page_kb) as fake_sites, \
+            tempfile.TemporaryDirectory() as directory:
+        for name, concurrency, per_host, with_cached_run in runs:
+            cache = lead_agent.PageCache(directory=f"{directory}/{name}")
+            passes = [("cold", cache)] + ([("cached", cache)] if with_cached_run else [])
+            for label, run_cache in passes:
+                elapsed, stats = enrich_run(fake_sites.urls(), run_cache, concurrency,
+                                            per_host, args.max_bytes, args.timeout)
+                print(f"{name} {label} ({concurrency} connections): "
+                      f"{args.sites / elapsed:.1f} sites/sec")
+                print(f"  {stats.summary()}, {stats.truncated} truncated")
@@ -0,0 +1,110 @@
+"""
+Micro-benchmark for Business detail panel extraction.
+
+Compares the single round trip extractor (lead_agent.extract_business) with
+the previous per-field locator code on saved detail panel HTML fixtures.
+
+Usage:
+    python benchmarks/bench_extraction.py --repeat 50
+"""
+import argparse
+import asyncio
+import statistics
+import sys
+import time
+from dataclasses import asdict
+from pathlib import Path
+
+from playwright.async_api import async_playwright
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from lead_agent import Business, extract_business  # noqa: E402
+
+FIXTURES_DIR = Path(__file__).resolve().parent / "fixtures"
+
+
+async def legacy_extract_business(page):
+    """The per-field locator extraction scrape_business used before the selector table"""
+    name_css_selector = 'h1.DUwDvf.lfPIob'
+    address_xpath = '//button[@data-item-id="address"]//div[contains(@class, "fontBodyMedium")]'
+    website_xpath = '//a[@data-item-id="authority"]//div[contains(@class, "fontBodyMedium")]'
+    phone_number_xpath = '//button[contains(@data-item-id, "phone")]//div[contains(@class, "fontBodyMedium")]'
+    reviews_average_xpath = '//div[@jsaction="pane.reviewChart.moreReviews"]//div[@role="img"]'
+
+    business = Business()
+
+    if await page.locator(name_css_selector).count() > 0:
+        business.name = await page.locator(name_css_selector).inner_text()
+    else:
+        business.name = ""
+
+    for attribute, xpath in (("address", address_xpath),
+                             ("website", website_xpath),
+                             ("phone_number", phone_number_xpath)):
+        value = ""
+        if await page.locator(xpath).count() > 0:
+            elements = await page.locator(xpath).all()
+            if elements:
+                value = await elements[0].inner_text()
+        setattr(business, attribute, value)
+
+    if await page.locator(reviews_average_xpath).count() > 0:
+        reviews_average_text = await page.locator(
+            reviews_average_xpath).get_attribute('aria-label')
+        if reviews_average_text:
+            business.reviews_average = float(
+                reviews_average_text.split()[0].replace(',', '.').strip())
+
+    return business
+
+
+async def time_extractor(page, extractor, repeat):
+    """Returns per-call durations (ms) of extractor on the loaded page"""
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        await extractor(page)
+        durations.append((time.perf_counter() - start) * 1000)
+    return durations
+
+
+async def run(repeat):
+    fixtures = sorted(FIXTURES_DIR.glob("place_*.html"))
+    if not fixtures:
+        print(f"No fixtures found in {FIXTURES_DIR}")
+        return
+
+    async with async_playwright() as p:
+        browser = await p.chromium.launch(headless=True)
+        page = await browser.new_page()
+
+        print(f"{'fixture':<24}{'extractor':<10}{'mean ms':>10}{'p50 ms':>10}{'speedup':>10}")
+        for fixture in fixtures:
+            await page.set_content(fixture.read_text(encoding="utf-8"))
+
+            legacy = await legacy_extract_business(page)
+            current = await extract_business(page)
+            if asdict(legacy) != asdict(current):
+                print(f"{fixture.name}: extractors disagree\n  legacy:  {legacy}\n  current: {current}")
+
+            legacy_ms = await time_extractor(page, legacy_extract_business, repeat)
+            current_ms = await time_extractor(page, extract_business, repeat)
+            speedup = statistics.mean(legacy_ms) / statistics.mean(current_ms)
+
+            print(f"{fixture.name:<24}{'legacy':<10}"
+                  f"{statistics.mean(legacy_ms):>10.2f}{statistics.median(legacy_ms):>10.2f}")
+            print(f"{'':<24}{'evaluate':<10}"
+                  f"{statistics.mean(current_ms):>10.2f}{statistics.median(current_ms):>10.2f}"
+                  f"{speedup:>9.1f}x")
+
+        await browser.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=50,
+                        help="Extractions per fixture and extractor (default: 50)")
+    args = parser.parse_args()
+    asyncio.run(run(args.repeat))
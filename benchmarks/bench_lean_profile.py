@@ -0,0 +1,81 @@
+"""
+Compares a live Google Maps search with and without the lean scraping profile.
+
+Runs scrape_business for the same query once per profile and prints bytes
+transferred, blocked requests, page load time and total wall-clock time.
+Then, per profile, repeats the search --warm-runs times in one pooled browser
+context, the way the app and the worker run searches. Every run opens all of
+its listings, so the later runs show what the warm HTTP cache saves across
+listings and searches.
+
+Usage:
+    python benchmarks/bench_lean_profile.py "cafes in islamabad" --results 10
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault("MEASURE_TRAFFIC", "true")
+
+from lead_agent import BrowserPool, scrape_business  # noqa: E402
+
+
+def print_row(label, business_list, elapsed):
+    stats = business_list.stats
+    page_load = stats.page_load_seconds or 0.0
+    print(f"{label:<10}"
+          f"{business_list.get_row_size():>6}{stats.requests:>10}"
+          f"{stats.blocked_requests:>9}"
+          f"{stats.bytes_transferred / 1_000_000:>8.2f}"
+          f"{page_load:>8.2f}{elapsed:>9.1f}")
+
+
+async def run(query, results, concurrency, warm_runs):
+    header = (f"{'profile':<10}{'rows':>6}{'requests':>10}{'blocked':>9}"
+              f"{'MB':>8}{'load s':>8}{'total s':>9}")
+    print(header)
+    for lean in (False, True):
+        start = time.perf_counter()
+        business_list = await scrape_business(query, results,
+                                              concurrency=concurrency,
+                                              lean=lean, checkpoint=False)
+        print_row("lean" if lean else "full", business_list,
+                  time.perf_counter() - start)
+
+    if warm_runs < 1:
+        return
+    print(f"\nWarm context, {warm_runs} runs per profile")
+    print(header)
+    for lean in (False, True):
+        # One context, so every run reuses the previous runs' HTTP cache
+        pool = BrowserPool(max_contexts=1)
+        try:
+            for run_number in range(1, warm_runs + 1):
+                start = time.perf_counter()
+                business_list = await scrape_business(query, results,
+                                                      concurrency=concurrency,
+                                                      pool=pool, lean=lean,
+                                                      checkpoint=False)
+                print_row(f"{'lean' if lean else 'full'} #{run_number}",
+                          business_list, time.perf_counter() - start)
+        finally:
+            pool.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("query", help="Google Maps search query")
+    parser.add_argument("--results", type=int, default=10,
+                        help="Listings to extract per run (default: 10)")
+    parser.add_argument("--concurrency", type=int, default=4,
+                        help="Parallel listing pages (default: 4)")
+    parser.add_argument("--warm-runs", type=int, default=3,
+                        help="Searches per profile in one warm context, 0 to skip "
+                             "(default: 3)")
+    args = parser.parse_args()
+    asyncio.run(run(args.query, args.results, args.concurrency, args.warm_runs))
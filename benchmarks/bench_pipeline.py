@@ -0,0 +1,169 @@
+"""
+Offline end-to-end benchmark of the scraper and the message dispatcher.
+
+Scrapes a local Maps stand-in (benchmarks/fake_maps.py) with scrape_business
+and sends messages through the DispatchQueue with a fake sender, so runs
+are repeatable and never touch Google Maps or WhatsApp. Reports:
+
+    listings/sec, p50/p95 per-listing extraction latency, Python memory peak
+    (tracemalloc, the browser processes are not included) and messages/min
+
+Use --json to append each run to a JSON lines file and compare runs.
+
+Usage:
+    python benchmarks/bench_pipeline.py --listings 60 --latency-ms 100 --concurrency 4
+    python benchmarks/bench_pipeline.py --messages 100 --send-latency-ms 200 --json runs.jsonl
+    python benchmarks/bench_pipeline.py --listings 400 --processes 4 --messages 0
+"""
+import argparse
+import asyncio
+import datetime
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from fake_maps import FakeMaps  # noqa: E402
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of values, None if there are none"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+async def bench_scrape(lead_agent, args):
+    """Scrapes the fake Maps search once and returns the scraper metrics"""
+    tracemalloc.start()
+    start = time.perf_counter()
+    with lead_agent.tracing("benchmark") as trace:
+        if args.processes > 1:
+            business_list = await lead_agent.sharded_scrape_business(
+                "benchmark listings", args.listings, processes=args.processes,
+                concurrency=args.concurrency, lean=not args.full_profile)
+        else:
+            business_list = await lead_agent.scrape_business(
+                "benchmark listings", args.listings, concurrency=args.concurrency,
+                lean=not args.full_profile, checkpoint=False)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    listing_ms = [span["duration_ms"] for span in trace.spans
+                  if span["span"] == "extract_listing" and span["status"] == "ok"]
+    scroll_ms = sum(span["duration_ms"] for span in trace.spans if span["span"] == "scroll")
+    rows = business_list.get_row_size()
+    return {
+        "rows": rows,
+        "scrape_seconds": round(elapsed, 2),
+        "listings_per_sec": round(rows / elapsed, 2) if elapsed else None,
+        "listing_p50_ms": percentile(listing_ms, 0.5),
+        "listing_p95_ms": percentile(listing_ms, 0.95),
+        "scroll_seconds": round(scroll_ms / 1000, 2),
+        "python_peak_mb": round(peak / 1_000_000, 1),
+    }
+
+
+def bench_send(lead_agent, args):
+    """Sends args.messages messages through a DispatchQueue with a fake sender"""
+
+    class FakeSender(lead_agent.MessageSender):
+        """Sleeps instead of sending and fails a fraction of the messages"""
+
+        name = "fake"
+
+        def send(self, phone_number, message):
+            time.sleep(args.send_latency_ms / 1000)
+            if random.random() < args.send_failure_rate:
+                raise RuntimeError("simulated send failure")
+            return True
+
+    with tempfile.TemporaryDirectory() as directory:
+        queue = lead_agent.DispatchQueue(
+            sender=FakeSender(), db_path=os.path.join(directory, "dispatch.sqlite3"),
+            interval=args.message_interval, burst=max(1, args.messages))
+        numbers = [f"+92300{index:07d}" for index in range(args.messages)]
+        start = time.perf_counter()
+        campaign = queue.enqueue(numbers, "Benchmark message")
+        while True:
+            jobs = queue.jobs([campaign])
+            if all(job["status"] in ("sent", "failed") for job in jobs):
+                break
+            time.sleep(0.05)
+        elapsed = time.perf_counter() - start
+        queue.stop(timeout=5)
+
+    sent = sum(job["status"] == "sent" for job in jobs)
+    return {
+        "messages_sent": sent,
+        "messages_failed": len(jobs) - sent,
+        "send_seconds": round(elapsed, 2),
+        "messages_per_min": round(sent / elapsed * 60, 1) if elapsed else None,
+    }
+
+
+def run(args):
+    fake_maps = FakeMaps(args.listings, args.latency_ms, args.page_size).start()
+    # lead_agent reads MAPS_URL at import time
+    os.environ["MAPS_URL"] = fake_maps.url
+    os.environ.setdefault("TRACE_FILES", "false")
+    import lead_agent
+
+    results = {"timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+               "listings": args.listings, "latency_ms": args.latency_ms,
+               "concurrency": args.concurrency, "processes": args.processes,
+               "lean": not args.full_profile}
+    try:
+        if args.listings:
+            results.update(asyncio.run(bench_scrape(lead_agent, args)))
+            results["http_requests"] = fake_maps.requests
+    finally:
+        fake_maps.stop()
+    if args.messages:
+        results.update(send_latency_ms=args.send_latency_ms,
+                       message_interval=args.message_interval,
+                       **bench_send(lead_agent, args))
+
+    width = max(len(key) for key in results)
+    for key, value in results.items():
+        print(f"{key:<{width}}  {value}")
+    if args.json:
+        with open(args.json, "a", encoding="utf-8") as fp:
+            fp.write(json.dumps(results) + "\n")
+        print(f"Appended results to {args.json}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--listings", type=int, default=40,
+                        help="Listings to scrape, 0 to skip the scraper (default: 40)")
+    parser.add_argument("--latency-ms", type=int, default=50,
+                        help="Fake Maps response latency (default: 50)")
+    parser.add_argument("--page-size", type=int, default=20,
+                        help="Listings revealed per feed scroll (default: 20)")
+    parser.add_argument("--concurrency", type=int, default=4,
+                        help="Parallel listing pages, per process (default: 4)")
+    parser.add_argument("--processes", type=int, default=1,
+                        help="Shard extraction over this many processes (default: 1)")
+    parser.add_argument("--full-profile", action="store_true",
+                        help="Disable the lean scraping profile")
+    parser.add_argument("--messages", type=int, default=50,
+                        help="Messages to send, 0 to skip the sender (default: 50)")
+    parser.add_argument("--send-latency-ms", type=int, default=100,
+                        help="Fake sender time per message (default: 100)")
+    parser.add_argument("--send-failure-rate", type=float, default=0.0,
+                        help="Fraction of sends that fail and are retried (default: 0)")
+    parser.add_argument("--message-interval", type=float, default=0.0,
+                        help="Dispatch queue interval between messages (default: 0)")
+    parser.add_argument("--json", help="Append the results to this JSON lines file")
+    run(parser.parse_args())
@@ -0,0 +1,83 @@
+"""
+Measures the import time of lead_agent.py in fresh interpreters.
+
+Runs `python -X importtime -c "import lead_agent"` several times and prints
+the mean and best wall-clock import time plus the modules with the largest
+cumulative import time in the last run. Optionally imports the modules
+the planning/scraping/messaging paths load on first use, to compare the lazy
+startup with loading everything up front.
+
+Usage:
+    python benchmarks/bench_startup.py --runs 5
+    python benchmarks/bench_startup.py --eager
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# Modules lead_agent only loads when their action runs
+EAGER_MODULES = ("streamlit", "pandas", "playwright.async_api",
+                 "google.generativeai", "pywhatkit")
+
+
+def import_once(eager):
+    """Imports lead_agent in a new interpreter, returns (seconds, importtime lines)"""
+    statement = "import lead_agent"
+    if eager:
+        statement += "".join(
+            f"\ntry:\n    import {module}\n    {module}.__file__  # loads lazy modules\n"
+            f"except Exception:\n    pass"
+            for module in EAGER_MODULES)
+    start = time.perf_counter()
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", statement],
+        cwd=ROOT, capture_output=True, text=True,
+        env={**os.environ, "PYTHONPATH": os.pathsep.join(
+            filter(None, [str(ROOT), os.environ.get("PYTHONPATH")]))})
+    elapsed = time.perf_counter() - start
+    if completed.returncode != 0:
+        sys.exit(f"Import failed:\n{completed.stderr[-2000:]}")
+    lines = [line for line in completed.stderr.splitlines()
+             if line.startswith("import time:") and "|" in line]
+    return elapsed, lines
+
+
+def slowest_modules(lines, count):
+    """Returns (cumulative_us, module) pairs of the top-level imports, slowest first"""
+    modules = []
+    for line in lines[1:] if lines and "cumulative" in lines[0] else lines:
+        _, cumulative, name = line.split("|")
+        if not name.startswith("  "):  # top-level imports only
+            modules.append((int(cumulative.strip()), name.strip()))
+    return sorted(modules, reverse=True)[:count]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5,
+                        help="Fresh interpreters to time (default: 5)")
+    parser.add_argument("--top", type=int, default=10,
+                        help="Slowest imports to list (default: 10)")
+    parser.add_argument("--eager", action="store_true",
+                        help="Also import the lazily loaded dependencies")
+    args = parser.parse_args()
+
+    timings = []
+    for _ in range(args.runs):
+        elapsed, lines = import_once(args.eager)
+        timings.append(elapsed)
+
+    print(f"import lead_agent{' (eager)' if args.eager else ''}: "
+          f"mean {statistics.mean(timings) * 1000:.0f}ms, "
+          f"best {min(timings) * 1000:.0f}ms over {args.runs} runs "
+          f"(includes interpreter start)")
+    print(f"\n{'cumulative ms':>14}  module")
+    for cumulative, name in slowest_modules(lines, args.top):
+        print(f"{cumulative / 1000:>14.1f}  {name}")
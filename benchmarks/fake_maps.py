@@ -0,0 +1,183 @@
+"""
+Local stand-in for Google Maps that serves recorded search and detail HTML.
+
+The search page has the same search box, scrollable result feed and
+end-of-list marker the scraper looks for. Listings are revealed a page at a
+time as the feed is scrolled, and every detail page is one of the saved
+fixtures in benchmarks/fixtures/ with a unique business name. Every response
+is delayed by the configured latency.
+
+Point the scraper at it with MAPS_URL (set it before lead_agent is imported):
+
+    python benchmarks/fake_maps.py --listings 100 --latency-ms 50
+    MAPS_URL=http://127.0.0.1:8765/maps streamlit run lead_agent.py
+"""
+import argparse
+import html
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+FIXTURES_DIR = Path(__file__).resolve().parent / "fixtures"
+
+SEARCH_PAGE = """<!DOCTYPE html>
+<html>
+<head><meta charset="utf-8"><title>Fake Maps</title></head>
+<body>
+<input id="searchboxinput" type="text">
+<div role="feed" style="height: 600px; overflow-y: auto;"></div>
+<script>
+const BASE = "{base}";
+const TOTAL = {total};
+const PAGE_SIZE = {page_size};
+const LATENCY_MS = {latency_ms};
+const feed = document.querySelector('div[role="feed"]');
+let shown = 0;
+let loading = false;
+
+function showMore() {{
+    if (loading || shown >= TOTAL) return;
+    loading = true;
+    setTimeout(() => {{
+        const end = Math.min(shown + PAGE_SIZE, TOTAL);
+        for (; shown < end; shown++) {{
+            const item = document.createElement('div');
+            item.style.height = '120px';
+            const anchor = document.createElement('a');
+            anchor.href = BASE + '/place/listing-' + shown;
+            anchor.textContent = 'Listing ' + shown;
+            item.appendChild(anchor);
+            feed.appendChild(item);
+        }}
+        if (shown >= TOTAL) {{
+            const marker = document.createElement('span');
+            marker.className = 'HlvSq';
+            marker.textContent = "You've reached the end of the list.";
+            feed.appendChild(marker);
+        }}
+        loading = false;
+    }}, LATENCY_MS);
+}}
+
+document.getElementById('searchboxinput').addEventListener('keydown', event => {{
+    if (event.key === 'Enter') showMore();
+}});
+feed.addEventListener('scroll', () => {{
+    if (feed.scrollTop + feed.clientHeight >= feed.scrollHeight - 10) showMore();
+}});
+</script>
+</body>
+</html>
+"""
+
+TITLE_PATTERN = re.compile(r'(<h1 class="DUwDvf[^"]*">)(.*?)(</h1>)', re.S)
+
+
+class FakeMaps:
+    """
+    Threaded HTTP server imitating the Maps pages scrape_business reads.
+
+    Args:
+        listings: Number of results the search feed reveals before its end marker
+        latency_ms: Delay added to every response and to every feed page
+        page_size: Listings revealed per scroll
+        port: Port to listen on (0 picks a free one)
+    """
+
+    def __init__(self, listings=50, latency_ms=0, page_size=20, port=0):
+        self.listings = listings
+        self.latency_ms = latency_ms
+        self.page_size = page_size
+        self.requests = 0
+        self._fixtures = [path.read_text(encoding="utf-8")
+                          for path in sorted(FIXTURES_DIR.glob("place_*.html"))]
+        self._server = ThreadingHTTPServer(("127.0.0.1", port), self._handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        """Value for MAPS_URL"""
+        return f"http://127.0.0.1:{self._server.server_address[1]}/maps"
+
+    def search_page(self):
+        return SEARCH_PAGE.format(base=self.url, total=self.listings,
+                                  page_size=self.page_size,
+                                  latency_ms=self.latency_ms)
+
+    def detail_page(self, listing):
+        """A saved detail panel fixture, renamed so every listing has its own title"""
+        index = int(listing) if listing.isdigit() else 0
+        fixture = self._fixtures[index % len(self._fixtures)]
+        return TITLE_PATTERN.sub(
+            lambda match: f"{match[1]}{match[2]} #{html.escape(listing)}{match[3]}",
+            fixture, count=1)
+
+    def _handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                fake.requests += 1
+                time.sleep(fake.latency_ms / 1000)
+                path = self.path.split("?")[0].rstrip("/")
+                if path == "/maps":
+                    body = fake.search_page()
+                elif path.startswith("/maps/place/listing-"):
+                    body = fake.detail_page(path.rsplit("-", 1)[1])
+                else:
+                    self.send_error(404)
+                    return
+                data = body.encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/html; charset=utf-8")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def serve_forever(self):
+        """Serves in the calling thread until stop() is called"""
+        self._server.serve_forever()
+
+    def start(self):
+        """Serves in a daemon thread and returns self"""
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--listings", type=int, default=50,
+                        help="Results in the search feed (default: 50)")
+    parser.add_argument("--latency-ms", type=int, default=0,
+                        help="Delay added to every response (default: 0)")
+    parser.add_argument("--page-size", type=int, default=20,
+                        help="Listings revealed per scroll (default: 20)")
+    parser.add_argument("--port", type=int, default=8765,
+                        help="Port to listen on (default: 8765)")
+    args = parser.parse_args()
+    fake_maps = FakeMaps(args.listings, args.latency_ms, args.page_size, args.port)
+    print(f"Serving {args.listings} listings, set MAPS_URL={fake_maps.url}")
+    try:
+        fake_maps.serve_forever()
+    except KeyboardInterrupt:
+        fake_maps.stop()
@@ -0,0 +1,158 @@
+"""
+Local stand-in for business websites, for testing and benchmarking the
+website enrichment stage without touching real sites.
+
+Serves a home page per site at /site-<n>/ and a contact page at
+/site-<n>/contact, with a delay on every response. Sites vary the way real
+ones do:
+
+    n % 3 == 0   no email on the home page, only on the linked contact page
+    n % 10 == 9  the home page fails with HTTP 500
+    otherwise    email and social links in the home page footer
+
+Every home page is padded to the configured size.
+
+Usage:
+    python benchmarks/fake_sites.py --sites 200 --latency-ms 100
+"""
+import argparse
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+HOME_PAGE = """<!DOCTYPE html>
+<html>
+<head><meta charset="utf-8"><title>Business {n}</title></head>
+<body>
+<h1>Business {n}</h1>
+<p>{filler}</p>
+<footer>
+{email}
+<a href="https://www.facebook.com/business{n}/">Facebook</a>
+<a href="https://instagram.com/business{n}">Instagram</a>
+<a href="https://www.facebook.com/sharer/sharer.php?u=x">Share</a>
+<a href="contact">Contact us</a>
+</footer>
+</body>
+</html>
+"""
+
+CONTACT_PAGE = """<!DOCTYPE html>
+<html>
+<head><meta charset="utf-8"><title>Contact</title></head>
+<body><a href="mailto:hello@business{n}.example">hello&#64;business{n}.example</a></body>
+</html>
+"""
+
+
+class FakeSites:
+    """
+    Threaded HTTP server imitating the websites of scraped businesses.
+
+    Args:
+        sites: Number of sites served
+        latency_ms: Delay added to every response
+        page_kb: Size the home pages are padded to
+        port: Port to listen on (0 picks a free one)
+    """
+
+    def __init__(self, sites=100, latency_ms=0, page_kb=20, port=0):
+        self.sites = sites
+        self.latency_ms = latency_ms
+        self.page_kb = page_kb
+        self.requests = 0
+        self._server = ThreadingHTTPServer(("127.0.0.1", port), self._handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    def url_for(self, n):
+        """Website of site n"""
+        return f"http://127.0.0.1:{self._server.server_address[1]}/site-{n}/"
+
+    def urls(self):
+        return [self.url_for(n) for n in range(self.sites)]
+
+    def home_page(self, n):
+        email = "" if n % 3 == 0 else f'<a href="mailto:info@business{n}.example">Email us</a>'
+        page = HOME_PAGE.format(n=n, email=email, filler="{filler}")
+        filler = "Lorem ipsum dolor sit amet. " * max(
+            0, (self.page_kb * 1024 - len(page)) // 28)
+        return page.format(filler=filler)
+
+    def _handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                fake.requests += 1
+                time.sleep(fake.latency_ms / 1000)
+                parts = self.path.split("?")[0].strip("/").split("/")
+                site = parts[0].removeprefix("site-")
+                if not site.isdigit() or int(site) >= fake.sites or len(parts) > 2:
+                    self.send_error(404)
+                    return
+                n = int(site)
+                if len(parts) == 2 and parts[1] == "contact":
+                    body = CONTACT_PAGE.format(n=n)
+                elif len(parts) == 1:
+                    if n % 10 == 9:
+                        self.send_error(500)
+                        return
+                    body = fake.home_page(n)
+                else:
+                    self.send_error(404)
+                    return
+                data = body.encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/html; charset=utf-8")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                try:
+                    self.wfile.write(data)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass  # the client stopped reading, e.g. at its size cap
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def serve_forever(self):
+        """Serves in the calling thread until stop() is called"""
+        self._server.serve_forever()
+
+    def start(self):
+        """Serves in a daemon thread and returns self"""
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sites", type=int, default=100,
+                        help="Sites served (default: 100)")
+    parser.add_argument("--latency-ms", type=int, default=0,
+                        help="Delay added to every response (default: 0)")
+    parser.add_argument("--page-kb", type=int, default=20,
+                        help="Home page size (default: 20)")
+    parser.add_argument("--port", type=int, default=8766,
+                        help="Port to listen on (default: 8766)")
+    args = parser.parse_args()
+    fake_sites = FakeSites(args.sites, args.latency_ms, args.page_kb, args.port)
+    print(f"Serving {args.sites} sites, e.g. {fake_sites.url_for(0)}")
+    try:
+        fake_sites.serve_forever()
+    except KeyboardInterrupt:
+        fake_sites.stop()
@@ -1,28 +1,95 @@
-import streamlit as st
-import pandas as pd
+import time
+_import_started = time.perf_counter()
+
 import asyncio
-import playwright.async_api
-from playwright.async_api import async_playwright
 import os
 import logging
-from dataclasses import dataclass, asdict, field
+from dataclasses import dataclass, asdict, field, fields
 import datetime
-import time
-import google.generativeai as genai
+import threading
+import contextlib
+import hashlib
+import sqlite3
+import concurrent.futures
+import multiprocessing
+import collections
+import copy
+import re
+import sys
+import argparse
+import urllib.parse
+import html
+import csv
+import importlib.util
+import types
+import contextvars
+import uuid
+import functools
 from dotenv import load_dotenv
 import json
-import pywhatkit
+
+# True when the module is executed by `streamlit run` (Streamlit is already
+# loaded then). The CLI, benchmarks and workers never import Streamlit.
+UNDER_STREAMLIT = "streamlit" in sys.modules
+
+
+class MissingModule(types.ModuleType):
+    """Stands in for a lazily imported module that is not installed"""
+
+    def __getattr__(self, attribute):
+        if attribute.startswith("__"):  # introspection, e.g. repr() or copy
+            raise AttributeError(attribute)
+        raise ModuleNotFoundError(f"No module named '{self.__name__}'", name=self.__name__)
+
+
+def lazy_import(name):
+    """
+    Returns module name, deferring the actual import until an attribute is
+    first accessed (importlib.util.LazyLoader). Keeps heavy dependencies off
+    the import path of code that never touches them. A module that is not
+    installed raises ModuleNotFoundError on first use rather than here, so
+    e.g. the CLI runs without Streamlit.
+    """
+    if name in sys.modules:
+        return sys.modules[name]
+    try:
+        spec = importlib.util.find_spec(name)
+    except ModuleNotFoundError:  # a parent package is missing
+        spec = None
+    if spec is None:
+        return MissingModule(name)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
+
+
+st = lazy_import("streamlit")
+pd = lazy_import("pandas")
+async_api = lazy_import("playwright.async_api")
+# google.generativeai and pywhatkit are imported where they are used, see
+# get_model() and pywhatkit_send()
+
+
+def process_resource(factory):
+    """
+    Caches the result of a zero-argument factory for the whole process.
+
+    Under Streamlit this is st.cache_resource, which survives script reruns
+    and is shared by all sessions; elsewhere it is functools.cache, so CLI
+    and worker processes do not need Streamlit at all.
+    """
+    if UNDER_STREAMLIT:
+        return st.cache_resource(factory)
+    return functools.cache(factory)
+
 
 # Load environment variables
 load_dotenv()
 API_KEY = os.getenv('GOOGLE_API_KEY')
 
-if not API_KEY:
-    st.error("Error: GOOGLE_API_KEY not found in environment variables.")
-    st.stop()
-
-genai.configure(api_key=API_KEY)
-
 # --- Define Tool Schemas (Functions the LLM can 'call') ---
 search_Maps_func = {
     "name": "search_Maps",
@@ -70,14 +137,25 @@ prepare_whatsapp_message_func = {
     },
 }
 
-# Initialize the LLM Model with the corrected Tools
-model = genai.GenerativeModel(
-    model_name="gemini-2.5-flash",
-    tools=[search_Maps_func, prepare_whatsapp_message_func] # Pass the corrected dictionaries
-)
+@process_resource
+def get_model():
+    """
+    Returns the Gemini model with the search_Maps / prepare_whatsapp_message
+    tools, configuring the client on first use
+    """
+    if not API_KEY:
+        raise RuntimeError("GOOGLE_API_KEY not found in environment variables.")
+    import google.generativeai as genai
+    genai.configure(api_key=API_KEY)
+    return genai.GenerativeModel(
+        model_name="gemini-2.5-flash",
+        tools=[search_Maps_func, prepare_whatsapp_message_func] # Pass the corrected dictionaries
+    )
 
 
-asyncio.set_event_loop_policy(asyncio.WindowsProactorEventLoopPolicy())
+if sys.platform == "win32":
+    # Playwright launches browsers as subprocesses, which needs the Proactor loop
+    asyncio.set_event_loop_policy(asyncio.WindowsProactorEventLoopPolicy())
 
 # # Ensure necessary system packages are installed
 # os.system(
@@ -92,15 +170,7 @@ asyncio.set_event_loop_policy(asyncio.WindowsProactorEventLoopPolicy())
 
 
 # Ensure Playwright browsers are installed
-async def install_playwright_browsers():
-    from playwright.__main__ import main as playwright_main
-    await asyncio.create_task(playwright_main(['install']))
-
-
 # asyncio.run(install_playwright_browsers())
-
-
-# Ensuring Playwright browsers are installed
 async def install_playwright_browsers():
     from playwright.__main__ import main as playwright_main
     await asyncio.create_task(playwright_main(['install']))
@@ -111,7 +181,248 @@ logging.basicConfig(level=logging.INFO,
                     format='%(asctime)s - %(levelname)s - %(message)s')
 
 
-@dataclass
+# Directory for the JSONL timing traces, next to the exported results
+TRACE_DIR = os.getenv('TRACE_DIR', 'output')
+# Write a JSONL trace file for every request
+TRACE_FILES = os.getenv('TRACE_FILES', 'true').lower() == 'true'
+
+_current_trace = contextvars.ContextVar("current_trace", default=None)
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+
+class Trace:
+    """
+    Span timings of one request (a search, a batch, a campaign).
+
+    Spans are recorded with span() by whatever code runs while the trace is
+    current, including tasks and threads started from it (asyncio tasks,
+    asyncio.to_thread and BrowserPool.run all carry the context along). Each
+    span becomes one line of the trace's JSONL file.
+    """
+
+    def __init__(self, name, **attrs):
+        self.id = uuid.uuid4().hex[:12]
+        self.name = name
+        self.attrs = attrs
+        self.started_at = time.time()
+        self._start = time.perf_counter()
+        self.spans = []
+        self._saved = 0
+        self._lock = threading.Lock()
+        timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+        self.path = f"{TRACE_DIR}/trace_{timestamp}_{self.id}.jsonl"
+
+    def record(self, span):
+        with self._lock:
+            self.spans.append(span)
+
+    def elapsed(self):
+        """Seconds since the trace started"""
+        return time.perf_counter() - self._start
+
+    def save(self):
+        """Appends the spans recorded since the last save to the JSONL file and returns its path"""
+        if not TRACE_FILES:
+            return None
+        with self._lock:
+            new_spans, self._saved = self.spans[self._saved:], len(self.spans)
+        if not new_spans:
+            return self.path
+        try:
+            os.makedirs(TRACE_DIR, exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as fp:
+                for span in new_spans:
+                    fp.write(json.dumps({"trace": self.id, "request": self.name,
+                                         **span}, default=str) + "\n")
+        except OSError as e:
+            logging.error(f"Failed to write trace {self.path}: {e}")
+        return self.path
+
+    def summary(self):
+        """Returns a DataFrame with count, total and percentile durations per span name"""
+        with self._lock:
+            spans = list(self.spans)
+        if not spans:
+            return pd.DataFrame(columns=["span", "count", "total_s", "mean_ms",
+                                         "p50_ms", "p95_ms", "max_ms", "errors"])
+        frame = pd.DataFrame(spans)
+        grouped = frame.groupby("span", sort=False)
+        return pd.DataFrame({
+            "count": grouped.size(),
+            "total_s": grouped["duration_ms"].sum() / 1000,
+            "mean_ms": grouped["duration_ms"].mean(),
+            "p50_ms": grouped["duration_ms"].quantile(0.5),
+            "p95_ms": grouped["duration_ms"].quantile(0.95),
+            "max_ms": grouped["duration_ms"].max(),
+            "errors": grouped["status"].apply(lambda status: int((status == "error").sum())),
+        }).round(1).reset_index()
+
+
+def current_trace():
+    """Returns the Trace of the running request, or None"""
+    return _current_trace.get()
+
+
+def start_trace(name, **attrs):
+    """
+    Starts a Trace and makes it current for the running task (and everything
+    it starts) until the task ends. Prefer tracing() where a block fits.
+    """
+    trace = Trace(name, **attrs)
+    _current_trace.set(trace)
+    return trace
+
+
+@contextlib.contextmanager
+def tracing(name, **attrs):
+    """Makes a new Trace current inside the block and saves it on exit"""
+    trace = Trace(name, **attrs)
+    token = _current_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        _current_trace.reset(token)
+        trace.save()
+
+
+@contextlib.contextmanager
+def span(name, trace=None, **attrs):
+    """
+    Times the block as a span of trace (default: the current trace).
+
+    Yields a dict of span attributes the block may add to; an exception
+    leaving the block marks the span as an error. Without a trace this does
+    nothing beyond yielding the dict.
+    """
+    trace = trace or _current_trace.get()
+    if trace is None:
+        yield attrs
+        return
+    span_id = uuid.uuid4().hex[:8]
+    parent = _current_span.get()
+    token = _current_span.set(span_id)
+    started_at = time.time()
+    start = time.perf_counter()
+    status = "ok"
+    try:
+        yield attrs
+    except BaseException as e:
+        status = "cancelled" if isinstance(e, asyncio.CancelledError) else "error"
+        attrs.setdefault("error", f"{type(e).__name__}: {e}")
+        raise
+    finally:
+        _current_span.reset(token)
+        if "error" in attrs and status == "ok":
+            status = "error"
+        trace.record({"span": name, "id": span_id, "parent": parent,
+                      "start": started_at,
+                      "duration_ms": round((time.perf_counter() - start) * 1000, 3),
+                      "status": status, **attrs})
+
+
+# Country code for phone numbers written in national format, like
+# "0300 1234567" (digits only, e.g. 92). Without it such numbers are invalid.
+DEFAULT_COUNTRY_CODE = os.getenv('DEFAULT_COUNTRY_CODE', '').strip().lstrip('+')
+
+# National number prefixes of mobile lines, by country code. Numbers of these
+# countries with any other prefix look like landlines, which are not on
+# WhatsApp. Countries not listed here (e.g. +1, where mobile and fixed numbers
+# share area codes) are never flagged.
+MOBILE_PREFIXES = {
+    "92": ("3",),                 # Pakistan
+    "91": ("6", "7", "8", "9"),   # India
+    "880": ("1",),                # Bangladesh
+    "971": ("5",),                # United Arab Emirates
+    "966": ("5",),                # Saudi Arabia
+    "44": ("7",),                 # United Kingdom
+    "49": ("15", "16", "17"),     # Germany
+    "33": ("6", "7"),             # France
+    "34": ("6", "7"),             # Spain
+    "39": ("3",),                 # Italy
+    "61": ("4",),                 # Australia
+    "234": ("70", "80", "81", "90", "91"),  # Nigeria
+}
+
+# Values of the phone_status column, see normalize_phone_numbers
+PHONE_VALID = "valid"
+PHONE_INVALID = "invalid"
+PHONE_LANDLINE = "landline"
+PHONE_DUPLICATE = "duplicate"
+
+
+def normalize_phone_digits(phone_number, default_country_code=DEFAULT_COUNTRY_CODE):
+    """
+    Reduces a phone number to the digits of its E.164 form: a leading + or 00
+    marks an international number, anything else is national and gets
+    default_country_code in place of its trunk 0. Single-value counterpart of
+    normalize_phone_numbers, used for lead keys.
+    """
+    text = (phone_number or "").strip()
+    digits = "".join(ch for ch in text if ch.isdigit())
+    if text.startswith("+"):
+        return digits
+    if digits.startswith("00"):
+        return digits[2:]
+    if digits and default_country_code:
+        return default_country_code + (digits[1:] if digits.startswith("0") else digits)
+    return digits
+
+
+def normalize_phone_numbers(phone_numbers, default_country_code=DEFAULT_COUNTRY_CODE):
+    """
+    Normalizes a column of phone numbers to E.164 in one vectorized pass.
+
+    Args:
+        phone_numbers: Iterable of phone numbers as shown on Maps, e.g.
+            "+1 212-367-7590" or "051 1234567" (None and "" allowed)
+        default_country_code: Country code for numbers in national format
+
+    Returns:
+        pd.DataFrame: Same length and order as the input, with columns
+        phone_e164 ("+<digits>", "" if invalid) and phone_status, one of
+        valid, invalid, landline or duplicate (a repeat of an earlier row)
+    """
+    raw = pd.Series(list(phone_numbers), dtype="object").fillna("").astype(str).str.strip()
+    digits = raw.str.replace(r"\D", "", regex=True)
+    plus = raw.str.startswith("+")
+    double_zero = ~plus & digits.str.startswith("00")
+    national = ~plus & ~double_zero
+
+    e164 = digits.copy()
+    e164[double_zero] = digits[double_zero].str[2:]
+    if default_country_code:
+        e164[national] = default_country_code + digits[national].str.replace(r"^0", "", regex=True)
+
+    valid = (e164.str.len().between(8, 15) & ~e164.str.startswith("0")
+             & (plus | double_zero | bool(default_country_code)))
+    status = pd.Series(PHONE_VALID, index=raw.index).where(valid, PHONE_INVALID)
+
+    # Longest country codes first, so each number is checked against one entry
+    matched = pd.Series(False, index=raw.index)
+    for country_code in sorted(MOBILE_PREFIXES, key=len, reverse=True):
+        in_country = valid & ~matched & e164.str.startswith(country_code)
+        national_number = e164[in_country].str[len(country_code):]
+        landline = ~national_number.str.startswith(MOBILE_PREFIXES[country_code])
+        status[landline[landline].index] = PHONE_LANDLINE
+        matched |= in_country
+
+    status[valid & e164.duplicated()] = PHONE_DUPLICATE
+    return pd.DataFrame({"phone_e164": ("+" + e164).where(valid, ""),
+                         "phone_status": status})
+
+
+def normalize_text(text):
+    """Lowercases text and collapses punctuation and whitespace to single spaces"""
+    return " ".join(re.sub(r"[^\w]+", " ", (text or "").lower()).split())
+
+
+def lead_fingerprint(name, address):
+    """Short stable hash of the normalized name and address of a business"""
+    key = f"{normalize_text(name)}|{normalize_text(address)}"
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()[:16]
+
+
+@dataclass(slots=True)
 class Business:
     """Holds business data"""
     name: str = None
@@ -120,448 +431,3667 @@ class Business:
     phone_number: str = None
     # reviews_count: int = None
     reviews_average: float = None
+    place_url: str = None
+    phone_e164: str = None  # set by BusinessList.normalize_phones
+    phone_status: str = None
+    emails: str = None  # set by BusinessList.enrich_websites, "; " separated
+    social_links: str = None
+
+    def lead_key(self):
+        """
+        Identity of the lead behind this row: normalized phone number plus a
+        name/address fingerprint. Ratings, websites and phone formatting do
+        not make the same business a different lead.
+        """
+        return f"{normalize_phone_digits(self.phone_number)}|{lead_fingerprint(self.name, self.address)}"
 
     def __eq__(self, other):
         if not isinstance(other, Business):
             return NotImplemented
-        return (self.name, self.address, self.website, self.phone_number,
-                self.reviews_average) == \
-               (other.name, other.address, other.website, other.phone_number,
-                 other.reviews_average)
+        return self.lead_key() == other.lead_key()
 
     def __hash__(self):
-        return hash((self.name, self.address, self.website, self.phone_number,
-                     self.reviews_average))
+        return hash(self.lead_key())
+
+
+@dataclass
+class ScrapeStats:
+    """Traffic and timing figures collected while scraping one search"""
+    lean: bool = False
+    requests: int = 0
+    blocked_requests: int = 0
+    bytes_transferred: int = 0
+    page_load_seconds: float = None
+    listings_found: int = 0
+    cached_rows: int = 0
+    complete: bool = False
+    reached_end: bool = False  # the feed showed its end-of-list marker
+    scroll_iterations: int = 0
+    scroll_seconds: float = 0.0
+
+    def summary(self):
+        """Returns a one-line human readable summary"""
+        page_load = (f"{self.page_load_seconds:.2f}s"
+                     if self.page_load_seconds is not None else "n/a")
+        transferred = (f"{self.bytes_transferred / 1_000_000:.2f} MB transferred, "
+                       if MEASURE_TRAFFIC else "")
+        return (f"lean profile {'on' if self.lean else 'off'}: "
+                f"{self.requests} requests, {self.blocked_requests} blocked, "
+                f"{transferred}page load {page_load}, "
+                f"{self.scroll_iterations} scrolls in {self.scroll_seconds:.1f}s")
+
+
+# Column order of exported files, one column per Business field
+BUSINESS_COLUMNS = [business_field.name for business_field in fields(Business)]
+
+# Excel writer used by save_to_excel; xlsxwriter is much faster than
+# openpyxl on large sheets and is used when it is installed
+EXCEL_ENGINE = os.getenv(
+    'EXCEL_ENGINE',
+    'xlsxwriter' if importlib.util.find_spec('xlsxwriter') else 'openpyxl')
 
 
 @dataclass
 class BusinessList:
-    """Holds list of Business objects, and saves to both Excel and CSV"""
+    """
+    Holds list of Business objects, and saves to Excel, CSV and Parquet.
+
+    Rows are mirrored into per-field column arrays as they are added, and the
+    DataFrame built from them is cached until more rows arrive, so repeated
+    dataframe() calls (live table, display, export) do not rebuild it.
+    Businesses should not be edited after they were added.
+    """
     business_list: list[Business] = field(default_factory=list)
+    stats: ScrapeStats = field(default_factory=ScrapeStats)
     save_at = 'output'
+    _columns: dict = field(default=None, init=False, repr=False, compare=False)
+    _synced_rows: list = field(default=None, init=False, repr=False, compare=False)
+    _frame: 'pd.DataFrame' = field(default=None, init=False, repr=False, compare=False)
+    _appended: dict = field(default_factory=dict, init=False, repr=False, compare=False)
+
+    def append(self, business):
+        """Adds one Business"""
+        self.business_list.append(business)
+
+    def extend(self, businesses):
+        """Adds several Business objects"""
+        self.business_list.extend(businesses)
+
+    def _sync_columns(self):
+        """Extends the column arrays with the rows added since the last call"""
+        synced = len(self._columns[BUSINESS_COLUMNS[0]]) if self._columns else 0
+        if self._synced_rows is not self.business_list or synced > len(self.business_list):
+            # business_list was replaced or shrunk, start over
+            self._columns = {name: [] for name in BUSINESS_COLUMNS}
+            self._synced_rows = self.business_list
+            self._frame = None
+            synced = 0
+        new_rows = self.business_list[synced:]
+        if new_rows:
+            for name, column in self._columns.items():
+                column.extend([getattr(business, name) for business in new_rows])
+            self._frame = None
+        return self._columns
+
+    def leading_columns(self):
+        """Extra columns placed before the Business fields, as name -> list of row values"""
+        return {}
+
+    def column_names(self):
+        """Returns the exported column names in order"""
+        return [*self.leading_columns(), *BUSINESS_COLUMNS]
+
+    def iter_rows(self, start=0):
+        """Yields exported rows as tuples, starting at row index start"""
+        columns = [*self.leading_columns().values(), *self._sync_columns().values()]
+        return zip(*(column[start:] for column in columns))
 
     def dataframe(self):
-        """Transform business_list to pandas DataFrame"""
-        return pd.json_normalize(
-            (asdict(business) for business in self.business_list), sep="_")
+        """Transform business_list to pandas DataFrame (cached, treat it as read-only)"""
+        columns = self._sync_columns()
+        if self._frame is None:
+            self._frame = pd.DataFrame({**self.leading_columns(), **columns},
+                                       columns=self.column_names())
+        return self._frame
 
-    def save_to_excel(self, filename):
-        """Saves pandas DataFrame to Excel (xlsx) file and returns file path"""
+    def _output_path(self, filename, extension):
+        """Returns the output file path, creating the output directory if needed"""
         if not os.path.exists(self.save_at):
             os.makedirs(self.save_at)
-        file_path = f"{self.save_at}/{filename}.xlsx"
+        return f"{self.save_at}/{filename}.{extension}"
+
+    def save_to_excel(self, filename):
+        """Saves pandas DataFrame to Excel (xlsx) file and returns file path"""
+        file_path = self._output_path(filename, "xlsx")
         try:
-            self.dataframe().to_excel(file_path, index=False)
+            with span("export", format="xlsx", rows=self.get_row_size()):
+                self.dataframe().to_excel(file_path, index=False, engine=EXCEL_ENGINE)
             logging.info(f"Saved data to {file_path}")
             return file_path  # Return the file path after saving
         except Exception as e:
             logging.error(f"Failed to save data to Excel: {e}")
             return None
 
-    def save_to_csv(self, filename):
-        """Saves pandas DataFrame to CSV file"""
-        if not os.path.exists(self.save_at):
-            os.makedirs(self.save_at)
-        file_path = f"{self.save_at}/{filename}.csv"
+    def save_to_csv(self, filename, append=False):
+        """
+        Streams the rows to a CSV file and returns the file path.
+
+        Args:
+            filename: File name without extension, inside save_at
+            append: Append instead of rewriting the file. Only rows not yet
+                written to this file by this BusinessList are appended, and
+                the header is only written if the file is new, so a long run
+                can call this after every batch of rows.
+
+        Returns:
+            The file path, or None if saving failed
+        """
+        file_path = self._output_path(filename, "csv")
+        start = self._appended.get(file_path, 0) if append else 0
+        write_header = not append or not os.path.exists(file_path)
         try:
-            self.dataframe().to_csv(file_path, index=False)
+            with span("export", format="csv", rows=self.get_row_size() - start), \
+                    open(file_path, "a" if append else "w", newline="", encoding="utf-8") as fp:
+                writer = csv.writer(fp)
+                if write_header:
+                    writer.writerow(self.column_names())
+                writer.writerows(self.iter_rows(start))
+            self._appended[file_path] = self.get_row_size()
             logging.info(f"Saved data to {file_path}")
+            return file_path
         except Exception as e:
             logging.error(f"Failed to save data to CSV: {e}")
+            return None
+
+    def save_to_parquet(self, filename):
+        """Saves pandas DataFrame to Parquet file and returns file path (needs pyarrow)"""
+        file_path = self._output_path(filename, "parquet")
+        try:
+            with span("export", format="parquet", rows=self.get_row_size()):
+                self.dataframe().to_parquet(file_path, index=False)
+            logging.info(f"Saved data to {file_path}")
+            return file_path
+        except ImportError as e:
+            logging.error(f"Parquet export needs pyarrow (pip install pyarrow): {e}")
+            return None
+        except Exception as e:
+            logging.error(f"Failed to save data to Parquet: {e}")
+            return None
+
+    def normalize_phones(self, default_country_code=DEFAULT_COUNTRY_CODE):
+        """
+        Sets phone_e164 and phone_status of every row in one vectorized pass
+        (see normalize_phone_numbers) and returns the phone_status counts.
+        """
+        normalized = normalize_phone_numbers(
+            (business.phone_number for business in self.business_list),
+            default_country_code)
+        for business, e164, status in zip(self.business_list,
+                                          normalized["phone_e164"],
+                                          normalized["phone_status"]):
+            business.phone_e164 = e164
+            business.phone_status = status
+        self._synced_rows = None  # rows were edited, rebuild the columns
+        return normalized["phone_status"].value_counts().to_dict()
+
+    async def enrich_websites(self, **enrich_kwargs):
+        """
+        Fills in emails and social_links of every row from its website (see
+        enrich_businesses) and returns the EnrichStats.
+        """
+        stats = await enrich_businesses(self.business_list, **enrich_kwargs)
+        self._synced_rows = None  # rows were edited, rebuild the columns
+        return stats
+
+    def sendable_phone_numbers(self, limit=None):
+        """Returns the E.164 numbers among the first limit rows that can be messaged"""
+        if any(business.phone_status is None for business in self.business_list):
+            self.normalize_phones()
+        return [business.phone_e164 for business in self.business_list[:limit]
+                if business.phone_status == PHONE_VALID]
 
     def get_row_size(self):
         """Returns the number of rows in the DataFrame"""
         return len(self.business_list)
 
 
-async def scrape_business(search_term, total):
-    async with async_playwright() as p:
-        browser = await p.chromium.launch(headless=True)
-        page = await browser.new_page()
+# Number of listing detail pages extracted concurrently per search
+SCRAPE_CONCURRENCY = int(os.getenv('SCRAPE_CONCURRENCY', 4))
+
+# Upper bound (ms) for each event-driven wait while scraping
+WAIT_TIMEOUT_MS = int(os.getenv('WAIT_TIMEOUT_MS', 15000))
+# Upper bound (ms) for new listings to appear after a scroll
+SCROLL_WAIT_TIMEOUT_MS = int(os.getenv('SCROLL_WAIT_TIMEOUT_MS', 5000))
+
+# Drop images, map tiles, media, fonts and analytics while scraping (the
+# "lean" profile). Only the side panel text is read, so none of it is needed.
+LEAN_PROFILE = os.getenv('LEAN_PROFILE', 'true').lower() == 'true'
+# URL substrings the lean profile blocks. They are matched by Chromium itself
+# (see open_page), so requests that are let through still use the HTTP cache.
+LEAN_BLOCKED_URL_PATTERNS = (
+    # map tiles, satellite imagery and Street View
+    "/maps/vt", "/kh/v=", "khms", "streetviewpixels",
+    # place photos and icons
+    "googleusercontent.com", "ggpht.com", ".png", ".jpg", ".jpeg", ".gif",
+    ".webp", ".svg", ".ico",
+    # fonts and media
+    "fonts.gstatic.com", "fonts.googleapis.com", ".woff", ".ttf", ".mp4", ".webm",
+    # analytics
+    "/maps/preview/log", "/gen_204", "google-analytics.com",
+    "googletagmanager.com", "doubleclick.net",
+)
+# Count the bytes of every response (ScrapeStats.bytes_transferred). Costs a
+# round trip to the browser per request, so only the benchmarks turn it on.
+MEASURE_TRAFFIC = os.getenv('MEASURE_TRAFFIC', 'false').lower() == 'true'
+
+# Extra scroll attempts after the feed stops growing before giving up
+SCROLL_STALL_RETRIES = int(os.getenv('SCROLL_STALL_RETRIES', 2))
+
+# Google Maps base URL; the offline benchmarks point it at a local stand-in
+MAPS_URL = os.getenv('MAPS_URL', 'https://www.google.com/maps').rstrip('/')
+
+PLACE_LINK_XPATH = f'//a[contains(@href, "{MAPS_URL}/place")]'
+PLACE_LINK_CSS = f'a[href^="{MAPS_URL}/place"]'
+NAME_CSS_SELECTOR = 'h1.DUwDvf'
+FEED_CSS = 'div[role="feed"]'
+# "You've reached the end of the list." at the bottom of the result feed
+END_OF_LIST_CSS = 'span.HlvSq'
+
+SCROLL_FEED_JS = """(feedSelector) => {
+    const feed = document.querySelector(feedSelector);
+    if (!feed) return false;
+    feed.scrollTop = feed.scrollHeight;
+    return true;
+}"""
+
+FEED_GROWN_JS = """([selector, count, endSelector]) =>
+    document.querySelectorAll(selector).length > count
+        || document.querySelector(endSelector) !== null"""
+
+COLLECT_PLACE_LINKS_JS = """([selector, start, endSelector]) => ({
+    hrefs: Array.from(document.querySelectorAll(selector)).slice(start)
+        .map(anchor => anchor.getAttribute('href')),
+    end: document.querySelector(endSelector) !== null,
+})"""
+
+
+class WaitTimer:
+    """Runs readiness waits and records how long each one actually took"""
 
+    def __init__(self):
+        self.waited = 0.0
+        self.fixed = 0.0
+        self.count = 0
+
+    async def wait(self, label, awaitable, fixed_ms):
+        """
+        Awaits a readiness condition and logs its duration.
+
+        Args:
+            label: Short description of the condition, used in logs
+            awaitable: The Playwright wait to run
+            fixed_ms: The fixed sleep this wait replaces, for comparison
+
+        Returns:
+            The result of the awaitable
+        """
+        start = time.perf_counter()
         try:
-            await page.goto("https://www.google.com/maps", timeout=60000)
-            await page.wait_for_timeout(5000)
+            return await awaitable
+        finally:
+            elapsed = time.perf_counter() - start
+            self.waited += elapsed
+            self.fixed += fixed_ms / 1000
+            self.count += 1
+            logging.info(
+                f"Waited {elapsed:.2f}s for {label} (fixed sleep: {fixed_ms / 1000:.0f}s)")
 
-            await page.fill('//input[@id="searchboxinput"]', search_term)
-            await page.wait_for_timeout(3000)
+    def summary(self):
+        """Returns a one-line summary comparing actual waits to fixed sleeps"""
+        return (f"{self.count} waits took {self.waited:.1f}s, "
+                f"fixed sleeps would have taken {self.fixed:.1f}s")
 
-            await page.keyboard.press("Enter")
-            await page.wait_for_timeout(5000)
 
-            await page.hover(
-                '//a[contains(@href, "https://www.google.com/maps/place")]')
+# Declarative selectors for the Business detail panel. Each entry gives either a
+# "css" or an "xpath" selector and optionally the "attribute" to read instead
+# of the element text. The first matching element wins.
+BUSINESS_FIELD_SELECTORS = {
+    "name": {"css": "h1.DUwDvf.lfPIob"},
+    "address": {"xpath": '//button[@data-item-id="address"]//div[contains(@class, "fontBodyMedium")]'},
+    "website": {"xpath": '//a[@data-item-id="authority"]//div[contains(@class, "fontBodyMedium")]'},
+    "phone_number": {"xpath": '//button[contains(@data-item-id, "phone")]//div[contains(@class, "fontBodyMedium")]'},
+    # "reviews_count": {"xpath": '//button[@jsaction="pane.reviewChart.moreReviews"]//span'},
+    "reviews_average": {"xpath": '//div[@jsaction="pane.reviewChart.moreReviews"]//div[@role="img"]',
+                        "attribute": "aria-label"},
+}
 
-            previously_counted = 0
-            listings = []
+# Reads every field of BUSINESS_FIELD_SELECTORS in a single round trip
+EXTRACT_FIELDS_JS = """(selectors) => {
+    const values = {};
+    for (const [field, selector] of Object.entries(selectors)) {
+        const node = selector.css
+            ? document.querySelector(selector.css)
+            : document.evaluate(selector.xpath, document, null,
+                  XPathResult.FIRST_ORDERED_NODE_TYPE, null).singleNodeValue;
+        if (!node) {
+            values[field] = null;
+        } else if (selector.attribute) {
+            values[field] = node.getAttribute(selector.attribute);
+        } else {
+            values[field] = node.innerText;
+        }
+    }
+    return values;
+}"""
 
-            while True:
-                await page.mouse.wheel(0, 10000)
-                await page.wait_for_timeout(2000)
 
-                current_count = await page.locator(
-                    '//a[contains(@href, "https://www.google.com/maps/place")]'
-                ).count()
-                if current_count >= total:
+def parse_business_fields(values):
+    """Builds a Business from the raw values returned by EXTRACT_FIELDS_JS"""
+    reviews_average_text = values.get("reviews_average")
+    reviews_average = None
+    if reviews_average_text:
+        reviews_average = float(
+            reviews_average_text.split()[0].replace(',', '.').strip())
 
-                    all_listings = await page.locator(
-                        '//a[contains(@href, "https://www.google.com/maps/place")]'
-                    ).all()
+    return Business(
+        name=values.get("name") or "",
+        address=values.get("address") or "",
+        website=values.get("website") or "",
+        phone_number=values.get("phone_number") or "",
+        reviews_average=reviews_average,
+    )
 
-                    listings = all_listings[:total]
 
-                    break
+async def extract_business(page):
+    """Extracts a Business from the detail panel currently shown on page"""
+    values = await page.evaluate(EXTRACT_FIELDS_JS, BUSINESS_FIELD_SELECTORS)
+    return parse_business_fields(values)
+
+
+# Per-host politeness limits for page navigations, see HostLimiter
+POLITENESS_MAX_CONCURRENT = int(os.getenv('POLITENESS_MAX_CONCURRENT', 4))
+POLITENESS_MIN_INTERVAL = float(os.getenv('POLITENESS_MIN_INTERVAL', 0.5))  # seconds
+
+
+class HostLimiter:
+    """
+    Per-host politeness limits shared by concurrent scrapers.
+
+    At most max_concurrent navigations run against one host at a time, and
+    navigations to the same host start at least min_interval seconds apart.
+    Use it from a single event loop.
+    """
+
+    def __init__(self, max_concurrent=POLITENESS_MAX_CONCURRENT,
+                 min_interval=POLITENESS_MIN_INTERVAL):
+        self.max_concurrent = max_concurrent
+        self.min_interval = min_interval
+        self._slots = {}
+        self._locks = {}
+        self._next_start = {}
+
+    @contextlib.asynccontextmanager
+    async def slot(self, url):
+        """Holds a navigation slot for the host of url"""
+        host = urllib.parse.urlsplit(url).netloc
+        if host not in self._slots:
+            self._slots[host] = asyncio.Semaphore(self.max_concurrent)
+            self._locks[host] = asyncio.Lock()
+        async with self._slots[host]:
+            async with self._locks[host]:
+                delay = self._next_start.get(host, 0) - time.monotonic()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                self._next_start[host] = time.monotonic() + self.min_interval
+            yield
+
+
+async def navigate(page, url, limiter=None, **goto_kwargs):
+    """page.goto that respects an optional HostLimiter"""
+    with span("navigate", url=url):
+        if limiter is None:
+            return await page.goto(url, **goto_kwargs)
+        async with limiter.slot(url):
+            return await page.goto(url, **goto_kwargs)
+
+
+async def open_page(context, lean=False):
+    """
+    Opens a page in context, applying the lean profile before it loads anything.
+
+    Blocking goes through the DevTools Network.setBlockedURLs command rather
+    than a Playwright route: routing every request through Python disables
+    the browser's HTTP cache, so each listing would download the Maps bundle
+    again, even in a warm pooled context.
+    """
+    page = await context.new_page()
+    if lean:
+        try:
+            session = await page.context.new_cdp_session(page)
+            await session.send("Network.enable")
+            await session.send("Network.setBlockedURLs", {
+                "urls": [f"*{pattern}*" for pattern in LEAN_BLOCKED_URL_PATTERNS]})
+        except Exception as e:
+            logging.warning(f"Could not apply the lean profile to a page: {e}")
+    return page
+
+
+@contextlib.asynccontextmanager
+async def scraping_profile(context, stats):
+    """
+    Records the traffic of a browser context while scraping one search.
+
+    Requests are counted as they finish, requests blocked by the lean profile
+    (see open_page) as they fail. Response sizes are only added up with
+    MEASURE_TRAFFIC. Listeners are removed on exit so pooled contexts can be
+    reused.
+    """
+    def count_request(request):
+        stats.requests += 1
+
+    def count_blocked(request):
+        if request.failure == "net::ERR_BLOCKED_BY_CLIENT":
+            stats.blocked_requests += 1
+
+    async def count_bytes(request):
+        try:
+            sizes = await request.sizes()
+            stats.bytes_transferred += (sizes["responseHeadersSize"]
+                                        + sizes["responseBodySize"])
+        except Exception:
+            pass
+
+    listeners = [("requestfinished", count_request), ("requestfailed", count_blocked)]
+    if MEASURE_TRAFFIC:
+        listeners.append(("requestfinished", count_bytes))
+    for event, listener in listeners:
+        context.on(event, listener)
+    try:
+        yield stats
+    finally:
+        for event, listener in listeners:
+            context.remove_listener(event, listener)
+
+
+async def collect_place_urls(page, search_term, total, waits, stats=None,
+                            limiter=None):
+    """Runs the Maps search and scrolls the result feed, returns place URLs in feed order"""
+    start = time.perf_counter()
+    await navigate(page, MAPS_URL, limiter, timeout=60000,
+                   wait_until="domcontentloaded")
+    await waits.wait(
+        "search box",
+        page.wait_for_selector('//input[@id="searchboxinput"]',
+                               timeout=WAIT_TIMEOUT_MS),
+        5000)
+    if stats is not None:
+        stats.page_load_seconds = time.perf_counter() - start
 
-                elif current_count == previously_counted:
+    await page.fill('//input[@id="searchboxinput"]', search_term)
+    await page.keyboard.press("Enter")
+    await waits.wait(
+        "result feed",
+        page.wait_for_selector(PLACE_LINK_XPATH, timeout=WAIT_TIMEOUT_MS),
+        3000 + 5000)
 
-                    listings = await page.locator(
-                        '//a[contains(@href, "https://www.google.com/maps/place")]'
-                    ).all()
+    scroll_start = time.perf_counter()
+    scroll_iterations = 0
+    stalls = 0
+    anchors_seen = 0
+    seen = set()
+    place_urls = []
+    reached_end = False
 
+    async def collect_new_listings():
+        """Reads only the anchors added since the last call, plus the end marker"""
+        nonlocal anchors_seen, reached_end
+        feed = await page.evaluate(COLLECT_PLACE_LINKS_JS,
+                                   [PLACE_LINK_CSS, anchors_seen, END_OF_LIST_CSS])
+        anchors_seen += len(feed["hrefs"])
+        reached_end = feed["end"]
+        for href in feed["hrefs"]:
+            if href and href not in seen:
+                seen.add(href)
+                place_urls.append(href)
+
+    with span("scroll") as scroll_attrs:
+        await collect_new_listings()
+
+        while len(place_urls) < total and not reached_end:
+            scroll_iterations += 1
+            if not await page.evaluate(SCROLL_FEED_JS, FEED_CSS):
+                await page.hover(PLACE_LINK_XPATH)
+                await page.mouse.wheel(0, 10000)
+            try:
+                await waits.wait(
+                    "more listings",
+                    page.wait_for_function(
+                        FEED_GROWN_JS, arg=[PLACE_LINK_CSS, anchors_seen, END_OF_LIST_CSS],
+                        timeout=SCROLL_WAIT_TIMEOUT_MS),
+                    2000)
+            except async_api.TimeoutError:
+                stalls += 1
+                if stalls > SCROLL_STALL_RETRIES:
+                    logging.warning(
+                        f"Result feed stalled {stalls} times at {len(place_urls)} listings, stopping")
                     break
+                continue
+            stalls = 0
+            await collect_new_listings()
+        scroll_attrs.update(iterations=scroll_iterations, listings=len(place_urls),
+                            reached_end=reached_end)
 
-                else:
-                    previously_counted = current_count
+    scroll_seconds = time.perf_counter() - scroll_start
+    logging.info(
+        f"Scrolled {scroll_iterations} times in {scroll_seconds:.2f}s, "
+        f"{len(place_urls)} listings (end of list: {reached_end})")
+    if stats is not None:
+        stats.scroll_iterations = scroll_iterations
+        stats.scroll_seconds = scroll_seconds
+        stats.reached_end = reached_end
+    return place_urls[:total]
+
+
+async def scrape_details(context, place_urls, concurrency=SCRAPE_CONCURRENCY,
+                         waits=None, on_result=None, limiter=None, lean=False):
+    """
+    Extracts the detail panel of every place URL using a bounded pool of pages.
 
-            business_list = BusinessList()
+    Args:
+        context: The Playwright browser or browser context to open worker pages in
+        place_urls: Place URLs in feed order
+        concurrency: Maximum number of pages extracting at the same time
+        waits: Optional WaitTimer recording readiness waits
+        on_result: Optional callback called with (place_url, business) as soon
+            as each listing has been extracted, or (place_url, None) if it failed
+        limiter: Optional HostLimiter applied to every navigation
+        lean: Open the worker pages with the lean profile (see open_page)
+
+    A worker that cannot open its page leaves the listings to the other
+    workers; listings no worker could take are reported as failed.
+
+    Returns:
+        list: Business objects (None for failed listings) in the order of place_urls
+    """
+    waits = waits or WaitTimer()
+    results = [None] * len(place_urls)
+    queue = asyncio.Queue()
+    for index, url in enumerate(place_urls):
+        queue.put_nowait((index, url))
 
-            for listing in listings:
+    async def worker(worker_id):
+        try:
+            page = await open_page(context, lean)
+        except Exception as e:
+            logging.error(f'Could not open a page for worker {worker_id}: {e}')
+            return
+        try:
+            while not queue.empty():
+                index, url = queue.get_nowait()
                 try:
-                    await listing.click()
-                    await page.wait_for_timeout(3000)
-
-                    name_css_selector = 'h1.DUwDvf.lfPIob'
-                    address_xpath = '//button[@data-item-id="address"]//div[contains(@class, "fontBodyMedium")]'
-                    website_xpath = '//a[@data-item-id="authority"]//div[contains(@class, "fontBodyMedium")]'
-                    phone_number_xpath = '//button[contains(@data-item-id, "phone")]//div[contains(@class, "fontBodyMedium")]'
-                    # review_count_xpath = '//button[@jsaction="pane.reviewChart.moreReviews"]//span'
-                    reviews_average_xpath = '//div[@jsaction="pane.reviewChart.moreReviews"]//div[@role="img"]'
-
-                    business = Business()
-
-                    if await page.locator(name_css_selector).count() > 0:
-                        business.name = await page.locator(name_css_selector
-                                                           ).inner_text()
-                    else:
-                        business.name = ""
-
-                    if await page.locator(address_xpath).count() > 0:
-                        address_elements = await page.locator(address_xpath
-                                                              ).all()
-                        if address_elements:
-                            business.address = await address_elements[
-                                0].inner_text()
-                        else:
-                            business.address = ""
-                    else:
-                        business.address = ""
-
-                    if await page.locator(website_xpath).count() > 0:
-                        website_elements = await page.locator(website_xpath
-                                                              ).all()
-                        if website_elements:
-                            business.website = await website_elements[
-                                0].inner_text()
-                        else:
-                            business.website = ""
-                    else:
-                        business.website = ""
-
-                    if await page.locator(phone_number_xpath).count() > 0:
-                        phone_elements = await page.locator(phone_number_xpath
-                                                            ).all()
-                        if phone_elements:
-                            business.phone_number = await phone_elements[
-                                0].inner_text()
-                        else:
-                            business.phone_number = ""
-                    else:
-                        business.phone_number = ""
-
-                    # if await page.locator(review_count_xpath).count() > 0:
-                    #     review_count_text = await page.locator(
-                    #         review_count_xpath).inner_text()
-                    #     business.reviews_count = int(
-                    #         review_count_text.split()[0].replace(',',
-                    #                                              '').strip())
-                    # else:
-                    #     business.reviews_count = None
-
-                    if await page.locator(reviews_average_xpath).count() > 0:
-                        reviews_average_text = await page.locator(
-                            reviews_average_xpath).get_attribute('aria-label')
-                        if reviews_average_text:
-                            business.reviews_average = float(
-                                reviews_average_text.split()[0].replace(
-                                    ',', '.').strip())
-                        else:
-                            business.reviews_average = None
-                    else:
-                        business.reviews_average = None
-
-                    business_list.business_list.append(business)
+                    with span("extract_listing", url=url):
+                        await navigate(page, url, limiter, timeout=60000,
+                                       wait_until="domcontentloaded")
+                        # Every listing is a fresh navigation, so any non-empty
+                        # title belongs to it (consecutive listings may share a
+                        # name, e.g. chain stores)
+                        try:
+                            await waits.wait(
+                                "listing title",
+                                page.wait_for_function(
+                                    """(selector) => {
+                                        const title = document.querySelector(selector);
+                                        return title && title.innerText.trim() !== '';
+                                    }""",
+                                    arg=NAME_CSS_SELECTOR,
+                                    timeout=WAIT_TIMEOUT_MS),
+                                3000)
+                        except async_api.TimeoutError:
+                            logging.warning(
+                                f'Listing title did not appear, extracting anyway: {url}')
+                        results[index] = await extract_business(page)
+                        results[index].place_url = url
+                        if on_result is not None:
+                            on_result(url, results[index])
                 except Exception as e:
                     logging.error(
-                        f'Error occurred while scraping listing: {e}')
+                        f'Error occurred while scraping listing (worker {worker_id}): {e}')
+                    if on_result is not None:
+                        on_result(url, None)
+        finally:
+            with contextlib.suppress(Exception):
+                await page.close()
 
-            await browser.close()
-            return business_list
+    workers = max(1, min(concurrency, len(place_urls)))
+    await asyncio.gather(*(worker(worker_id) for worker_id in range(workers)))
+    while not queue.empty():  # no worker could open a page
+        _, url = queue.get_nowait()
+        if on_result is not None:
+            on_result(url, None)
+    return results
 
-        except Exception as e:
-            logging.error(f'Error occurred during scraping: {e}')
-            await browser.close()
-            return BusinessList()
 
-async def get_agent_plan(user_input: str):
+# Browser pool limits, see BrowserPool
+BROWSER_MAX_AGE = int(os.getenv('BROWSER_MAX_AGE', 1800))  # seconds
+BROWSER_MAX_PAGES = int(os.getenv('BROWSER_MAX_PAGES', 500))
+BROWSER_MAX_CONTEXTS = int(os.getenv('BROWSER_MAX_CONTEXTS', 4))
+
+
+class BrowserPool:
     """
-    Processes user input using the LLM to determine intent and extract parameters.
-    Handles both function calls and text responses safely. Interprets indirect queries.
+    Long-lived Chromium browser and context pool shared across requests.
+
+    Playwright objects are bound to the event loop that created them, while
+    Streamlit starts a new loop on every rerun, so the pool owns a private
+    event loop running in a daemon thread. Work is submitted with run().
+
+    The browser is recycled once it is older than max_age seconds, has opened
+    more than max_pages pages or is no longer connected. At most max_contexts
+    contexts are checked out at the same time; idle contexts are kept warm
+    (cookies, HTTP cache) for the next request.
     """
-    planned_calls = []
-    llm_text_output = ""  # To store any textual response from the LLM
 
-    try:
-        chat = model.start_chat()
-        # --- Updated Prompt ---
-        prompt = f"""Analyze the following user request for lead generation using the available tools: 'search_Maps' and 'prepare_whatsapp_message'.
-
-        **CRITICAL TASK:** Interpret the user's request to identify the **type of business or place** they are actually looking for on Google Maps, especially when they use terms like 'clients' or 'leads'. Formulate the most effective search query for the 'search_Maps' tool.
-
-        **Interpretation Examples:**
-        - User: "find me graphic design clients in New York" -> Your interpretation: The user wants businesses that *are* graphic designers or *hire* them. -> **Search Query:** "graphic designers in New York" OR "graphic design agency in New York"
-        - User: "look for companies needing marketing services in London" -> Your interpretation: The user wants potential clients for marketing. -> **Search Query:** "marketing agency in London" OR "businesses in London" (less specific, might need clarification)
-        - User: "get me plumbing leads in Chicago" -> Your interpretation: The user wants plumbing businesses. -> **Search Query:** "plumbers in Chicago" OR "plumbing companies in Chicago"
-        - User: "find cafes in Islamabad and send message X" -> Your interpretation: Direct request. -> **Search Query:** "cafes in Islamabad"
-
-        **User Request:** "{user_input}"
-
-        **Your Steps:**
-        1.  Carefully analyze the User Request.
-        2.  Determine the core action(s): Search Maps, Prepare WhatsApp message, or Both.
-        3.  **If searching:** Formulate the best possible `query` string for Google Maps based on your interpretation (as shown in examples) and identify the `location`. Determine `num_results` (default 20 if unspecified).
-        4.  **If messaging:** Extract the `message` content, the limit `k`, or specific `target_numbers`.
-        5.  Identify the correct function(s) ('search_Maps', 'prepare_whatsapp_message') to call and construct their arguments precisely.
-        6.  If the plan involves searching and then messaging those results, ensure 'search_Maps' is called first.
-        """
-        # --- End of Updated Prompt ---
-
-        response = chat.send_message(prompt)
-
-        # (Rest of the function to parse response remains the same...)
-        # Iterate through the parts of the response candidate
-        if response.candidates and response.candidates[0].content.parts:
-            for part in response.candidates[0].content.parts:
-                # --- Check for Function Call FIRST ---
-                if part.function_call:
-                    call = part.function_call
-                    function_name = call.name
-                    args = {key: value for key, value in call.args.items()} if hasattr(call, 'args') else {}
-
-                    if function_name == "search_Maps" and "num_results" not in args:
-                        args["num_results"] = 20
-
-                    planned_calls.append({
-                        "function_name": function_name,
-                        "args": args
-                    })
-                # --- If not a function call, check for text ---
-                elif hasattr(part, 'text'):
-                    llm_text_output += part.text + "\n"
-
-        if not planned_calls and not llm_text_output:
+    def __init__(self, max_age=BROWSER_MAX_AGE, max_pages=BROWSER_MAX_PAGES,
+                 max_contexts=BROWSER_MAX_CONTEXTS):
+        self.max_age = max_age
+        self.max_pages = max_pages
+        self.max_contexts = max_contexts
+
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self.loop.run_forever,
+                                        name="browser-pool", daemon=True)
+        self._thread.start()
+
+        self._playwright = None
+        self._browser = None
+        self._generation = 0
+        self._launched_at = 0.0
+        self._pages_opened = 0
+        self._idle = []
+        self._context_generation = {}
+        self._in_use = {}
+        self._retired = {}
+        self._lock = None
+        self._slots = None
+
+    async def run(self, coro):
+        """Runs coro on the pool's event loop and awaits its result from the caller's loop"""
+        future = asyncio.run_coroutine_threadsafe(coro, self.loop)
+        return await asyncio.wrap_future(future)
+
+    def is_healthy(self):
+        """Returns True if the current browser can keep serving contexts"""
+        if self._browser is None or not self._browser.is_connected():
+            return False
+        if time.monotonic() - self._launched_at > self.max_age:
+            return False
+        return self._pages_opened < self.max_pages
+
+    async def _setup(self):
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+            self._slots = asyncio.Semaphore(self.max_contexts)
+        if self._playwright is None:
+            self._playwright = await async_api.async_playwright().start()
+
+    async def _replace_browser(self):
+        """Retires the current browser and launches a fresh one"""
+        if self._browser is not None:
+            old_generation, old_browser = self._generation, self._browser
+            for context in self._idle:
+                self._context_generation.pop(context, None)
+                with contextlib.suppress(Exception):
+                    await context.close()
+            self._idle = []
+            if self._in_use.get(old_generation):
+                self._retired[old_generation] = old_browser
+            else:
+                with contextlib.suppress(Exception):
+                    await old_browser.close()
+            logging.info(
+                f"Recycling browser (age {time.monotonic() - self._launched_at:.0f}s, "
+                f"{self._pages_opened} pages)")
+
+        start = time.perf_counter()
+        with span("browser_launch", pooled=True):
+            self._browser = await self._playwright.chromium.launch(headless=True)
+        self._generation += 1
+        self._launched_at = time.monotonic()
+        self._pages_opened = 0
+        logging.info(f"Launched pooled browser in {time.perf_counter() - start:.2f}s")
+
+    def _on_page(self, page):
+        self._pages_opened += 1
+
+    async def _checkout(self):
+        async with self._lock:
+            if not self.is_healthy():
+                await self._replace_browser()
+            if self._idle:
+                context = self._idle.pop()
+            else:
+                context = await self._browser.new_context()
+                context.on("page", self._on_page)
+                self._context_generation[context] = self._generation
+            self._in_use[self._generation] = self._in_use.get(
+                self._generation, 0) + 1
+            return context
+
+    async def _checkin(self, context):
+        generation = self._context_generation.get(context)
+        self._in_use[generation] -= 1
+
+        reusable = generation == self._generation and self.is_healthy()
+        if reusable:
             try:
-                llm_text_output = response.text
-            except ValueError as ve:
-                llm_text_output = f"LLM response contained a function call but no text. ({ve})"
-            except Exception as text_exc:
-                 llm_text_output = f"Could not extract text response: {text_exc}"
+                for page in context.pages:
+                    await page.close()
+            except Exception as e:
+                logging.warning(f"Dropping pooled context after cleanup error: {e}")
+                reusable = False
 
-    except Exception as e:
-        error_message = f"An error occurred during LLM interaction: {type(e).__name__} - {str(e)}"
-        st.error(error_message)
-        return [], error_message
+        if reusable:
+            self._idle.append(context)
+            return
 
-    return planned_calls, llm_text_output.strip()
+        self._context_generation.pop(context, None)
+        with contextlib.suppress(Exception):
+            await context.close()
+        retired = self._retired.get(generation)
+        if retired is not None and not self._in_use[generation]:
+            del self._retired[generation]
+            with contextlib.suppress(Exception):
+                await retired.close()
 
+    @contextlib.asynccontextmanager
+    async def context(self):
+        """Checks out a browser context; must be used on the pool's event loop (inside run())"""
+        await self._setup()
+        async with self._slots:
+            context = await self._checkout()
+            try:
+                yield context
+            finally:
+                await self._checkin(context)
 
-async def main():
-    st.title("AI-Powered Lead Generation Assistant")
+    async def _close(self):
+        for context in self._idle:
+            with contextlib.suppress(Exception):
+                await context.close()
+        self._idle = []
+        for browser in [self._browser, *self._retired.values()]:
+            if browser is not None:
+                with contextlib.suppress(Exception):
+                    await browser.close()
+        self._browser = None
+        self._retired = {}
+        if self._playwright is not None:
+            await self._playwright.stop()
+            self._playwright = None
 
-    st.text("By Jeremy Sigamony") 
-    st.markdown("---")
+    def close(self):
+        """Closes all browsers and stops the pool's event loop"""
+        asyncio.run_coroutine_threadsafe(self._close(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
 
-    st.markdown(
-        """
-    <p style="font-size: 13px;color: aqua;">Enter your request in natural language. Examples:</p>
-    <ul>
-        <li>"Find cafes in Islamabad and send the first 5 this message: 'Hello! We have a special offer today.'"</li>
-        <li>"Show me barber shops in Malakand, maybe 10 of them."</li>
-        <li>"Send 'Meeting reminder for tomorrow at 10 AM' to +923001234567 and +923339876543"</li>
-    </ul>
-    """,
-        unsafe_allow_html=True,
-    )
 
-    user_input = st.text_area(
-        "Enter your request",
-        placeholder="e.g., Find cafes in Islamabad and send them a promotional message"
-    )
+@process_resource
+def get_browser_pool():
+    """Returns the process-wide BrowserPool shared by all Streamlit sessions"""
+    return BrowserPool()
 
 
-    if st.button("Process Request"):
-        if not user_input:
-            st.error("Please enter your request")
-        else:
-            with st.spinner("Analyzing your request..."):
-                planned_calls, llm_response = await get_agent_plan(user_input)
+async def scrape_with_context(context, search_term, total,
+                              concurrency=SCRAPE_CONCURRENCY, lean=LEAN_PROFILE,
+                              known=None, on_extracted=None, on_business=None,
+                              limiter=None, lead_index=None, reuse_leads=True):
+    """
+    Runs a full search and detail extraction inside an open browser context.
 
-                if planned_calls:
-                    st.success("Request analyzed successfully!")
-                    st.json(planned_calls) # Show the plan
-
-                    # --- Store results temporarily if needed for later steps ---
-                    search_results_list = None
-
-                    # Process each planned call
-                    for call in planned_calls:
-                        if call["function_name"] == "search_Maps":
-                            with st.spinner("Searching Google Maps..."):
-                                # --- Get and VALIDATE num_results ---
-                                num_results_arg = call["args"].get("num_results", 20) # Default to 20
-                                try:
-                                    # Convert to integer
-                                    num_results_int = int(num_results_arg)
-                                    if num_results_int <= 0: # Add check for non-positive
-                                        st.warning(f"Number of results must be positive ('{num_results_arg}' received). Defaulting to 20.")
-                                        num_results_int = 5
-                                except (ValueError, TypeError):
-                                    st.warning(f"Invalid value received for number of results ('{num_results_arg}'). Defaulting to 20.")
-                                    num_results_int = 20
-                                # --- End Validation ---
-
-                                # Pass the validated integer to the scraper
-                                business_list = await scrape_business(
-                                    call["args"]["query"],
-                                    num_results_int # Use the integer value
-                                )
-                                search_results_list = business_list # Store for potential later use
-
-                                if business_list and business_list.business_list: # Check if list is not None and not empty
-                                    st.success(f"Found {len(business_list.business_list)} results!")
-                                    st.dataframe(business_list.dataframe())
-
-                                    # Save results
-                                    current_datetime = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-                                    search_for_filename = call["args"]["query"].replace(' ', '_').replace('/','_') # Basic sanitization
-                                    excel_filename = f"({len(business_list.business_list)}_Rows)__{current_datetime}__({search_for_filename})"
-
-                                    excel_file_path = business_list.save_to_excel(excel_filename)
-                                    if excel_file_path:
-                                        try:
-                                            with open(excel_file_path, 'rb') as fp:
-                                                st.download_button(
-                                                    label="Download Results (Excel)",
-                                                    data=fp,
-                                                    file_name=f"{excel_filename}.xlsx",
-                                                    mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet" # Correct MIME type
-                                                )
-                                        except FileNotFoundError:
-                                             st.error(f"Could not read file for download: {excel_file_path}")
-                                    else:
-                                         st.error("Failed to save results to Excel.")
-                                else:
-                                     st.warning("No results found or scraping failed.")
-
-
-                        elif call["function_name"] == "prepare_whatsapp_message":
-                            st.info("WhatsApp Message Action:")
-                            message_content = call['args'].get('message', '*No message content provided*')
-                            k_value = call['args'].get('k')
-                            target_numbers = call['args'].get('target_numbers')
-
-                            st.write(f"**Message:** {message_content}")
-
-                            # Handle direct target numbers if provided
-                            if target_numbers:
-                                st.write("**Target numbers (direct):**", target_numbers)
-                                with st.spinner("Sending messages to direct numbers..."):
-                                    for number in target_numbers:
-                                        if await send_whatsapp_message(number, message_content):
-                                            st.success(f"Message sent to {number}")
-                                        else:
-                                            st.error(f"Failed to send message to {number}")
-
-                            # Handle search results if available
-                            elif search_results_list and search_results_list.business_list:
-                                if k_value is not None:
-                                    try:
-                                        k_int = int(k_value)
-                                        st.write(f"**Number of recipients (k):** {k_int}")
-                                        
-                                        # Get phone numbers from search results
-                                        phone_numbers = [
-                                            business.phone_number 
-                                            for business in search_results_list.business_list[:k_int]
-                                            if business.phone_number  # Only include if phone number exists
-                                        ]
-                                        
-                                        if not phone_numbers:
-                                            st.warning("No valid phone numbers found in the search results.")
-                                        else:
-                                            with st.spinner(f"Sending messages to {len(phone_numbers)} recipients..."):
-                                                for number in phone_numbers:
-                                                    if await send_whatsapp_message(number, message_content):
-                                                        st.success(f"Message sent to {number}")
-                                                    else:
-                                                        st.error(f"Failed to send message to {number}")
-                                        
-                                    except (ValueError, TypeError):
-                                        st.warning(f"Invalid value received for k ('{k_value}')")
-                                else:
-                                    st.warning("No 'k' value provided to limit the number of recipients.")
-                            else:
-                                st.warning("No search results available to send messages to.")
-
-
-                else: # No planned calls from LLM
-                    st.info("LLM Response:")
-                    st.write(llm_response if llm_response else "No specific action identified by the AI.")
-
-
-async def send_whatsapp_message(phone_number: str, message: str, wait_time: int = 25) -> bool:
-    """
-    Sends a WhatsApp message using pywhatkit.
-    
-    Args:
-        phone_number: The target phone number in international format (e.g., +923348958772)
-        message: The message content to send
-        wait_time: How long to wait for WhatsApp Web to load (default: 25 seconds)
-    
-    Returns:
-        bool: True if message was sent successfully, False otherwise
+    With a lead_index, the listings extracted here (or known from a
+    checkpoint) are added to it; with reuse_leads, listings it already knows
+    are taken from it instead of being extracted again.
+
+    on_extracted is called with every newly extracted Business as soon as it
+    is available. on_business is called with every Business of the result,
+    known ones included, in feed order: a listing is released as soon as it
+    and all listings before it are settled.
+
+    If scraping fails partway, the listings extracted so far are still
+    returned (in feed order) instead of an empty BusinessList.
     """
-    try:
-        logging.info(f"Attempting to send WhatsApp message to: {phone_number}")
-        logging.info(f"Message: {message}")
-        logging.info(f"Waiting {wait_time} seconds for WhatsApp Web/Desktop...")
-        
-        pywhatkit.sendwhatmsg_instantly(
-            phone_no=phone_number,
-            message=message,
-            wait_time=wait_time,
-            tab_close=True,
-            close_time=3
-        )
-        
-        logging.info("Message sent successfully!")
-        return True
-        
-    except Exception as e:
-        error_type = type(e).__name__
-        logging.error(f"An error occurred: {error_type} - {e}")
-        st.error(f"Failed to send message to {phone_number}. Error: {error_type}")
-        return False
+    stats = ScrapeStats(lean=lean)
+    business_list = BusinessList(stats=stats)
+    waits = WaitTimer()
+    known = known or {}
+    from_index = {}
+    place_urls = None
+    settled = {}
+    released = 0
+
+    def release():
+        nonlocal released
+        while released < len(place_urls) and place_urls[released] in settled:
+            business = settled[place_urls[released]]
+            released += 1
+            if business is not None and on_business is not None:
+                on_business(business)
+
+    def record(url, business):
+        settled[url] = business
+        if business is not None and on_extracted is not None:
+            on_extracted(business)
+        release()
+
+    async with scraping_profile(context, stats):
+        try:
+            page = await open_page(context, lean)
+            place_urls = await collect_place_urls(page, search_term, total,
+                                                  waits, stats, limiter)
+            await page.close()
+            stats.listings_found = len(place_urls)
+            if lead_index is not None and reuse_leads:
+                from_index = lead_index.get_many(
+                    [url for url in place_urls if known.get(url) is None])
+                known = {**from_index, **known}
+
+            pending = []
+            for url in place_urls:
+                if known.get(url) is None:
+                    pending.append(url)
+                else:
+                    settled[url] = known.get(url)
+            stats.cached_rows = len(place_urls) - len(pending)
+            logging.info(
+                f"Collected {len(place_urls)} listings for '{search_term}', "
+                f"extracting {len(pending)} with {concurrency} workers")
+            release()
+
+            with span("extract", listings=len(pending), concurrency=concurrency):
+                await scrape_details(context, pending, concurrency, waits,
+                                     on_result=record, limiter=limiter, lean=lean)
+            logging.info(f"Readiness waits for '{search_term}': {waits.summary()}")
+
+        except Exception as e:
+            logging.error(f'Error occurred during scraping: {e}')
+
+    if place_urls is None:
+        # The feed was never read, fall back to whatever was already known
+        business_list.extend(list(known.values())[:total])
+    else:
+        for url in place_urls:
+            business = settled.get(url)
+            if business is not None:
+                business_list.append(business)
+    stats.complete = (place_urls is not None
+                      and business_list.get_row_size() == len(place_urls))
+    if lead_index is not None:
+        # Leads served from the index were not looked at again, keep their age
+        extracted = [business for business in business_list.business_list
+                     if business.place_url not in from_index]
+        if extracted:
+            lead_index.add_many(extracted)
+
+    logging.info(f"Traffic for '{search_term}' ({stats.summary()})")
+    return business_list
+
+
+# Directory holding the journals of in-progress searches, see ScrapeJournal
+CHECKPOINT_DIR = os.getenv('CHECKPOINT_DIR', 'checkpoints')
+CHECKPOINTS = os.getenv('CHECKPOINTS', 'true').lower() == 'true'
+
+
+class ScrapeJournal:
+    """
+    Append-only JSONL checkpoint of the businesses extracted for one query.
+
+    Every extracted Business is appended (with its place URL) as soon as it
+    is produced. A rerun of the same query loads the journal and skips the
+    place URLs it already holds. The journal is removed once a search
+    completes without failed listings.
+    """
+
+    def __init__(self, search_term, directory=CHECKPOINT_DIR):
+        self.path = os.path.join(directory, f"{query_digest(search_term)}.jsonl")
+        self._lock = threading.Lock()
+        self._needs_newline = False
+
+    def load(self):
+        """Returns a dict of place URL to Business for every journaled listing"""
+        done = {}
+        try:
+            with open(self.path, encoding="utf-8") as fp:
+                for line in fp:
+                    self._needs_newline = not line.endswith("\n")
+                    try:
+                        business = business_from_dict(json.loads(line))
+                    except ValueError:
+                        continue  # line cut short by a crash
+                    if business.place_url:
+                        done[business.place_url] = business
+        except OSError:
+            pass
+        return done
+
+    def append(self, business):
+        """Appends one extracted Business to the journal"""
+        with self._lock:
+            try:
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                with open(self.path, "a", encoding="utf-8") as fp:
+                    if self._needs_newline:
+                        fp.write("\n")
+                        self._needs_newline = False
+                    fp.write(json.dumps(asdict(business)) + "\n")
+            except OSError as e:
+                logging.error(f"Failed to write checkpoint: {e}")
+
+    def remove(self):
+        """Deletes the journal"""
+        with contextlib.suppress(OSError):
+            os.remove(self.path)
+
+
+async def scrape_business(search_term, total, concurrency=SCRAPE_CONCURRENCY,
+                          pool=None, lean=LEAN_PROFILE, known=None,
+                          checkpoint=CHECKPOINTS, on_business=None,
+                          limiter=None, lead_index=None, reuse_leads=True):
+    """
+    Scrapes up to total businesses for search_term from Google Maps.
+
+    Args:
+        search_term: The Google Maps search query
+        total: Maximum number of listings to extract
+        concurrency: Number of listing pages extracted at the same time
+        pool: Optional BrowserPool to reuse a warm browser instead of launching one
+        lean: Block images, tiles, media, fonts and analytics (see LEAN_PROFILE)
+        known: Optional mapping of place URL to an already extracted Business;
+            those listings are taken from it instead of being opened again
+        checkpoint: Journal extracted listings so an interrupted search for
+            the same query resumes where it stopped (see ScrapeJournal)
+        on_business: Optional callback receiving each Business in feed order
+            as soon as it is available; may be called from the pool's thread.
+            See ScrapeStream for an async iterator built on it
+        limiter: Optional HostLimiter shared with other concurrent searches.
+            With a pool it must only ever be used through that pool
+        lead_index: Optional LeadIndex; extracted leads are added to it
+        reuse_leads: Take listings whose place URL the lead_index knows
+            (and extracted recently, see LeadIndex) from it instead of
+            opening them again. Turn off to re-extract every listing
+
+    Returns:
+        BusinessList: The extracted businesses in result feed order, with
+        traffic figures in its stats
+    """
+    journal = ScrapeJournal(search_term) if checkpoint else None
+    on_extracted = None
+    if journal is not None:
+        resumed = journal.load()
+        if resumed:
+            logging.info(
+                f"Resuming '{search_term}' from checkpoint with {len(resumed)} listings")
+        known = {**resumed, **(known or {})}
+        on_extracted = journal.append
+
+    with span("search", query=search_term, requested=total, lean=lean) as attrs:
+        if pool is not None:
+            async def scrape_in_pool():
+                async with pool.context() as context:
+                    return await scrape_with_context(context, search_term, total,
+                                                     concurrency, lean, known,
+                                                     on_extracted, on_business,
+                                                     limiter, lead_index, reuse_leads)
+            business_list = await pool.run(scrape_in_pool())
+        else:
+            async with async_api.async_playwright() as p:
+                with span("browser_launch", pooled=False):
+                    browser = await p.chromium.launch(headless=True)
+                try:
+                    context = await browser.new_context()
+                    business_list = await scrape_with_context(
+                        context, search_term, total, concurrency, lean, known,
+                        on_extracted, on_business, limiter, lead_index,
+                        reuse_leads)
+                finally:
+                    await browser.close()
+        attrs.update(rows=business_list.get_row_size(),
+                     listings_found=business_list.stats.listings_found,
+                     cached_rows=business_list.stats.cached_rows)
+
+    business_list.normalize_phones()
+    if journal is not None and business_list.stats.complete:
+        journal.remove()
+    return business_list
+
+
+# Persistent cross-search lead index, see LeadIndex
+LEAD_INDEX_DB = os.getenv('LEAD_INDEX_DB', 'leads.sqlite3')
+LEAD_INDEX_MAX_AGE = int(os.getenv('LEAD_INDEX_MAX_AGE', 30 * 24 * 3600))  # seconds
+
+
+class LeadIndex:
+    """
+    Persistent index of every lead seen across searches and output files.
+
+    Leads are keyed by Business.lead_key() (normalized phone number plus a
+    name/address fingerprint) and also indexed by place URL, so scrapes can
+    skip detail extraction for listings that are already known. A lead is
+    only reused for max_age seconds after its details were last extracted
+    (last_seen), so ratings, phone numbers and websites are refreshed
+    eventually. Phone numbers that have been messaged are recorded so
+    campaigns do not contact them twice. All lookups go through SQLite
+    indexes.
+    """
+
+    LOOKUP_CHUNK = 500  # stays below SQLite's host parameter limit
+
+    def __init__(self, db_path=LEAD_INDEX_DB, max_age=LEAD_INDEX_MAX_AGE):
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(db_path, check_same_thread=False)
+        with self._lock, self._db:
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("""
+                CREATE TABLE IF NOT EXISTS leads (
+                    lead_key TEXT PRIMARY KEY,
+                    phone TEXT,
+                    fingerprint TEXT NOT NULL,
+                    place_url TEXT,
+                    data TEXT NOT NULL,
+                    first_seen REAL NOT NULL,
+                    last_seen REAL NOT NULL
+                )""")
+            self._db.execute("CREATE INDEX IF NOT EXISTS leads_place_url ON leads (place_url)")
+            self._db.execute("CREATE INDEX IF NOT EXISTS leads_phone ON leads (phone)")
+            self._db.execute("""
+                CREATE TABLE IF NOT EXISTS messaged (
+                    phone TEXT PRIMARY KEY,
+                    messaged_at REAL NOT NULL
+                )""")
+
+    def get(self, place_url):
+        """Returns the known Business for a place URL, or None"""
+        return self.get_many([place_url]).get(place_url)
+
+    def get_many(self, place_urls):
+        """
+        Returns a dict of place URL to Business for the known place URLs
+        whose details were extracted less than max_age seconds ago
+        """
+        found = {}
+        place_urls = list(place_urls)
+        seen_after = time.time() - self.max_age
+        for start in range(0, len(place_urls), self.LOOKUP_CHUNK):
+            chunk = place_urls[start:start + self.LOOKUP_CHUNK]
+            with self._lock:
+                rows = self._db.execute(
+                    f"SELECT place_url, data FROM leads WHERE place_url IN "
+                    f"({', '.join('?' * len(chunk))}) AND last_seen >= ?",
+                    [*chunk, seen_after]).fetchall()
+            for place_url, data in rows:
+                found[place_url] = business_from_dict(json.loads(data))
+        return found
+
+    def contains(self, business):
+        """Returns True if a lead with the same lead_key is already indexed"""
+        with self._lock:
+            return self._db.execute(
+                "SELECT 1 FROM leads WHERE lead_key = ?",
+                (business.lead_key(),)).fetchone() is not None
+
+    def add_many(self, businesses, extracted=True):
+        """
+        Adds or refreshes leads and returns how many were new. With
+        extracted=False (e.g. after website enrichment) the stored rows are
+        updated without counting as a fresh extraction, so last_seen keeps
+        its age.
+        """
+        now = time.time()
+        rows = [(business.lead_key(), normalize_phone_digits(business.phone_number),
+                 lead_fingerprint(business.name, business.address),
+                 business.place_url, json.dumps(asdict(business)), now, now)
+                for business in businesses]
+        with self._lock, self._db:
+            before = self._db.total_changes
+            self._db.executemany(
+                "INSERT OR IGNORE INTO leads "
+                "(lead_key, phone, fingerprint, place_url, data, first_seen, last_seen) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+            added = self._db.total_changes - before
+            self._db.executemany(
+                "UPDATE leads SET place_url = COALESCE(?, place_url), data = ?, "
+                "last_seen = CASE WHEN ? THEN ? ELSE last_seen END "
+                "WHERE lead_key = ?",
+                [(place_url, data, extracted, now, key)
+                 for key, _, _, place_url, data, _, _ in rows])
+        return added
+
+    def mark_messaged(self, phone_number):
+        """Records that phone_number has been messaged"""
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT OR REPLACE INTO messaged (phone, messaged_at) VALUES (?, ?)",
+                (normalize_phone_digits(phone_number), time.time()))
+
+    def filter_unmessaged(self, phone_numbers):
+        """Returns the phone numbers (input order, duplicates dropped) not messaged yet"""
+        result, seen = [], set()
+        for phone_number in phone_numbers:
+            digits = normalize_phone_digits(phone_number)
+            if digits in seen:
+                continue
+            seen.add(digits)
+            with self._lock:
+                messaged = self._db.execute(
+                    "SELECT 1 FROM messaged WHERE phone = ?", (digits,)).fetchone()
+            if messaged is None:
+                result.append(phone_number)
+        return result
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM leads").fetchone()[0]
+
+
+@process_resource
+def get_lead_index():
+    """Returns the process-wide LeadIndex"""
+    return LeadIndex()
+
+
+# On-disk scrape result cache, see ScrapeCache
+CACHE_DIR = os.getenv('CACHE_DIR', 'cache')
+CACHE_TTL = int(os.getenv('CACHE_TTL', 7 * 24 * 3600))  # seconds
+CACHE_MAX_ENTRIES = int(os.getenv('CACHE_MAX_ENTRIES', 500))
+
+
+def normalize_query(query):
+    """Normalizes a search query so trivially different spellings share a cache key"""
+    return " ".join(query.lower().split())
+
+
+def query_digest(query):
+    """Returns a filesystem safe key for a normalized query"""
+    return hashlib.sha1(normalize_query(query).encode("utf-8")).hexdigest()
+
+
+def business_from_dict(data):
+    """Builds a Business from a dict, ignoring unknown keys"""
+    names = {f.name for f in fields(Business)}
+    return Business(**{key: value for key, value in data.items()
+                       if key in names})
+
+
+class ScrapeCache:
+    """
+    On-disk cache of scrape results keyed by normalized query.
+
+    Each entry is a JSON file holding the scraped rows, the number of results
+    that was requested and whether the result feed ran out before reaching it.
+    Entries expire after ttl seconds; beyond max_entries the least recently
+    used entries (by file modification time) are evicted.
+    """
+
+    def __init__(self, directory=CACHE_DIR, ttl=CACHE_TTL,
+                 max_entries=CACHE_MAX_ENTRIES):
+        self.directory = os.path.join(directory, "scrapes")
+        self.ttl = ttl
+        self.max_entries = max_entries
+
+    def _path(self, query):
+        return os.path.join(self.directory, f"{query_digest(query)}.json")
+
+    def get(self, query):
+        """Returns the cache entry for query, or None if missing or expired"""
+        path = self._path(query)
+        try:
+            with open(path, encoding="utf-8") as fp:
+                entry = json.load(fp)
+        except (OSError, ValueError):
+            return None
+
+        if time.time() - entry.get("saved_at", 0) > self.ttl:
+            with contextlib.suppress(OSError):
+                os.remove(path)
+            return None
+
+        with contextlib.suppress(OSError):
+            os.utime(path)  # mark as recently used
+        entry["businesses"] = [business_from_dict(row)
+                               for row in entry.get("rows", [])]
+        return entry
+
+    def put(self, query, requested, business_list):
+        """Stores business_list as the result of requesting `requested` rows for query"""
+        os.makedirs(self.directory, exist_ok=True)
+        entry = {
+            "query": normalize_query(query),
+            "requested": requested,
+            # Only a feed that really ended may serve fewer rows than requested
+            "exhausted": business_list.stats.reached_end,
+            "saved_at": time.time(),
+            "rows": [asdict(business) for business in business_list.business_list],
+        }
+        path = self._path(query)
+        tmp_path = f"{path}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as fp:
+                json.dump(entry, fp)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logging.error(f"Failed to write scrape cache entry: {e}")
+            return
+        self.evict()
+
+    def evict(self):
+        """Removes the least recently used entries beyond max_entries"""
+        try:
+            paths = [os.path.join(self.directory, name)
+                     for name in os.listdir(self.directory)
+                     if name.endswith(".json")]
+        except OSError:
+            return
+        if len(paths) <= self.max_entries:
+            return
+        paths.sort(key=os.path.getmtime)
+        for path in paths[:len(paths) - self.max_entries]:
+            with contextlib.suppress(OSError):
+                os.remove(path)
+
+
+def cache_hit(entry, total):
+    """
+    Returns the BusinessList a cache entry serves for total rows, or None if
+    the entry is missing or holds fewer rows (and its feed did not run out)
+    """
+    if entry is None:
+        return None
+    cached = entry["businesses"]
+    if len(cached) < total and not entry["exhausted"]:
+        return None
+    business_list = BusinessList(cached[:total])
+    business_list.normalize_phones()
+    business_list.stats.cached_rows = business_list.get_row_size()
+    business_list.stats.listings_found = len(cached)
+    return business_list
+
+
+async def cached_scrape_business(search_term, total, cache=None,
+                                 on_business=None, **scrape_kwargs):
+    """
+    scrape_business with a ScrapeCache in front of it.
+
+    A cached result with at least `total` rows (or one whose feed ran out)
+    is served as a prefix without opening a browser. A shorter cached result
+    is extended: its listings are reused and only the missing tail is
+    extracted. Only complete results are cached. Keyword arguments are
+    passed through to scrape_business.
+    """
+    cache = cache or ScrapeCache()
+    start = time.perf_counter()
+    entry = cache.get(search_term)
+
+    business_list = cache_hit(entry, total)
+    if business_list is not None:
+        if on_business is not None:
+            for business in business_list.business_list:
+                on_business(business)
+        logging.info(
+            f"Cache hit for '{search_term}': {business_list.get_row_size()} rows "
+            f"in {(time.perf_counter() - start) * 1000:.1f}ms")
+        return business_list
+
+    known = {}
+    if entry is not None:
+        cached = entry["businesses"]
+        known = {business.place_url: business for business in cached
+                 if business.place_url}
+        logging.info(
+            f"Partial cache hit for '{search_term}': {len(cached)} of {total} rows, "
+            f"scraping the rest")
+
+    business_list = await scrape_business(search_term, total, known=known,
+                                          on_business=on_business,
+                                          **scrape_kwargs)
+    # An incomplete result (feed not read, listings failed) is not cached,
+    # so the next request scrapes again instead of serving it as a hit
+    if business_list.business_list and business_list.stats.complete:
+        cache.put(search_term, total, business_list)
+    return business_list
+
+
+class ScrapeStream:
+    """
+    Async iterator over the businesses of a search, yielded as they are extracted.
+
+    Usage:
+        async with ScrapeStream("cafes in islamabad", 20, pool=pool) as stream:
+            async for business in stream:
+                ...
+        stream.business_list  # the complete BusinessList, with stats
+
+    Businesses are yielded in feed order. Leaving the block before the stream
+    is exhausted cancels the search. `scrape` selects the scrape function
+    (scrape_business or cached_scrape_business); other keyword arguments are
+    passed through to it.
+    """
+
+    def __init__(self, search_term, total, scrape=None, **scrape_kwargs):
+        self.search_term = search_term
+        self.total = total
+        self.business_list = None
+        self._scrape = scrape or scrape_business
+        self._scrape_kwargs = scrape_kwargs
+        self._queue = None
+        self._task = None
+
+    async def __aenter__(self):
+        loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue()
+
+        def emit(business):
+            loop.call_soon_threadsafe(self._queue.put_nowait, business)
+
+        self._task = asyncio.ensure_future(self._scrape(
+            self.search_term, self.total, on_business=emit,
+            **self._scrape_kwargs))
+        self._task.add_done_callback(lambda _: self._queue.put_nowait(None))
+        return self
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if self.business_list is not None:
+            raise StopAsyncIteration
+        business = await self._queue.get()
+        if business is None:
+            self.business_list = self._task.result()
+            raise StopAsyncIteration
+        return business
+
+    async def __aexit__(self, exc_type, exc, tb):
+        if not self._task.done():
+            self._task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._task
+
+
+# Process sharding limits, see scrape_sharded
+SHARD_PROCESSES = int(os.getenv('SHARD_PROCESSES', os.cpu_count() or 1))
+SHARD_SIZE = int(os.getenv('SHARD_SIZE', 20))  # listings per shard
+SHARD_RETRIES = int(os.getenv('SHARD_RETRIES', 2))
+
+
+_shard_limiter = None
+
+
+def shard_limiter(processes):
+    """
+    Returns the HostLimiter of this worker process, created on first use.
+
+    Every worker process has its own limiter, so each one gets a share of
+    the politeness budget: 1/processes of the concurrent navigations per
+    host, with processes times the interval between them.
+    """
+    global _shard_limiter
+    if _shard_limiter is None:
+        _shard_limiter = HostLimiter(
+            max_concurrent=max(1, POLITENESS_MAX_CONCURRENT // processes),
+            min_interval=POLITENESS_MIN_INTERVAL * processes)
+    return _shard_limiter
+
+
+def scrape_shard(place_urls, concurrency=SCRAPE_CONCURRENCY, lean=LEAN_PROFILE,
+                 processes=1):
+    """
+    Worker process entry point of scrape_sharded: extracts place_urls with
+    this process's own browser, which get_browser_pool() keeps warm across
+    the shards the process is handed. Navigations go through the process's
+    share of the politeness limits (see shard_limiter), processes being the
+    number of worker processes running shards at the same time.
+
+    Returns:
+        dict: "rows" (asdict of each Business, None for failed listings, in
+        the order of place_urls), "stats" (traffic of the shard) and "spans"
+        (the span timings recorded while extracting)
+    """
+    pool = get_browser_pool()
+    stats = ScrapeStats(lean=lean)
+    limiter = shard_limiter(processes)
+
+    async def extract():
+        async with pool.context() as context:
+            async with scraping_profile(context, stats):
+                return await scrape_details(context, place_urls, concurrency,
+                                            limiter=limiter, lean=lean)
+
+    trace = Trace("shard", listings=len(place_urls))
+    token = _current_trace.set(trace)
+    try:
+        results = asyncio.run(pool.run(extract()))
+    finally:
+        _current_trace.reset(token)
+    if place_urls and all(business is None for business in results):
+        # Typically a dead browser rather than bad listings; let the shard be retried
+        raise RuntimeError(f"all {len(place_urls)} listings of the shard failed")
+    return {"rows": [asdict(business) if business is not None else None
+                     for business in results],
+            "stats": asdict(stats), "spans": trace.spans}
+
+
+async def run_process_shards(function, shards, processes=SHARD_PROCESSES,
+                             retries=SHARD_RETRIES, on_result=None):
+    """
+    Runs function(*args) for every args tuple in shards on a process pool.
+
+    A shard that raises, or whose worker process dies (which breaks the
+    whole pool), is resubmitted to a fresh pool up to `retries` times.
+    Workers are started with the spawn method, so function must be a module
+    level function and its arguments and result must be picklable.
+
+    Args:
+        function: Module level function run in the worker processes
+        shards: Argument tuples, one per call
+        processes: Maximum number of worker processes
+        retries: Extra attempts for a failed shard
+        on_result: Optional callback called with (shard_index, result) as
+            soon as each shard has finished
+
+    Returns:
+        list: The result of each shard in the order of shards (None for
+        shards that failed every attempt)
+    """
+    loop = asyncio.get_running_loop()
+    results = [None] * len(shards)
+    pending = list(range(len(shards)))
+    for attempt in range(retries + 1):
+        if not pending:
+            break
+        if attempt:
+            logging.warning(f"Retrying {len(pending)} failed shards (attempt {attempt + 1})")
+        failed = []
+        executor = concurrent.futures.ProcessPoolExecutor(
+            max_workers=max(1, min(processes, len(pending))),
+            mp_context=multiprocessing.get_context("spawn"))
+
+        async def run(index):
+            with span("shard", shard=index, attempt=attempt + 1) as attrs:
+                try:
+                    results[index] = await loop.run_in_executor(
+                        executor, function, *shards[index])
+                except Exception as e:
+                    logging.error(f"Shard {index} failed: {type(e).__name__} - {e}")
+                    attrs["error"] = f"{type(e).__name__}: {e}"
+                    failed.append(index)
+                    return
+            if on_result is not None:
+                on_result(index, results[index])
+
+        try:
+            await asyncio.gather(*(run(index) for index in pending))
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+        pending = sorted(failed)
+
+    if pending:
+        logging.error(f"{len(pending)} shards failed after {retries + 1} attempts")
+    return results
+
+
+async def scrape_sharded(searches, processes=SHARD_PROCESSES, pool=None,
+                         concurrency=SCRAPE_CONCURRENCY, lean=LEAN_PROFILE,
+                         shard_size=SHARD_SIZE, retries=SHARD_RETRIES,
+                         lead_index=None, reuse_leads=True, on_business=None):
+    """
+    Scrapes several searches with the detail extraction spread over processes.
+
+    The result feeds are read first, one browser context per search on pool.
+    The place URLs that are not known yet are split into shards of
+    shard_size listings, and the shards of all searches are extracted by up
+    to `processes` worker processes, each driving its own browser (see
+    scrape_shard). Failed shards are retried (see run_process_shards), and a
+    listing returned by several searches is extracted only once.
+
+    Unlike scrape_business, searches are not checkpointed (the lead index
+    covers reruns). The feeds share one HostLimiter, and every worker
+    process applies its share of the politeness limits (see shard_limiter).
+
+    Args:
+        searches: (query, num_results) pairs
+        processes: Maximum number of worker processes
+        pool: Optional BrowserPool the result feeds are read on; a temporary
+            one is used otherwise
+        concurrency: Listing pages extracted at the same time per process
+        lean: Use the lean scraping profile
+        shard_size: Listings per shard
+        retries: Extra attempts for a failed shard
+        lead_index: Optional LeadIndex; extracted leads are added to it
+        reuse_leads: Take listings the lead_index knows from it (see
+            scrape_business)
+        on_business: Optional callback receiving (query, business) for the
+            rows of each search in feed order, as soon as they are available
+
+    Returns:
+        dict: query -> BusinessList in feed order, in the order of searches
+    """
+    own_pool = pool is None
+    pool = pool or BrowserPool()
+    limiter = HostLimiter()
+
+    async def collect(query, total):
+        stats = ScrapeStats(lean=lean)
+
+        async def in_pool():
+            async with pool.context() as context:
+                async with scraping_profile(context, stats):
+                    page = await open_page(context, lean)
+                    return await collect_place_urls(page, query, total, WaitTimer(),
+                                                    stats, limiter)
+
+        try:
+            place_urls = await pool.run(in_pool())
+        except Exception as e:
+            logging.error(f"Failed to read the result feed for '{query}': {e}")
+            place_urls = None
+        stats.listings_found = len(place_urls or [])
+        return place_urls, stats
+
+    with span("sharded_scrape", searches=len(searches), processes=processes) as attrs:
+        try:
+            with span("collect", searches=len(searches)):
+                collected = await asyncio.gather(*(collect(query, total)
+                                                   for query, total in searches))
+        finally:
+            if own_pool:
+                await asyncio.to_thread(pool.close)
+
+        settled = {}
+        if lead_index is not None and reuse_leads:
+            settled = lead_index.get_many(
+                url for place_urls, _ in collected for url in place_urls or [])
+        from_index = set(settled)
+        shard_urls = []
+        shard_owner = []  # index into collected of each shard's search
+        assigned = set(settled)
+        for position, (place_urls, stats) in enumerate(collected):
+            pending = [url for url in place_urls or [] if url not in assigned]
+            assigned.update(pending)
+            stats.cached_rows = len(place_urls or []) - len(pending)
+            for start in range(0, len(pending), shard_size):
+                shard_urls.append(pending[start:start + shard_size])
+                shard_owner.append(position)
+        workers = max(1, min(processes, len(shard_urls)))
+        shards = [(urls, concurrency, lean, workers) for urls in shard_urls]
+        attrs.update(shards=len(shards), listings=len(assigned))
+        logging.info(f"Extracting {len(assigned) - len(settled)} listings of "
+                     f"{len(searches)} searches in {len(shards)} shards on "
+                     f"{workers} processes")
+
+        released = [0] * len(searches)
+
+        def release():
+            for position, ((query, _), (place_urls, _)) in enumerate(zip(searches, collected)):
+                place_urls = place_urls or []
+                while released[position] < len(place_urls) and place_urls[released[position]] in settled:
+                    business = settled[place_urls[released[position]]]
+                    released[position] += 1
+                    if business is not None and on_business is not None:
+                        on_business(query, business)
+
+        def record(index, result):
+            for url, row in zip(shards[index][0], result["rows"]):
+                settled[url] = business_from_dict(row) if row is not None else None
+            stats = collected[shard_owner[index]][1]
+            for key in ("requests", "blocked_requests", "bytes_transferred"):
+                setattr(stats, key, getattr(stats, key) + result["stats"][key])
+            trace = current_trace()
+            if trace is not None:
+                for shard_span in result["spans"]:
+                    trace.record(shard_span)
+            release()
+
+        release()
+        await run_process_shards(scrape_shard, shards, processes, retries, record)
+        for place_urls, *_ in shards:
+            for url in place_urls:
+                settled.setdefault(url, None)  # failed shards
+        release()
+
+    results = {}
+    for (query, _), (place_urls, stats) in zip(searches, collected):
+        business_list = BusinessList(stats=stats)
+        for url in place_urls or []:
+            if settled.get(url) is not None:
+                business_list.append(settled[url])
+        stats.complete = (place_urls is not None
+                          and business_list.get_row_size() == len(place_urls))
+        business_list.normalize_phones()
+        extracted = [business for business in business_list.business_list
+                     if business.place_url not in from_index]
+        if lead_index is not None and extracted:
+            lead_index.add_many(extracted)
+        results[query] = business_list
+    return results
+
+
+async def sharded_scrape_business(search_term, total, processes=SHARD_PROCESSES,
+                                  on_business=None, **shard_kwargs):
+    """
+    scrape_sharded for a single search, called like scrape_business (so it
+    can be passed to ScrapeStream as scrape). Keyword arguments are passed
+    through to scrape_sharded.
+    """
+    results = await scrape_sharded(
+        [(search_term, total)], processes,
+        on_business=None if on_business is None else lambda _, business: on_business(business),
+        **shard_kwargs)
+    return results[search_term]
+
+
+# Website enrichment limits, see enrich_businesses
+ENRICH_CONCURRENCY = int(os.getenv('ENRICH_CONCURRENCY', 50))  # open connections in total
+ENRICH_PER_HOST = int(os.getenv('ENRICH_PER_HOST', 2))  # open connections per host
+ENRICH_TIMEOUT = float(os.getenv('ENRICH_TIMEOUT', 10))  # seconds per page
+ENRICH_MAX_BYTES = int(os.getenv('ENRICH_MAX_BYTES', 1_000_000))  # bytes read per page
+ENRICH_CACHE_TTL = int(os.getenv('ENRICH_CACHE_TTL', 7 * 24 * 3600))  # seconds
+ENRICH_CACHE_MAX_ENTRIES = int(os.getenv('ENRICH_CACHE_MAX_ENTRIES', 5000))
+ENRICH_USER_AGENT = os.getenv('ENRICH_USER_AGENT', 'Mozilla/5.0 (compatible; lead-agent/1.0)')
+
+EMAIL_PATTERN = re.compile(r"[A-Za-z0-9._%+-]+@[A-Za-z0-9-]+(?:\.[A-Za-z0-9-]+)*\.[A-Za-z]{2,}")
+# Retina image names like logo@2x.png look like email addresses
+NOT_EMAIL_SUFFIXES = (".png", ".jpg", ".jpeg", ".gif", ".svg", ".webp")
+HREF_PATTERN = re.compile(r"""href\s*=\s*["']([^"'#]+)""", re.I)
+SOCIAL_DOMAINS = ("facebook.com", "instagram.com", "linkedin.com", "twitter.com",
+                  "x.com", "youtube.com", "tiktok.com", "pinterest.com")
+# Share buttons link to these paths, not to the business's own profile
+SOCIAL_SHARE_PATHS = ("/sharer", "/share", "/intent", "/dialog", "/plugins")
+CONTACT_PATH_PATTERN = re.compile(r"contact|kontakt|contacto|impressum", re.I)
+
+
+def website_url(website):
+    """Returns the URL of a website as shown on Maps (often just example.com)"""
+    website = website.strip()
+    return website if "://" in website else f"http://{website}"
+
+
+def social_domain(hostname):
+    """Returns the social network domain of hostname, or None"""
+    hostname = (hostname or "").lower()
+    return next((domain for domain in SOCIAL_DOMAINS
+                 if hostname == domain or hostname.endswith(f".{domain}")), None)
+
+
+def extract_contacts(text, base_url):
+    """
+    Finds email addresses and social profile links in a web page.
+
+    Returns:
+        tuple: (emails, social_links, contact_url), contact_url being a link
+        to a contact page on the same site, or None
+    """
+    text = html.unescape(text)
+    emails = {}
+    for email in EMAIL_PATTERN.findall(text):
+        email = email.lower()
+        if not email.endswith(NOT_EMAIL_SUFFIXES):
+            emails.setdefault(email)
+
+    social_links = {}
+    contact_url = None
+    site = urllib.parse.urlsplit(base_url).hostname
+    for href in HREF_PATTERN.findall(text):
+        url = urllib.parse.urljoin(base_url, href.strip())
+        parts = urllib.parse.urlsplit(url)
+        if parts.scheme not in ("http", "https"):
+            continue
+        if social_domain(parts.hostname):
+            path = parts.path.rstrip("/")
+            if path and not path.lower().startswith(SOCIAL_SHARE_PATHS):
+                social_links.setdefault(f"https://{parts.hostname.lower()}{path}")
+        elif (contact_url is None and parts.hostname == site
+              and CONTACT_PATH_PATTERN.search(parts.path)):
+            contact_url = url
+    return list(emails), list(social_links), contact_url
+
+
+class PageCache(ScrapeCache):
+    """
+    On-disk cache of fetched web pages keyed by URL, with the expiry and
+    eviction of ScrapeCache. Only successfully fetched HTML pages are stored,
+    so failed sites are retried on the next run.
+
+    put() does not evict: a run storing hundreds of pages calls evict() once
+    at the end instead of scanning the directory after every page.
+    """
+
+    def __init__(self, directory=CACHE_DIR, ttl=ENRICH_CACHE_TTL,
+                 max_entries=ENRICH_CACHE_MAX_ENTRIES):
+        super().__init__(directory, ttl, max_entries)
+        self.directory = os.path.join(directory, "pages")
+
+    def _path(self, url):
+        return os.path.join(self.directory,
+                            f"{hashlib.sha1(url.encode('utf-8')).hexdigest()[:24]}.json")
+
+    def get(self, url):
+        """Returns (final_url, text) of a cached page, or None if missing or expired"""
+        path = self._path(url)
+        try:
+            with open(path, encoding="utf-8") as fp:
+                entry = json.load(fp)
+        except (OSError, ValueError):
+            return None
+        if time.time() - entry.get("saved_at", 0) > self.ttl:
+            with contextlib.suppress(OSError):
+                os.remove(path)
+            return None
+        with contextlib.suppress(OSError):
+            os.utime(path)  # mark as recently used
+        return entry["final_url"], entry["text"]
+
+    def put(self, url, final_url, text):
+        """Stores the page fetched from url (after redirects, from final_url)"""
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(url)
+        tmp_path = f"{path}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as fp:
+                json.dump({"url": url, "final_url": final_url, "text": text,
+                           "saved_at": time.time()}, fp)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logging.error(f"Failed to write page cache entry: {e}")
+
+
+@dataclass
+class EnrichStats:
+    """Figures collected while enriching one list of businesses"""
+    sites: int = 0
+    fetched: int = 0
+    cached: int = 0
+    failed: int = 0
+    truncated: int = 0
+    bytes_downloaded: int = 0
+    with_emails: int = 0
+    with_social_links: int = 0
+    seconds: float = 0.0
+
+    def summary(self):
+        """Returns a one-line human readable summary"""
+        return (f"{self.sites} sites in {self.seconds:.1f}s: {self.fetched} pages fetched, "
+                f"{self.cached} from cache, {self.failed} failed, "
+                f"{self.bytes_downloaded / 1_000_000:.2f} MB; "
+                f"{self.with_emails} with emails, {self.with_social_links} with social links")
+
+
+async def fetch_page(session, url, max_bytes=ENRICH_MAX_BYTES, cache=None, stats=None):
+    """
+    Fetches an HTML page, reading at most max_bytes of it.
+
+    The cache is read and written in a worker thread, so its file IO does
+    not hold up the other fetches on the event loop.
+
+    Returns:
+        tuple: (final_url, text), or None if the response is not a 200 HTML page.
+        Network errors, timeouts and server errors (5xx) are raised.
+    """
+    cached = await asyncio.to_thread(cache.get, url) if cache is not None else None
+    if cached is not None:
+        if stats is not None:
+            stats.cached += 1
+        return cached
+
+    async with session.get(url) as response:
+        if response.status >= 500:
+            response.raise_for_status()
+        if response.status != 200 or "html" not in response.content_type:
+            return None
+        body = bytearray()
+        async for chunk in response.content.iter_chunked(64 * 1024):
+            body += chunk
+            if len(body) >= max_bytes:
+                if stats is not None:
+                    stats.truncated += 1
+                break
+        final_url = str(response.url)
+        try:
+            text = bytes(body[:max_bytes]).decode(response.charset or "utf-8", errors="replace")
+        except LookupError:  # unknown charset
+            text = bytes(body[:max_bytes]).decode("utf-8", errors="replace")
+
+    if stats is not None:
+        stats.fetched += 1
+        stats.bytes_downloaded += len(body)
+    if cache is not None:
+        await asyncio.to_thread(cache.put, url, final_url, text)
+    return final_url, text
+
+
+async def enrich_businesses(businesses, concurrency=ENRICH_CONCURRENCY,
+                            per_host=ENRICH_PER_HOST, timeout=ENRICH_TIMEOUT,
+                            max_bytes=ENRICH_MAX_BYTES, cache=None,
+                            follow_contact=True):
+    """
+    Fetches the website of every business and fills in its emails and
+    social_links.
+
+    All sites are fetched at once over one pooled aiohttp session, with at
+    most concurrency requests in flight and per_host connections per host.
+    Businesses sharing a website fetch it once. If the home page has no
+    email address, a contact page it links to is fetched as well. Websites
+    that are social profiles themselves are recorded without fetching.
+    Businesses already enriched (emails not None) are skipped; a site that
+    cannot be fetched leaves them unenriched so a later run retries it.
+
+    Args:
+        businesses: Business objects, edited in place
+        concurrency: Maximum open connections in total
+        per_host: Maximum open connections per host
+        timeout: Seconds allowed per page once its request has started
+        max_bytes: Bytes read per page; the rest of larger pages is ignored
+        cache: PageCache of fetched pages (default: PageCache()), False to disable
+        follow_contact: Fetch a linked contact page when the home page has no email
+
+    Returns:
+        EnrichStats
+    """
+    import aiohttp  # optional dependency, only needed for enrichment
+
+    start = time.perf_counter()
+    cache = PageCache() if cache is None else cache or None
+    stats = EnrichStats()
+    pending = [business for business in businesses
+               if business.website and business.emails is None]
+    stats.sites = len({website_url(business.website) for business in pending})
+    pages = {}
+    # Requests wait here rather than in the connector, so time spent queueing
+    # does not count against their timeout
+    in_flight = asyncio.Semaphore(concurrency)
+
+    async def fetch_bounded(url):
+        async with in_flight:
+            return await fetch_page(session, url, max_bytes, cache, stats)
+
+    connector = aiohttp.TCPConnector(limit=concurrency, limit_per_host=per_host,
+                                     ttl_dns_cache=300)
+    async with aiohttp.ClientSession(
+            connector=connector, timeout=aiohttp.ClientTimeout(total=timeout),
+            headers={"User-Agent": ENRICH_USER_AGENT}) as session:
+
+        def fetch(url):
+            """Shares one fetch per URL between the businesses that need it"""
+            if url not in pages:
+                pages[url] = asyncio.ensure_future(fetch_bounded(url))
+            return pages[url]
+
+        async def enrich(business):
+            url = website_url(business.website)
+            parts = urllib.parse.urlsplit(url)
+            if social_domain(parts.hostname):
+                business.emails = ""
+                business.social_links = f"https://{parts.hostname.lower()}{parts.path.rstrip('/')}"
+                return
+            with span("enrich_site", url=url) as attrs:
+                try:
+                    emails, social_links, contact_url = [], [], None
+                    page = await fetch(url)
+                    if page is not None:
+                        emails, social_links, contact_url = extract_contacts(page[1], page[0])
+                    if follow_contact and not emails and contact_url:
+                        contact_page = await fetch(contact_url)
+                        if contact_page is not None:
+                            more_emails, more_links, _ = extract_contacts(contact_page[1], contact_page[0])
+                            emails = more_emails
+                            social_links += [link for link in more_links if link not in social_links]
+                except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+                    attrs["error"] = f"{type(e).__name__}: {e}"
+                    logging.debug(f"Could not fetch {url}: {type(e).__name__} - {e}")
+                    return
+                attrs.update(emails=len(emails), social_links=len(social_links))
+            business.emails = "; ".join(emails)
+            business.social_links = "; ".join(social_links)
+
+        with span("enrich", sites=stats.sites):
+            await asyncio.gather(*(enrich(business) for business in pending))
+
+    if cache is not None and stats.fetched:
+        await asyncio.to_thread(cache.evict)
+
+    stats.failed = sum(business.emails is None for business in pending)
+    stats.with_emails = sum(bool(business.emails) for business in pending)
+    stats.with_social_links = sum(bool(business.social_links) for business in pending)
+    stats.seconds = time.perf_counter() - start
+    logging.info(f"Enrichment: {stats.summary()}")
+    return stats
+
+
+# Plan cache limits, see PlanCache
+PLAN_CACHE_TTL = int(os.getenv('PLAN_CACHE_TTL', 3600))  # seconds
+PLAN_CACHE_MAX_ENTRIES = int(os.getenv('PLAN_CACHE_MAX_ENTRIES', 256))
+DEFAULT_NUM_RESULTS = 20
+
+
+class Planner:
+    """
+    Turns a natural language request into planned tool calls.
+
+    plan() returns (planned_calls, text_output), or None if this planner
+    cannot handle the request and the next planner should be tried.
+    """
+
+    name = None
+
+    async def plan(self, user_input: str):
+        raise NotImplementedError
+
+
+class RuleBasedPlanner(Planner):
+    """
+    Deterministic fast path for plain searches such as "find cafes in
+    Islamabad" or "Show me barber shops in Malakand, maybe 10 of them". The
+    request must start with a search verb or give a result count, and the
+    place type must be a short noun phrase (at most four words). Anything
+    else ("cafes in Islamabad", "jokes in French"), questions, and requests
+    that ask for messaging or need interpretation ("clients", "leads") are
+    left to the next planner.
+    """
+
+    name = "rules"
+
+    SEARCH_PATTERN = re.compile(r"""
+        ^(?:please\s+)?
+        (?:(?P<verb>find|show|search(?:\s+for)?|get|look\s+for|list)\s+(?:me\s+)?)?
+        (?:(?:the\s+)?(?:top\s+|first\s+)?(?P<count_before>\d+)\s+)?
+        (?P<place_type>[a-z][a-z&'\-]*(?:\ [a-z&'\-]+){0,3}?)
+        \s+(?P<preposition>in|near)\s+
+        (?P<location>[a-z][a-z.'\-\ ]*?)
+        (?:\s*,?\s*(?:maybe\s+|about\s+|around\s+)?(?P<count_after>\d+)
+            (?:\s+of\s+them|\s+results?|\s+places?)?)?
+        \s*[.!]?$""", re.IGNORECASE | re.VERBOSE)
+
+    # Requests containing these need the LLM to interpret or to message
+    LLM_ONLY_WORDS = re.compile(
+        r"\b(send|message|whatsapp|client|clients|lead|leads|customer|customers|need|needing)\b|[\"'+]",
+        re.IGNORECASE)
+
+    # Questions and instructions that are not searches, even if they end in "in <place>"
+    NOT_A_SEARCH_START = re.compile(
+        r"^(?:what|what's|whats|how|why|when|where|who|which|is|are|was|were|do|does|did|"
+        r"can|could|would|should|will|tell|translate|explain|write|say|describe|give)\b",
+        re.IGNORECASE)
+
+    async def plan(self, user_input: str):
+        text = " ".join(user_input.split())
+        if self.LLM_ONLY_WORDS.search(text) or self.NOT_A_SEARCH_START.match(text):
+            return None
+        match = self.SEARCH_PATTERN.match(text)
+        if not match:
+            return None
+
+        count = match.group("count_before") or match.group("count_after")
+        if not (match.group("verb") or count):
+            return None  # e.g. "hello in spanish", no sign that it is a search
+        query = (f"{match.group('place_type')} {match.group('preposition').lower()} "
+                 f"{match.group('location').strip()}")
+        return [{
+            "function_name": "search_Maps",
+            "args": {"query": query,
+                     "num_results": int(count) if count else DEFAULT_NUM_RESULTS},
+        }], ""
+
+
+def plain_value(value):
+    """Converts protobuf containers in LLM function call args to plain lists and dicts"""
+    if isinstance(value, (str, bytes, int, float, bool)) or value is None:
+        return value
+    if hasattr(value, "items"):
+        return {key: plain_value(item) for key, item in value.items()}
+    if hasattr(value, "__iter__"):
+        return [plain_value(item) for item in value]
+    return value
+
+
+class GeminiPlanner(Planner):
+    """Plans with the Gemini model and the search_Maps / prepare_whatsapp_message tools"""
+
+    name = "gemini"
+
+    async def plan(self, user_input: str):
+        planned_calls = []
+        llm_text_output = ""  # To store any textual response from the LLM
+
+        try:
+            # --- Updated Prompt ---
+            prompt = f"""Analyze the following user request for lead generation using the available tools: 'search_Maps' and 'prepare_whatsapp_message'.
+
+            **CRITICAL TASK:** Interpret the user's request to identify the **type of business or place** they are actually looking for on Google Maps, especially when they use terms like 'clients' or 'leads'. Formulate the most effective search query for the 'search_Maps' tool.
+
+            **Interpretation Examples:**
+            - User: "find me graphic design clients in New York" -> Your interpretation: The user wants businesses that *are* graphic designers or *hire* them. -> **Search Query:** "graphic designers in New York" OR "graphic design agency in New York"
+            - User: "look for companies needing marketing services in London" -> Your interpretation: The user wants potential clients for marketing. -> **Search Query:** "marketing agency in London" OR "businesses in London" (less specific, might need clarification)
+            - User: "get me plumbing leads in Chicago" -> Your interpretation: The user wants plumbing businesses. -> **Search Query:** "plumbers in Chicago" OR "plumbing companies in Chicago"
+            - User: "find cafes in Islamabad and send message X" -> Your interpretation: Direct request. -> **Search Query:** "cafes in Islamabad"
+
+            **User Request:** "{user_input}"
+
+            **Your Steps:**
+            1.  Carefully analyze the User Request.
+            2.  Determine the core action(s): Search Maps, Prepare WhatsApp message, or Both.
+            3.  **If searching:** Formulate the best possible `query` string for Google Maps based on your interpretation (as shown in examples) and identify the `location`. Determine `num_results` (default 20 if unspecified).
+            4.  **If messaging:** Extract the `message` content, the limit `k`, or specific `target_numbers`.
+            5.  Identify the correct function(s) ('search_Maps', 'prepare_whatsapp_message') to call and construct their arguments precisely.
+            6.  If the plan involves searching and then messaging those results, ensure 'search_Maps' is called first.
+            """
+            # --- End of Updated Prompt ---
+
+            response = await get_model().generate_content_async(prompt)
+
+            # (Rest of the function to parse response remains the same...)
+            # Iterate through the parts of the response candidate
+            if response.candidates and response.candidates[0].content.parts:
+                for part in response.candidates[0].content.parts:
+                    # --- Check for Function Call FIRST ---
+                    if part.function_call:
+                        call = part.function_call
+                        function_name = call.name
+                        args = {key: plain_value(value) for key, value in call.args.items()} if hasattr(call, 'args') else {}
+
+                        if function_name == "search_Maps" and "num_results" not in args:
+                            args["num_results"] = DEFAULT_NUM_RESULTS
+
+                        planned_calls.append({
+                            "function_name": function_name,
+                            "args": args
+                        })
+                    # --- If not a function call, check for text ---
+                    elif hasattr(part, 'text'):
+                        llm_text_output += part.text + "\n"
+
+            if not planned_calls and not llm_text_output:
+                try:
+                    llm_text_output = response.text
+                except ValueError as ve:
+                    llm_text_output = f"LLM response contained a function call but no text. ({ve})"
+                except Exception as text_exc:
+                     llm_text_output = f"Could not extract text response: {text_exc}"
+
+        except Exception as e:
+            error_message = f"An error occurred during LLM interaction: {type(e).__name__} - {str(e)}"
+            logging.error(error_message)
+            return [], error_message
+
+        return planned_calls, llm_text_output.strip()
+
+
+class PlanCache:
+    """
+    In-memory LRU cache of planned calls keyed by the exact (trimmed) user
+    input, with a TTL. The input is not normalized further: plans carry text
+    taken from it verbatim (message contents), so inputs differing only in
+    case or spacing must not share a plan.
+    """
+
+    def __init__(self, ttl=PLAN_CACHE_TTL, max_entries=PLAN_CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user_input):
+        key = user_input.strip()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            saved_at, planned_calls = entry
+            if time.monotonic() - saved_at > self.ttl:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return copy.deepcopy(planned_calls)
+
+    def put(self, user_input, planned_calls):
+        key = user_input.strip()
+        with self._lock:
+            self._entries[key] = (time.monotonic(), copy.deepcopy(planned_calls))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+class PlannerStats:
+    """Counts cache hits and per-planner latency"""
+
+    def __init__(self):
+        self.cache_hits = 0
+        self.requests = 0
+        self.calls = collections.Counter()
+        self.seconds = collections.Counter()
+        self.last_source = None
+        self.last_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, source, seconds):
+        with self._lock:
+            self.requests += 1
+            if source == "cache":
+                self.cache_hits += 1
+            self.calls[source] += 1
+            self.seconds[source] += seconds
+            self.last_source = source
+            self.last_seconds = seconds
+
+    @property
+    def hit_rate(self):
+        return self.cache_hits / self.requests if self.requests else 0.0
+
+    def summary(self):
+        """Returns a one-line summary of the last plan and the totals so far"""
+        latencies = ", ".join(
+            f"{source} {self.calls[source]}x avg {self.seconds[source] / self.calls[source] * 1000:.0f}ms"
+            for source in self.calls)
+        return (f"Planned by {self.last_source} in {self.last_seconds * 1000:.0f}ms. "
+                f"Cache hit rate {self.hit_rate:.0%} over {self.requests} requests ({latencies})")
+
+
+class AgentPlanner:
+    """
+    Plans requests with a PlanCache in front of a chain of planners.
+
+    Planners are tried in order (by default the rule based fast path, then
+    Gemini); the first that returns a plan wins. Plans with tool calls are
+    cached; text-only answers and errors are not.
+    """
+
+    def __init__(self, planners=None, cache=None):
+        self.planners = planners or [RuleBasedPlanner(), GeminiPlanner()]
+        self.cache = cache or PlanCache()
+        self.stats = PlannerStats()
+
+    async def plan(self, user_input: str):
+        with span("plan") as attrs:
+            start = time.perf_counter()
+            planned_calls = self.cache.get(user_input)
+            if planned_calls is not None:
+                self.stats.record("cache", time.perf_counter() - start)
+                attrs["planner"] = "cache"
+                return planned_calls, ""
+
+            for planner in self.planners:
+                result = await planner.plan(user_input)
+                if result is None:
+                    continue
+                planned_calls, text_output = result
+                if planned_calls:
+                    self.cache.put(user_input, planned_calls)
+                seconds = time.perf_counter() - start
+                self.stats.record(planner.name, seconds)
+                attrs["planner"] = planner.name
+                logging.info(f"Planned request with {planner.name} in {seconds * 1000:.0f}ms")
+                return planned_calls, text_output
+
+            return [], "No planner could handle the request."
+
+
+@process_resource
+def get_planner():
+    """Returns the process-wide AgentPlanner, so its cache is shared by all sessions"""
+    return AgentPlanner()
+
+
+async def get_agent_plan(user_input: str):
+    """
+    Processes user input to determine intent and extract parameters.
+    Served from the plan cache or the rule based fast path when possible,
+    otherwise by the LLM. Returns (planned_calls, text_output).
+    """
+    return await get_planner().plan(user_input)
+
+
+# Number of searches a batch runs at the same time
+BATCH_WORKERS = int(os.getenv('BATCH_WORKERS', 2))
+# Number of batch requests planned at the same time
+BATCH_PLANNING_CONCURRENCY = int(os.getenv('BATCH_PLANNING_CONCURRENCY', 4))
+
+
+@dataclass
+class BatchResult(BusinessList):
+    """Combined BusinessList of a batch run, remembering the search behind each row"""
+    row_queries: list[str] = field(default_factory=list)
+    searches: dict = field(default_factory=dict)  # query -> number of rows
+
+    def add(self, query, business_list):
+        """Appends the rows of one search, skipping leads an earlier search already returned"""
+        seen = {business.lead_key() for business in self.business_list}
+        added = 0
+        for business in business_list.business_list:
+            if business.lead_key() in seen:
+                continue
+            seen.add(business.lead_key())
+            self.row_queries.append(query)
+            self.append(business)
+            added += 1
+        self.searches[query] = added
+
+    def leading_columns(self):
+        """Puts the query behind each row in a leading query column"""
+        return {"query": self.row_queries}
+
+
+def parse_num_results(value, default=DEFAULT_NUM_RESULTS):
+    """
+    Returns value as a positive int, or default if it is missing or invalid.
+    Numbers and numeric strings are accepted, floats included (Gemini may
+    send 10.0 or "10.0").
+    """
+    try:
+        num_results = int(float(value) if isinstance(value, str) else value)
+    except (ValueError, TypeError, OverflowError):
+        return default
+    return num_results if num_results > 0 else default
+
+
+def read_query_list(text):
+    """Splits an uploaded or CLI query list into requests, one per non-empty, non-# line"""
+    return [line.strip() for line in text.splitlines()
+            if line.strip() and not line.strip().startswith("#")]
+
+
+async def plan_batch(requests, planner=None):
+    """
+    Plans every request and returns the distinct searches as (query, num_results).
+
+    Searches with the same normalized query are merged, keeping the largest
+    num_results. Messaging calls are ignored in batch mode.
+    """
+    planner = planner or get_planner()
+    semaphore = asyncio.Semaphore(BATCH_PLANNING_CONCURRENCY)
+
+    async def plan(request):
+        async with semaphore:
+            return await planner.plan(request)
+
+    plans = await asyncio.gather(*(plan(request) for request in requests))
+
+    searches = {}
+    planned_searches = 0
+    for request, (planned_calls, _) in zip(requests, plans):
+        search_calls = [call for call in planned_calls
+                        if call["function_name"] == "search_Maps"
+                        and call["args"].get("query")]
+        planned_searches += len(search_calls)
+        if not search_calls:
+            logging.warning(f"No search planned for batch request '{request}'")
+        for call in search_calls:
+            query = call["args"]["query"]
+            num_results = parse_num_results(call["args"].get("num_results"))
+            key = normalize_query(query)
+            if key in searches:
+                query = searches[key][0]
+                num_results = max(num_results, searches[key][1])
+            searches[key] = (query, num_results)
+
+    logging.info(f"Planned {len(searches)} distinct searches from {len(requests)} "
+                 f"requests ({planned_searches - len(searches)} duplicates merged)")
+    return list(searches.values())
+
+
+async def run_batch(requests, workers=BATCH_WORKERS, pool=None, use_cache=True,
+                    on_progress=None, processes=1, enrich=False, **scrape_kwargs):
+    """
+    Plans and scrapes a list of requests as one batch.
+
+    Distinct searches run on up to `workers` scrapers at once, sharing the
+    browser pool and one HostLimiter so concurrent searches stay polite to
+    Google Maps. With processes > 1 the detail extraction of all searches is
+    sharded over that many worker processes instead (see scrape_sharded);
+    fully cached searches are still served from the cache. Without use_cache
+    every listing is extracted again, even if the lead index knows it. on_progress, if
+    given, is called with (query, business_list, searches_done,
+    searches_total) after each search. With enrich the combined rows are
+    enriched from their websites (see enrich_businesses). Other keyword
+    arguments are passed through to scrape_business (scrape_sharded with
+    processes > 1).
+
+    Returns:
+        BatchResult: All rows, grouped by search in the order of the requests
+    """
+    start = time.perf_counter()
+    searches = await plan_batch(requests)
+    limiter = HostLimiter()
+    scrape = cached_scrape_business if use_cache else scrape_business
+    scrape_kwargs.setdefault("reuse_leads", use_cache)
+    semaphore = asyncio.Semaphore(max(1, workers))
+    results = {}
+
+    def report(query, business_list):
+        results[query] = business_list
+        if on_progress is not None:
+            on_progress(query, business_list, len(results), len(searches))
+
+    async def run_search(query, num_results):
+        async with semaphore:
+            business_list = await scrape(query, num_results, pool=pool,
+                                         limiter=limiter, **scrape_kwargs)
+        report(query, business_list)
+
+    if processes > 1:
+        cache = ScrapeCache() if use_cache else None
+        to_scrape = []
+        for query, num_results in searches:
+            business_list = cache_hit(cache.get(query), num_results) if cache else None
+            if business_list is None:
+                to_scrape.append((query, num_results))
+            else:
+                report(query, business_list)
+        scraped = await scrape_sharded(to_scrape, processes, pool=pool, **scrape_kwargs)
+        for query, num_results in to_scrape:
+            if (cache is not None and scraped[query].business_list
+                    and scraped[query].stats.complete):
+                cache.put(query, num_results, scraped[query])
+            report(query, scraped[query])
+    else:
+        await asyncio.gather(*(run_search(query, num_results)
+                               for query, num_results in searches))
+
+    batch = BatchResult()
+    for query, _ in searches:
+        batch.add(query, results[query])
+    batch.normalize_phones()  # flags duplicates across searches
+    if enrich:
+        await batch.enrich_websites()
+        if scrape_kwargs.get("lead_index") is not None:
+            scrape_kwargs["lead_index"].add_many(batch.business_list, extracted=False)
+    logging.info(f"Batch of {len(searches)} searches returned {batch.get_row_size()} "
+                 f"rows in {time.perf_counter() - start:.1f}s with "
+                 f"{f'{processes} processes' if processes > 1 else f'{workers} workers'}")
+    return batch
+
+
+def results_filename(business_list, query):
+    """Builds the output file name of a search, e.g. (20_Rows)__20250101_120000__(cafes_in_islamabad)"""
+    current_datetime = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+    search_for_filename = query.replace(' ', '_').replace('/','_') # Basic sanitization
+    return f"({business_list.get_row_size()}_Rows)__{current_datetime}__({search_for_filename})"
+
+
+def export_business_list(business_list, filename, export_format="xlsx"):
+    """Saves business_list as xlsx, csv or parquet and returns the file path (None on failure)"""
+    save = {"xlsx": business_list.save_to_excel,
+            "csv": business_list.save_to_csv,
+            "parquet": business_list.save_to_parquet}[export_format]
+    return save(filename)
+
+
+def batch_filename(batch):
+    """Builds the output file name of a batch run, like the single search files"""
+    current_datetime = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+    return (f"({batch.get_row_size()}_Rows)__{current_datetime}__"
+            f"(batch_of_{len(batch.searches)}_searches)")
+
+
+def batch_cli(argv):
+    """Command line entry point: python lead_agent.py batch QUERY_FILE [options]"""
+    parser = argparse.ArgumentParser(
+        prog="lead_agent.py batch",
+        description="Run a list of searches as one batch and write a combined output file.")
+    parser.add_argument("queries",
+                        help="Text file with one request per line, e.g. 'cafes in islamabad, 20' ('-' for stdin)")
+    parser.add_argument("--workers", type=int, default=BATCH_WORKERS,
+                        help=f"Searches scraped at the same time (default: {BATCH_WORKERS})")
+    parser.add_argument("--concurrency", type=int, default=SCRAPE_CONCURRENCY,
+                        help=f"Listing pages per search (default: {SCRAPE_CONCURRENCY})")
+    parser.add_argument("--processes", type=int, default=1,
+                        help=f"Shard listing extraction over this many processes, each with "
+                             f"its own browser (default: 1, {SHARD_PROCESSES} cores available)")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="Always scrape instead of serving cached results")
+    parser.add_argument("--full-profile", action="store_true",
+                        help="Load images, tiles and fonts (disable the lean profile)")
+    parser.add_argument("--enrich", action="store_true",
+                        help="Fetch each lead's website for emails and social links")
+    parser.add_argument("--format", choices=["xlsx", "csv", "parquet"], default="xlsx",
+                        help="Output format (default: xlsx)")
+    args = parser.parse_args(argv)
+
+    if args.queries == "-":
+        requests = read_query_list(sys.stdin.read())
+    else:
+        with open(args.queries, encoding="utf-8") as fp:
+            requests = read_query_list(fp.read())
+    if not requests:
+        parser.error("the query list is empty")
+
+    # The rows of every finished search are appended to a partial CSV, so an
+    # interrupted batch keeps them; it is removed once the output is saved
+    partial = BatchResult()
+    partial_filename = (f"(partial)__{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}__"
+                        f"(batch_of_{len(requests)}_requests)")
+    partial_path = None
+
+    def report(query, business_list, done, total):
+        nonlocal partial_path
+        print(f"[{done}/{total}] {query}: {business_list.get_row_size()} rows")
+        partial.add(query, business_list)
+        partial_path = partial.save_to_csv(partial_filename, append=True) or partial_path
+
+    pool = BrowserPool(max_contexts=args.workers)
+    with tracing("batch", requests=len(requests), workers=args.workers) as trace:
+        try:
+            batch = asyncio.run(run_batch(
+                requests, workers=args.workers, pool=pool,
+                use_cache=not args.no_cache, on_progress=report,
+                processes=args.processes, enrich=args.enrich,
+                concurrency=args.concurrency,
+                lean=not args.full_profile, lead_index=LeadIndex()))
+        except BaseException:
+            if partial_path is not None:
+                print(f"Rows of the finished searches are in {partial_path}", file=sys.stderr)
+            raise
+        finally:
+            pool.close()
+
+        path = export_business_list(batch, batch_filename(batch), args.format)
+    if path is None:
+        sys.exit(f"Failed to save {args.format} output, see the log"
+                 + (f"; the rows are also in {partial_path}" if partial_path else ""))
+    if partial_path is not None:
+        with contextlib.suppress(OSError):
+            os.remove(partial_path)
+    print(f"Saved {batch.get_row_size()} rows to {path}")
+    print(f"\nTiming breakdown ({trace.elapsed():.1f}s, spans in {trace.path}):")
+    print(trace.summary().to_string(index=False))
+
+
+async def show_batch_section(concurrency, lean, use_cache):
+    """UI for running an uploaded query list as one batch"""
+    with st.expander("Batch campaign"):
+        uploaded = st.file_uploader(
+            "Query list (.txt or .csv, one request per line)", type=["txt", "csv"])
+        workers = st.slider("Searches at the same time", min_value=1,
+                            max_value=BROWSER_MAX_CONTEXTS, value=min(BATCH_WORKERS, BROWSER_MAX_CONTEXTS))
+        if not st.button("Run batch", disabled=uploaded is None):
+            return
+
+        requests = read_query_list(uploaded.getvalue().decode("utf-8", errors="replace"))
+        if not requests:
+            st.warning("The query list is empty.")
+            return
+
+        progress = st.progress(0.0, text=f"Planning {len(requests)} requests...")
+        trace = start_trace("batch", requests=len(requests), workers=workers)
+
+        def report(query, business_list, done, total):
+            progress.progress(done / total,
+                              text=f"{done} of {total} searches done, last: '{query}' ({business_list.get_row_size()} rows)")
+
+        batch = await run_batch(requests, workers=workers, pool=get_browser_pool(),
+                                use_cache=use_cache, on_progress=report,
+                                concurrency=concurrency, lean=lean,
+                                lead_index=get_lead_index())
+        progress.empty()
+        if not batch.business_list:
+            st.warning("The batch returned no results.")
+            show_trace(trace)
+            return
+
+        st.success(f"{len(batch.searches)} searches returned {batch.get_row_size()} rows.")
+        st.dataframe(batch.dataframe())
+        filename = batch_filename(batch)
+        excel_file_path = batch.save_to_excel(filename)
+        if excel_file_path:
+            with open(excel_file_path, 'rb') as fp:
+                st.download_button(
+                    label="Download Batch Results (Excel)",
+                    data=fp,
+                    file_name=f"{filename}.xlsx",
+                    mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+                )
+        else:
+            st.error("Failed to save batch results to Excel.")
+        show_trace(trace)
+
+
+def show_trace(trace):
+    """Saves a request trace and shows its timing breakdown"""
+    path = trace.save()
+    with st.expander(f"Timing breakdown ({trace.elapsed():.1f}s)"):
+        st.dataframe(trace.summary())
+        if path:
+            st.caption(f"Span trace: {path}")
+
+
+def show_results_table(business_list):
+    """Shows a BusinessList with its cache and traffic figures"""
+    st.success(f"Found {len(business_list.business_list)} results!")
+    if business_list.stats.cached_rows:
+        st.caption(f"{business_list.stats.cached_rows} rows served from cache")
+    if business_list.stats.requests:
+        st.caption(f"Traffic: {business_list.stats.summary()}")
+    st.dataframe(business_list.dataframe())
+
+
+def offer_download(excel_file_path):
+    """Offers a saved Excel file for download"""
+    if excel_file_path:
+        try:
+            with open(excel_file_path, 'rb') as fp:
+                st.download_button(
+                    label="Download Results (Excel)",
+                    data=fp,
+                    file_name=os.path.basename(excel_file_path),
+                    mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet" # Correct MIME type
+                )
+        except FileNotFoundError:
+             st.error(f"Could not read file for download: {excel_file_path}")
+    else:
+         st.error("Failed to save results to Excel.")
+
+
+def show_search_results(business_list, query):
+    """Shows a BusinessList in the UI, saves it to Excel and offers it for download"""
+    if business_list and business_list.business_list: # Check if list is not None and not empty
+        show_results_table(business_list)
+        offer_download(business_list.save_to_excel(results_filename(business_list, query)))
+    else:
+         st.warning("No results found or scraping failed.")
+
+
+class PipelineView:
+    """
+    Renders run_pipeline events in Streamlit; pass an instance as on_event.
+
+    Scraped rows are streamed into a live table. Pressing "Stop scraping"
+    (one button per request) reruns the script, which cancels the request;
+    the rows of every search collected so far are kept in session_state and
+    shown after the rerun.
+    """
+
+    def __init__(self):
+        self.progress = None
+        self.live_table = None
+        self.live_rows = None
+        self.stop_button = False
+        st.session_state["partial_results"] = []
+
+    def __call__(self, kind, data):
+        handler = getattr(self, f"on_{kind}", None)
+        if handler is not None:
+            handler(**data)
+
+    def on_planned(self, calls, text, **_):
+        st.caption(get_planner().stats.summary())
+        if calls:
+            st.success("Request analyzed successfully!")
+            st.json(calls) # Show the plan
+        else: # No planned calls from LLM
+            st.info("LLM Response:")
+            st.write(text if text else "No specific action identified by the AI.")
+
+    def on_search_started(self, query, requested, **_):
+        partial = {"query": query, "rows": []}
+        st.session_state["partial_results"].append(partial)
+        if not self.stop_button:
+            st.button("Stop scraping", key="stop_scraping")
+            self.stop_button = True
+        self.progress = st.progress(0.0, text=f"Scraping '{query}'...")
+        self.live_table = st.empty()
+        self.live_rows = BusinessList(partial["rows"])
+
+    def on_listing(self, business, rows, requested, **_):
+        self.live_rows.append(business)
+        self.progress.progress(min(rows / requested, 1.0),
+                               text=f"{rows} of {requested} listings")
+        self.live_table.dataframe(self.live_rows.dataframe())
+
+    def on_enriched(self, summary, **_):
+        st.caption(f"Website enrichment: {summary}")
+
+    def on_search_done(self, business_list, **_):
+        self.progress.empty()
+        self.live_table.empty()
+        if business_list.business_list:
+            show_results_table(business_list)
+        else:
+            st.warning("No results found or scraping failed.")
+
+    def on_exported(self, path, **_):
+        offer_download(path)
+
+    def on_message_prepared(self, message, target_numbers=None, k=None, **_):
+        st.info("WhatsApp Message Action:")
+        st.write(f"**Message:** {message}")
+        if target_numbers:
+            st.write("**Target numbers (direct):**", target_numbers)
+        elif k is not None:
+            st.write(f"**Number of recipients (k):** {k}")
+
+    def on_messages_queued(self, campaign, recipients, **_):
+        st.session_state.setdefault("campaigns", []).append(campaign)
+        st.success(f"Queued {len(recipients)} messages. Progress is shown below.")
+
+    def on_info(self, message, **_):
+        st.info(message)
+
+    def on_warning(self, message, **_):
+        st.warning(message)
+
+
+async def main():
+    if not API_KEY:
+        st.error("Error: GOOGLE_API_KEY not found in environment variables.")
+        st.stop()
+
+    st.title("AI-Powered Lead Generation Assistant")
+
+    st.text("By Jeremy Sigamony") 
+    st.markdown("---")
+
+    st.markdown(
+        """
+    <p style="font-size: 13px;color: aqua;">Enter your request in natural language. Examples:</p>
+    <ul>
+        <li>"Find cafes in Islamabad and send the first 5 this message: 'Hello! We have a special offer today.'"</li>
+        <li>"Show me barber shops in Malakand, maybe 10 of them."</li>
+        <li>"Send 'Meeting reminder for tomorrow at 10 AM' to +923001234567 and +923339876543"</li>
+    </ul>
+    """,
+        unsafe_allow_html=True,
+    )
+
+    concurrency = st.sidebar.slider(
+        "Parallel listing pages", min_value=1, max_value=10,
+        value=SCRAPE_CONCURRENCY,
+        help="Number of listing detail pages extracted at the same time")
+    lean = st.sidebar.checkbox(
+        "Lean page profile", value=LEAN_PROFILE,
+        help="Skip images, map tiles, media, fonts and analytics while scraping")
+    use_cache = st.sidebar.checkbox(
+        "Use cached results", value=True,
+        help="Serve repeated searches from the local cache and only scrape missing rows")
+    enrich = st.sidebar.checkbox(
+        "Enrich from websites", value=False,
+        help="Fetch each lead's website for email addresses and social media links")
+    sender_name = st.sidebar.selectbox(
+        "WhatsApp sender", list(MESSAGE_SENDERS),
+        index=list(MESSAGE_SENDERS).index(WHATSAPP_SENDER),
+        help="Sender for the messages of your next request. pywhatkit opens a new tab "
+             "per message; playwright keeps one WhatsApp Web session open")
+    dispatch_queue = get_dispatch_queue()
+
+    user_input = st.text_area(
+        "Enter your request",
+        placeholder="e.g., Find cafes in Islamabad and send them a promotional message"
+    )
+
+
+    process_request = st.button("Process Request")
+
+    # A request stopped early by the user leaves the rows of its searches
+    # behind for this rerun
+    partial_results = st.session_state.pop("partial_results", None) or []
+    if not process_request:
+        for partial in partial_results:
+            if partial["rows"]:
+                st.info(f"Scraping '{partial['query']}' stopped after {len(partial['rows'])} listings.")
+                show_search_results(BusinessList(partial["rows"]), partial["query"])
+
+    if process_request:
+        if not user_input:
+            st.error("Please enter your request")
+        else:
+            # Spans of this request (planning, scraping, export, sends) are
+            # recorded on this trace until the script run ends
+            trace = start_trace("request", text=user_input)
+            with st.spinner("Analyzing your request..."):
+                await run_pipeline(
+                    user_input, on_event=PipelineView(),
+                    pool=get_browser_pool(), use_cache=use_cache,
+                    lead_index=get_lead_index(), dispatch_queue=dispatch_queue,
+                    sender=sender_name, concurrency=concurrency, lean=lean,
+                    enrich=enrich)
+            st.session_state.pop("partial_results", None)  # the request finished
+            show_trace(trace)
+
+    await show_batch_section(concurrency, lean, use_cache)
+
+    # Messages are sent in the background; poll their status
+    campaigns = st.session_state.get("campaigns")
+    if campaigns:
+        st.markdown("---")
+        st.subheader("WhatsApp messages")
+        if hasattr(st, "fragment"):
+            st.fragment(run_every=5)(show_dispatch_status)(campaigns)
+        else:
+            st.button("Refresh status")
+            show_dispatch_status(campaigns)
+
+
+# WhatsApp sending settings
+MESSAGE_INTERVAL = float(os.getenv('MESSAGE_INTERVAL', 15))  # seconds between messages
+MESSAGE_BURST = int(os.getenv('MESSAGE_BURST', 1))  # messages allowed back to back
+PYWHATKIT_WAIT_TIME = int(os.getenv('PYWHATKIT_WAIT_TIME', 25))
+MAX_RETRIES = int(os.getenv('MAX_RETRIES', 2))
+DISPATCH_DB = os.getenv('DISPATCH_DB', 'dispatch.sqlite3')
+DISPATCH_LEASE = float(os.getenv('DISPATCH_LEASE', 60))  # seconds before a silent queue counts as dead
+
+
+def pywhatkit_send(phone_number: str, message: str,
+                   wait_time: int = PYWHATKIT_WAIT_TIME):
+    """
+    Sends a WhatsApp message using pywhatkit. Blocks for about wait_time + 3
+    seconds and raises on failure; run it off the event loop.
+    """
+    import pywhatkit  # needs a display, so only loaded when a message is sent
+    logging.info(f"Attempting to send WhatsApp message to: {phone_number}")
+    logging.info(f"Message: {message}")
+    logging.info(f"Waiting {wait_time} seconds for WhatsApp Web/Desktop...")
+
+    pywhatkit.sendwhatmsg_instantly(
+        phone_no=phone_number,
+        message=message,
+        wait_time=wait_time,
+        tab_close=True,
+        close_time=3
+    )
+
+    logging.info("Message sent successfully!")
+    return True
+
+
+class MessageSender:
+    """
+    Common interface of the WhatsApp sender backends.
+
+    send() delivers one message and returns True, raising on failure.
+    Instances are callable with the same arguments so they can be passed
+    wherever a plain sender function is expected (e.g. DispatchQueue).
+    """
+
+    name = None
+
+    def send(self, phone_number: str, message: str) -> bool:
+        raise NotImplementedError
+
+    def close(self):
+        """Releases any resources held by the sender"""
+
+    def __call__(self, phone_number: str, message: str) -> bool:
+        return self.send(phone_number, message)
+
+
+class PyWhatKitSender(MessageSender):
+    """Sends each message through pywhatkit in a fresh WhatsApp Web tab (~28s per message)"""
+
+    name = "pywhatkit"
+
+    def __init__(self, wait_time: int = PYWHATKIT_WAIT_TIME):
+        self.wait_time = wait_time
+
+    def send(self, phone_number: str, message: str) -> bool:
+        return pywhatkit_send(phone_number, message, self.wait_time)
+
+
+# Persistent WhatsApp Web session used by PlaywrightWhatsAppSender
+WHATSAPP_SENDER = os.getenv('WHATSAPP_SENDER', 'pywhatkit')  # pywhatkit or playwright
+WHATSAPP_PROFILE_DIR = os.getenv('WHATSAPP_PROFILE_DIR', 'whatsapp_profile')
+WHATSAPP_LOGIN_TIMEOUT = int(os.getenv('WHATSAPP_LOGIN_TIMEOUT', 120))  # seconds to scan the QR code
+WHATSAPP_SEND_TIMEOUT = int(os.getenv('WHATSAPP_SEND_TIMEOUT', 20))  # seconds per message
+
+
+class PlaywrightWhatsAppSender(MessageSender):
+    """
+    Sends messages through one long-lived, logged-in WhatsApp Web session.
+
+    The session is a persistent Chromium profile (WHATSAPP_PROFILE_DIR), so
+    the QR code only has to be scanned on first use. WhatsApp Web boots once;
+    each message then opens its chat inside the running app by clicking a
+    send link. A marker set on the page before the click proves the chat
+    opened without a reload; if the app does not pick the link up, the
+    sender falls back to navigating to the chat, which reloads WhatsApp Web
+    and is logged as a warning (and counted in `reloads`). All Playwright
+    calls run on one dedicated thread, as the sync API requires, so send()
+    may be called from any thread.
+    """
+
+    name = "playwright"
+
+    WHATSAPP_URL = "https://web.whatsapp.com"
+    CHAT_LIST_CSS = '#pane-side'
+    COMPOSE_BOX_CSS = 'footer div[contenteditable="true"]'
+    INVALID_NUMBER_CSS = 'div[data-animate-modal-popup="true"]'
+
+    # Opens a chat in the running app without reloading WhatsApp Web. The
+    # marker only survives if the page was not reloaded, see IN_APP_JS.
+    OPEN_CHAT_JS = """(href) => {
+        window.__leadAgentInApp = true;
+        const link = document.createElement('a');
+        link.href = href;
+        document.body.appendChild(link);
+        link.click();
+        link.remove();
+    }"""
+    IN_APP_JS = "() => window.__leadAgentInApp === true"
+
+    # True once the newest outgoing message is no longer pending (clock icon)
+    MESSAGE_SENT_JS = """(previousCount) => {
+        const outgoing = document.querySelectorAll('div.message-out');
+        if (outgoing.length <= previousCount) return false;
+        const latest = outgoing[outgoing.length - 1];
+        return latest.querySelector('[data-icon="msg-time"]') === null;
+    }"""
+
+    def __init__(self, profile_dir=WHATSAPP_PROFILE_DIR, headless=False,
+                 login_timeout=WHATSAPP_LOGIN_TIMEOUT,
+                 send_timeout=WHATSAPP_SEND_TIMEOUT):
+        self.profile_dir = profile_dir
+        self.headless = headless
+        self.login_timeout = login_timeout
+        self.send_timeout = send_timeout
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="whatsapp-session")
+        self._playwright = None
+        self._context = None
+        self._page = None
+        self.reloads = 0
+
+    def _ensure_session(self):
+        if self._page is not None and not self._page.is_closed():
+            return
+        from playwright.sync_api import sync_playwright
+
+        start = time.perf_counter()
+        if self._playwright is None:
+            self._playwright = sync_playwright().start()
+        self._context = self._playwright.chromium.launch_persistent_context(
+            self.profile_dir, headless=self.headless)
+        self._page = (self._context.pages[0] if self._context.pages
+                      else self._context.new_page())
+        self._page.goto(self.WHATSAPP_URL, wait_until="domcontentloaded")
+        logging.info("Waiting for WhatsApp Web login (scan the QR code on first use)...")
+        self._page.wait_for_selector(self.CHAT_LIST_CSS,
+                                     timeout=self.login_timeout * 1000)
+        logging.info(f"WhatsApp Web session ready in {time.perf_counter() - start:.1f}s")
+
+    def _open_chat(self, phone_number):
+        page = self._page
+        digits = "".join(ch for ch in phone_number if ch.isdigit())
+        send_url = f"https://api.whatsapp.com/send?phone={digits}"
+        ready = f"{self.COMPOSE_BOX_CSS}, {self.INVALID_NUMBER_CSS}"
+
+        # Close the open chat first so a compose box can only belong to the
+        # chat we are about to open, never to the previous recipient.
+        page.keyboard.press("Escape")
+        try:
+            page.wait_for_selector(self.COMPOSE_BOX_CSS, state="detached",
+                                   timeout=2000)
+            page.evaluate(self.OPEN_CHAT_JS, send_url)
+            page.wait_for_selector(ready, timeout=3000)
+            in_app = page.evaluate(self.IN_APP_JS)
+        except Exception as e:
+            in_app = False
+            logging.warning(f"Could not open the chat with {phone_number} inside "
+                            f"WhatsApp Web ({type(e).__name__}), reloading it")
+            page.goto(f"{self.WHATSAPP_URL}/send?phone={digits}",
+                      wait_until="domcontentloaded")
+            page.wait_for_selector(ready, timeout=self.send_timeout * 1000)
+        else:
+            if not in_app:
+                logging.warning(f"WhatsApp Web reloaded while opening the chat with "
+                                f"{phone_number}; the send link was not handled in the app")
+        if not in_app:
+            self.reloads += 1
+
+        if page.locator(self.INVALID_NUMBER_CSS).count() > 0:
+            page.keyboard.press("Escape")
+            raise ValueError(f"{phone_number} is not on WhatsApp")
+
+    def _send(self, phone_number, message):
+        start = time.perf_counter()
+        self._ensure_session()
+        self._open_chat(phone_number)
+
+        page = self._page
+        previous_count = page.locator("div.message-out").count()
+        compose = page.locator(self.COMPOSE_BOX_CSS).last
+        compose.click()
+        for index, line in enumerate(message.split("\n")):
+            if index:
+                page.keyboard.press("Shift+Enter")
+            page.keyboard.insert_text(line)
+        page.keyboard.press("Enter")
+        page.wait_for_function(self.MESSAGE_SENT_JS, arg=previous_count,
+                               timeout=self.send_timeout * 1000)
+        logging.info(
+            f"Sent WhatsApp message to {phone_number} in {time.perf_counter() - start:.1f}s")
+        return True
+
+    def send(self, phone_number: str, message: str) -> bool:
+        return self._executor.submit(self._send, phone_number, message).result()
+
+    def _close(self):
+        if self._context is not None:
+            with contextlib.suppress(Exception):
+                self._context.close()
+        if self._playwright is not None:
+            with contextlib.suppress(Exception):
+                self._playwright.stop()
+        self._playwright = self._context = self._page = None
+
+    def close(self):
+        self._executor.submit(self._close).result()
+        self._executor.shutdown()
+
+
+MESSAGE_SENDERS = {
+    PyWhatKitSender.name: PyWhatKitSender,
+    PlaywrightWhatsAppSender.name: PlaywrightWhatsAppSender,
+}
+
+
+def create_sender(name=WHATSAPP_SENDER):
+    """Creates the MessageSender backend registered under name"""
+    try:
+        return MESSAGE_SENDERS[name]()
+    except KeyError:
+        raise ValueError(f"Unknown WhatsApp sender '{name}', "
+                         f"expected one of {', '.join(MESSAGE_SENDERS)}") from None
+
+
+class TokenBucket:
+    """
+    Thread- and process-safe token bucket rate limiter.
+
+    Tokens are added at `rate` per second up to `capacity`; every acquire()
+    takes one token, blocking until one is available. The bucket is a row of
+    the rate_limits table in the SQLite file db_path, so every process
+    opening the same file with the same name shares it. The default
+    ":memory:" keeps it private to this instance.
+    """
+
+    def __init__(self, rate, capacity=1, db_path=":memory:", name="default"):
+        self.rate = rate
+        self.capacity = capacity
+        self.name = name
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(db_path, timeout=30, isolation_level=None,
+                                   check_same_thread=False)
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS rate_limits (
+                name TEXT PRIMARY KEY,
+                tokens REAL NOT NULL,
+                updated REAL NOT NULL
+            )""")
+
+    def _take(self):
+        """Takes a token if one is available; returns the seconds to wait otherwise"""
+        with self._lock, self._db:
+            self._db.execute("BEGIN IMMEDIATE")  # no other process refills in between
+            now = time.time()  # wall clock, comparable across processes
+            row = self._db.execute("SELECT tokens, updated FROM rate_limits WHERE name = ?",
+                                   (self.name,)).fetchone()
+            tokens = self.capacity if row is None else min(
+                self.capacity, row[0] + max(0.0, now - row[1]) * self.rate)
+            delay = 0.0
+            if tokens >= 1:
+                tokens -= 1
+            else:
+                delay = (1 - tokens) / self.rate
+            self._db.execute("INSERT OR REPLACE INTO rate_limits (name, tokens, updated) "
+                             "VALUES (?, ?, ?)", (self.name, tokens, now))
+        return delay
+
+    def acquire(self, stop_event=None):
+        """Takes one token; returns False if stop_event was set while waiting"""
+        if self.rate == float("inf"):
+            return True
+        while True:
+            delay = self._take()
+            if delay == 0:
+                return True
+            if stop_event is None:
+                time.sleep(delay)
+            elif stop_event.wait(delay):
+                return False
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+def pid_alive(pid):
+    """Whether a process with this pid is running on this machine"""
+    if os.name == "nt":
+        return True  # os.kill(pid, 0) would terminate it; rely on the heartbeat
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True  # exists, owned by another user
+    return True
+
+
+class DispatchQueue:
+    """
+    Persistent WhatsApp message queue processed by a background worker thread.
+
+    Jobs are stored in SQLite so queued messages survive restarts. The worker
+    sends them one at a time through `sender`, a MessageSender or any callable
+    taking (phone_number, message) that returns True or raises on failure
+    (default: create_sender()), with at
+    most one message every `interval` seconds (token bucket, `burst` messages
+    back to back). A campaign may name another backend of MESSAGE_SENDERS
+    when it is queued; that sender is created on first use and kept open
+    next to the default one, so campaigns choosing different backends never
+    tear down each other's sessions. Failed sends are retried up to max_retries times. Job
+    status is one of queued, sending, sent, failed or cancelled. on_sent,
+    if given, is called with the phone number of every message sent.
+
+    Several processes may share db_path (the Streamlit app, CLI runs and
+    workers all default to DISPATCH_DB). Every queue registers as an owner
+    with its pid and a heartbeat renewed every lease / 3 seconds, and only
+    sends the jobs it queued itself, plus those left behind by owners that
+    died (stale heartbeat or pid gone). Only sends interrupted by a dead
+    owner are failed. The token bucket lives in the same file, so
+    `interval` holds across all processes using it.
+
+    Pass a stub sender (e.g. `lambda phone, message: True`) to exercise the
+    dispatch path without WhatsApp.
+    """
+
+    def __init__(self, sender=None, db_path=DISPATCH_DB,
+                 interval=MESSAGE_INTERVAL, burst=MESSAGE_BURST,
+                 max_retries=MAX_RETRIES, on_sent=None, lease=DISPATCH_LEASE):
+        self.sender = sender or create_sender()
+        self.on_sent = on_sent
+        self._traces = collections.OrderedDict()  # campaign -> Trace that queued it
+        self._senders = {}  # backend name -> sender, for campaigns naming one
+        self.max_retries = max_retries
+        self.lease = lease
+        self.owner = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._db = sqlite3.connect(db_path, timeout=30, check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        self._db.execute("PRAGMA journal_mode=WAL")  # readers don't block the other processes
+        with self._lock, self._db:
+            self._db.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    campaign TEXT NOT NULL,
+                    phone_number TEXT NOT NULL,
+                    message TEXT NOT NULL,
+                    status TEXT NOT NULL DEFAULT 'queued',
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    error TEXT,
+                    sender TEXT,
+                    owner TEXT,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                )""")
+            columns = {row["name"] for row in self._db.execute("PRAGMA table_info(jobs)")}
+            if "sender" not in columns:  # queue created before per-campaign senders
+                self._db.execute("ALTER TABLE jobs ADD COLUMN sender TEXT")
+            if "owner" not in columns:  # queue created before owners
+                self._db.execute("ALTER TABLE jobs ADD COLUMN owner TEXT")
+            self._db.execute(
+                "CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, id)")
+            self._db.execute("""
+                CREATE TABLE IF NOT EXISTS owners (
+                    owner TEXT PRIMARY KEY,
+                    pid INTEGER NOT NULL,
+                    heartbeat REAL NOT NULL
+                )""")
+        self._heartbeat()
+        self.bucket = TokenBucket(1 / interval if interval > 0 else float("inf"),
+                                  burst, db_path=db_path, name="whatsapp")
+        self._thread = threading.Thread(target=self._run, name="whatsapp-dispatch",
+                                        daemon=True)
+        self._thread.start()
+        self._heartbeat_thread = threading.Thread(target=self._keep_alive,
+                                                  name="whatsapp-dispatch-heartbeat",
+                                                  daemon=True)
+        self._heartbeat_thread.start()
+
+    def _execute(self, sql, params=()):
+        with self._lock, self._db:
+            return self._db.execute(sql, params)
+
+    def _heartbeat(self):
+        """Renews this queue's lease and releases what dead owners left behind"""
+        now = time.time()
+        with self._lock, self._db:
+            self._db.execute("INSERT OR REPLACE INTO owners (owner, pid, heartbeat) "
+                             "VALUES (?, ?, ?)", (self.owner, os.getpid(), now))
+            dead = [row["owner"] for row in
+                    self._db.execute("SELECT owner, pid, heartbeat FROM owners")
+                    if row["heartbeat"] < now - self.lease or not pid_alive(row["pid"])]
+            self._db.executemany("DELETE FROM owners WHERE owner = ?",
+                                 [(owner,) for owner in dead])
+            # A crash mid-send leaves no way to tell whether it went out;
+            # fail it rather than risk messaging the contact twice.
+            failed = self._db.execute(
+                "UPDATE jobs SET status = 'failed', error = 'interrupted while sending', "
+                "updated_at = ? WHERE status = 'sending' "
+                "AND (owner IS NULL OR owner NOT IN (SELECT owner FROM owners))", (now,))
+        if failed.rowcount:
+            logging.warning(f"Failed {failed.rowcount} WhatsApp messages "
+                            f"interrupted by a dispatch queue that exited")
+
+    def _keep_alive(self):
+        while not self._stop.wait(self.lease / 3):
+            try:
+                self._heartbeat()
+            except sqlite3.Error as e:
+                logging.error(f"Dispatch queue heartbeat failed: {e}")
+
+    def enqueue(self, phone_numbers, message, campaign=None, sender=None):
+        """
+        Queues message for every number and returns the campaign id. sender
+        optionally names the MESSAGE_SENDERS backend to send them with
+        (default: the queue's sender). Sends are recorded as message_send
+        spans of the current trace, if any.
+        """
+        if sender is not None and sender not in MESSAGE_SENDERS:
+            raise ValueError(f"Unknown WhatsApp sender '{sender}', "
+                             f"expected one of {', '.join(MESSAGE_SENDERS)}")
+        campaign = campaign or datetime.datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+        if current_trace() is not None:
+            self._traces[campaign] = current_trace()
+            while len(self._traces) > 100:
+                self._traces.popitem(last=False)
+        now = time.time()
+        with self._lock, self._db:
+            self._db.executemany(
+                "INSERT INTO jobs (campaign, phone_number, message, sender, owner, "
+                "created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [(campaign, number, message, sender, self.owner, now, now)
+                 for number in phone_numbers])
+        self._wakeup.set()
+        logging.info(f"Queued {len(phone_numbers)} WhatsApp messages (campaign {campaign})")
+        return campaign
+
+    def jobs(self, campaigns=None):
+        """Returns the jobs of the given campaigns (all if None) as dicts"""
+        sql = ("SELECT id, campaign, phone_number, sender, status, attempts, error, updated_at "
+               "FROM jobs")
+        params = ()
+        if campaigns is not None:
+            campaigns = list(campaigns)
+            sql += f" WHERE campaign IN ({', '.join('?' * len(campaigns))})"
+            params = campaigns
+        rows = self._execute(sql + " ORDER BY id", params).fetchall()
+        return [dict(row) for row in rows]
+
+    def cancel(self, campaign):
+        """Cancels the jobs of campaign that have not been sent yet"""
+        self._execute(
+            "UPDATE jobs SET status = 'cancelled', updated_at = ? "
+            "WHERE campaign = ? AND status = 'queued'", (time.time(), campaign))
+
+    def _sender_for(self, name):
+        """Returns the sender of a job naming backend name (None for the default)"""
+        if name is None or name == getattr(self.sender, "name", None):
+            return self.sender
+        if name not in self._senders:
+            self._senders[name] = create_sender(name)
+            logging.info(f"Started the {name} WhatsApp sender")
+        return self._senders[name]
+
+    # Jobs this queue may send: its own and those of owners that are gone
+    _MINE = "(owner = ? OR owner IS NULL OR owner NOT IN (SELECT owner FROM owners))"
+
+    def _next_job(self):
+        return self._execute(
+            "SELECT id, campaign, phone_number, message, sender, attempts FROM jobs "
+            f"WHERE status = 'queued' AND {self._MINE} ORDER BY id LIMIT 1",
+            (self.owner,)).fetchone()
+
+    def _claim(self, job_id):
+        """Marks the job as being sent by this queue, adopting it if its owner died"""
+        cursor = self._execute(
+            "UPDATE jobs SET status = 'sending', owner = ?, updated_at = ? "
+            f"WHERE id = ? AND status = 'queued' AND {self._MINE}",
+            (self.owner, time.time(), job_id, self.owner))
+        return cursor.rowcount == 1
+
+    def _finish(self, job, error):
+        attempts = job["attempts"] + 1
+        if error is None:
+            status = "sent"
+        elif attempts <= self.max_retries:
+            status = "queued"
+        else:
+            status = "failed"
+        self._execute(
+            "UPDATE jobs SET status = ?, attempts = ?, error = ?, updated_at = ? "
+            "WHERE id = ?", (status, attempts, error, time.time(), job["id"]))
+
+    def _run(self):
+        while not self._stop.is_set():
+            job = self._next_job()
+            if job is None:
+                self._wakeup.wait(timeout=1)
+                self._wakeup.clear()
+                continue
+            if not self.bucket.acquire(self._stop):
+                break
+            if not self._claim(job["id"]):
+                continue  # cancelled while waiting for a token
+
+            error = None
+            trace = self._traces.get(job["campaign"])
+            with span("message_send", trace=trace, phone_number=job["phone_number"],
+                      attempt=job["attempts"] + 1,
+                      sender=job["sender"] or getattr(self.sender, "name", None)) as attrs:
+                try:
+                    sender = self._sender_for(job["sender"])
+                    if not sender(job["phone_number"], job["message"]):
+                        error = "sender reported failure"
+                except Exception as e:
+                    error = f"{type(e).__name__}: {e}"
+                    logging.error(f"Failed to send message to {job['phone_number']}: {error}")
+                if error is not None:
+                    attrs["error"] = error
+            if trace is not None:
+                trace.save()
+            self._finish(job, error)
+            if error is None and self.on_sent is not None:
+                try:
+                    self.on_sent(job["phone_number"])
+                except Exception as e:
+                    logging.error(f"on_sent callback failed: {e}")
+
+        for sender in [self.sender, *self._senders.values()]:
+            if hasattr(sender, "close"):
+                with contextlib.suppress(Exception):
+                    sender.close()
+
+    def trace(self, campaign):
+        """Returns the Trace that recorded the sends of campaign, or None"""
+        return self._traces.get(campaign)
+
+    def stop(self, timeout=None):
+        """
+        Stops the worker thread; queued jobs stay in the database for the
+        next queue opening it to send.
+        """
+        self._stop.set()
+        self._wakeup.set()
+        self._thread.join(timeout)
+        self._heartbeat_thread.join(timeout)
+        if not self._thread.is_alive():
+            # Nothing is mid-send: give up the lease right away
+            self._execute("DELETE FROM owners WHERE owner = ?", (self.owner,))
+            self.bucket.close()
+
+
+@process_resource
+def get_dispatch_queue():
+    """Returns the process-wide DispatchQueue shared by all Streamlit sessions"""
+    return DispatchQueue(on_sent=get_lead_index().mark_messaged)
+
+
+def show_dispatch_status(campaigns):
+    """Shows per-message status of the given campaigns"""
+    jobs = get_dispatch_queue().jobs(campaigns)
+    if not jobs:
+        return
+    jobs_frame = pd.DataFrame(jobs)
+    jobs_frame["updated_at"] = pd.to_datetime(jobs_frame["updated_at"], unit="s")
+    counts = jobs_frame["status"].value_counts()
+    st.write(", ".join(f"**{status}:** {count}" for status, count in counts.items()))
+    sends = [span for campaign in campaigns
+             if get_dispatch_queue().trace(campaign) is not None
+             for span in get_dispatch_queue().trace(campaign).spans
+             if span["span"] == "message_send"]
+    if sends:
+        durations = pd.Series([span["duration_ms"] / 1000 for span in sends])
+        st.caption(f"Send time: mean {durations.mean():.1f}s, "
+                   f"p95 {durations.quantile(0.95):.1f}s over {len(sends)} attempts")
+    st.dataframe(jobs_frame.drop(columns=["campaign"]))
+
+
+@dataclass
+class PipelineResult:
+    """Outcome of run_pipeline"""
+    planned_calls: list = field(default_factory=list)
+    text: str = ""
+    searches: dict = field(default_factory=dict)  # query -> BusinessList
+    exports: dict = field(default_factory=dict)  # query -> file path
+    campaigns: list = field(default_factory=list)
+    recipients: list = field(default_factory=list)  # numbers queued, or planned in a dry run
+
+
+async def run_pipeline(request=None, planned_calls=None, on_event=None,
+                       pool=None, use_cache=True, lead_index=None,
+                       dispatch_queue=None, sender=None, export_format="xlsx",
+                       concurrency=SCRAPE_CONCURRENCY, lean=LEAN_PROFILE,
+                       enrich=False):
+    """
+    Runs one request end to end without any UI: plan, search and extract,
+    export, then queue the WhatsApp messages.
+
+    Progress is reported as on_event(kind, data) calls, data being a dict:
+        planned          calls, text
+        search_started   query, requested
+        listing          query, business, rows, requested (in feed order)
+        enriched         query, summary and the EnrichStats fields (with enrich)
+        search_done      query, business_list, rows, cached_rows
+        exported         query, path, format (path is None if saving failed)
+        message_prepared message, target_numbers, k
+        messages_queued  campaign, recipients
+        messages_planned recipients (dry run, no dispatch_queue)
+        info, warning    message
+
+    Args:
+        request: Natural language request, planned with get_agent_plan
+        planned_calls: Already planned calls to run instead of planning request
+        on_event: Optional progress callback, see above
+        pool: Optional BrowserPool the searches run on
+        use_cache: Serve searches from the ScrapeCache where possible
+        lead_index: Optional LeadIndex of known listings and messaged numbers
+        dispatch_queue: DispatchQueue to queue messages on. Without one the
+            recipients are only reported (dry run)
+        sender: Optional MESSAGE_SENDERS backend name the messages are sent
+            with (default: the dispatch queue's sender)
+        export_format: "xlsx", "csv", "parquet", or None to skip the export
+        concurrency: Parallel listing pages per search
+        lean: Use the lean scraping profile
+        enrich: Fetch each lead's website for emails and social links before
+            exporting (see enrich_businesses)
+
+    Returns:
+        PipelineResult
+    """
+    def emit(kind, **data):
+        if on_event is not None:
+            on_event(kind, data)
+
+    result = PipelineResult()
+    if planned_calls is None:
+        planned_calls, result.text = await get_agent_plan(request)
+    result.planned_calls = planned_calls
+    emit("planned", calls=planned_calls, text=result.text)
+
+    search_results_list = None
+    for call in planned_calls:
+        args = call.get("args", {})
+        if call["function_name"] == "search_Maps":
+            query = args["query"]
+            num_results = parse_num_results(args.get("num_results"))
+            if (args.get("num_results") is not None
+                    and parse_num_results(args["num_results"], default=None) is None):
+                emit("warning", message=f"Invalid value received for number of results "
+                                        f"('{args.get('num_results')}'). Defaulting to {num_results}.")
+
+            emit("search_started", query=query, requested=num_results)
+            rows = 0
+            async with ScrapeStream(
+                query, num_results,
+                scrape=cached_scrape_business if use_cache else scrape_business,
+                concurrency=concurrency, pool=pool, lean=lean,
+                lead_index=lead_index, reuse_leads=use_cache
+            ) as stream:
+                async for business in stream:
+                    rows += 1
+                    emit("listing", query=query, business=business, rows=rows,
+                         requested=num_results)
+
+            business_list = search_results_list = stream.business_list
+            result.searches[query] = business_list
+            if enrich and business_list.business_list:
+                enrich_stats = await business_list.enrich_websites()
+                if lead_index is not None:
+                    lead_index.add_many(business_list.business_list, extracted=False)
+                emit("enriched", query=query, summary=enrich_stats.summary(),
+                     **asdict(enrich_stats))
+            emit("search_done", query=query, business_list=business_list,
+                 rows=business_list.get_row_size(),
+                 cached_rows=business_list.stats.cached_rows)
+            if export_format and business_list.business_list:
+                path = export_business_list(
+                    business_list, results_filename(business_list, query), export_format)
+                result.exports[query] = path
+                emit("exported", query=query, path=path, format=export_format)
+
+        elif call["function_name"] == "prepare_whatsapp_message":
+            message_content = args.get('message', '*No message content provided*')
+            k_value = args.get('k')
+            target_numbers = args.get('target_numbers')
+            emit("message_prepared", message=message_content,
+                 target_numbers=target_numbers, k=k_value)
+
+            recipients = []
+            if target_numbers:
+                normalized = normalize_phone_numbers(target_numbers)
+                skipped = [f"{number} ({status})" for number, status in zip(
+                    target_numbers, normalized["phone_status"]) if status != PHONE_VALID]
+                if skipped:
+                    emit("warning", message=f"Skipping numbers that cannot be messaged: {', '.join(skipped)}")
+                recipients = normalized.loc[
+                    normalized["phone_status"] == PHONE_VALID, "phone_e164"].tolist()
+
+            # Handle search results if available
+            elif search_results_list and search_results_list.business_list:
+                try:
+                    k_int = int(k_value)
+                except (ValueError, TypeError):
+                    emit("warning", message=(
+                        f"Invalid value received for k ('{k_value}')" if k_value is not None
+                        else "No 'k' value provided to limit the number of recipients."))
+                    continue
+
+                # Only normalized numbers that can be messaged reach the sender
+                recipients = search_results_list.sendable_phone_numbers(k_int)
+                skipped = len(search_results_list.business_list[:k_int]) - len(recipients)
+                if skipped:
+                    emit("info", message=f"Skipping {skipped} results without a valid mobile number (see the phone_status column).")
+
+                # Never message the same contact twice across campaigns
+                if lead_index is not None:
+                    unmessaged = lead_index.filter_unmessaged(recipients)
+                    if len(unmessaged) < len(recipients):
+                        emit("info", message=f"Skipping {len(recipients) - len(unmessaged)} contacts that were already messaged.")
+                    recipients = unmessaged
+
+                if not recipients:
+                    emit("warning", message="No valid phone numbers found in the search results.")
+            else:
+                emit("warning", message="No search results available to send messages to.")
+
+            if not recipients:
+                continue
+            result.recipients.extend(recipients)
+            if dispatch_queue is None:
+                emit("messages_planned", recipients=recipients)
+            else:
+                campaign = dispatch_queue.enqueue(recipients, message_content,
+                                                  sender=sender)
+                result.campaigns.append(campaign)
+                emit("messages_queued", campaign=campaign, recipients=recipients)
+
+    return result
+
+
+async def wait_for_campaigns(dispatch_queue, campaigns, on_event=None, poll_interval=1.0):
+    """Waits until every message of campaigns was sent or failed, reporting each as a message_status event"""
+    reported = set()
+    while True:
+        jobs = dispatch_queue.jobs(campaigns)
+        for job in jobs:
+            if job["status"] in ("sent", "failed", "cancelled") and job["id"] not in reported:
+                reported.add(job["id"])
+                if on_event is not None:
+                    on_event("message_status", {key: job[key] for key in (
+                        "campaign", "phone_number", "status", "attempts", "error")})
+        if len(reported) == len(jobs):
+            return jobs
+        await asyncio.sleep(poll_interval)
+
+
+def event_json(kind, data, **extra):
+    """One pipeline event as a JSON line; Business rows become dicts, BusinessLists are left out"""
+    record = {"event": kind, **extra}
+    for key, value in data.items():
+        if isinstance(value, BusinessList):
+            continue
+        record[key] = asdict(value) if isinstance(value, Business) else value
+    return json.dumps(record, default=str)
+
+
+def pipeline_parser(prog, description):
+    """Options shared by the run and worker commands"""
+    parser = argparse.ArgumentParser(prog=prog, description=description)
+    parser.add_argument("--concurrency", type=int, default=SCRAPE_CONCURRENCY,
+                        help=f"Listing pages per search (default: {SCRAPE_CONCURRENCY})")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="Always scrape instead of serving cached results")
+    parser.add_argument("--full-profile", action="store_true",
+                        help="Load images, tiles and fonts (disable the lean profile)")
+    parser.add_argument("--format", choices=["xlsx", "csv", "parquet", "none"], default="xlsx",
+                        help="Export format of search results (default: xlsx)")
+    parser.add_argument("--enrich", action="store_true",
+                        help="Fetch each lead's website for emails and social links")
+    parser.add_argument("--send", action="store_true",
+                        help="Queue and send the WhatsApp messages (default: only report recipients)")
+    return parser
+
+
+def pipeline_options(args, pool, lead_index, dispatch_queue):
+    """run_pipeline keyword arguments for parsed pipeline_parser options"""
+    return dict(pool=pool, use_cache=not args.no_cache, lead_index=lead_index,
+                dispatch_queue=dispatch_queue,
+                export_format=None if args.format == "none" else args.format,
+                concurrency=args.concurrency, lean=not args.full_profile,
+                enrich=args.enrich)
+
+
+def write_event(line):
+    sys.stdout.write(line + "\n")
+    sys.stdout.flush()
+
+
+def run_cli(argv):
+    """
+    Command line entry point: python lead_agent.py run "REQUEST" [options]
+
+    Runs one request headless and prints its progress events as JSON lines on
+    stdout (logs go to stderr), ending with a done event with the timings.
+    """
+    parser = pipeline_parser("lead_agent.py run",
+                             "Run one request without the UI, printing JSON line progress events.")
+    parser.add_argument("request", help="Natural language request ('-' for stdin)")
+    args = parser.parse_args(argv)
+    request = sys.stdin.read().strip() if args.request == "-" else args.request
+
+    def on_event(kind, data):
+        write_event(event_json(kind, data))
+
+    async def run():
+        pool = BrowserPool()
+        lead_index = LeadIndex()
+        dispatch_queue = DispatchQueue(on_sent=lead_index.mark_messaged) if args.send else None
+        try:
+            result = await run_pipeline(request, on_event=on_event,
+                                        **pipeline_options(args, pool, lead_index, dispatch_queue))
+            if dispatch_queue is not None and result.campaigns:
+                await wait_for_campaigns(dispatch_queue, result.campaigns, on_event)
+            return result
+        finally:
+            pool.close()
+            if dispatch_queue is not None:
+                dispatch_queue.stop(timeout=5)
+
+    with tracing("run", text=request) as trace:
+        try:
+            result = asyncio.run(run())
+        except Exception as e:
+            logging.error(f"Request failed: {type(e).__name__} - {e}")
+            on_event("error", {"message": f"{type(e).__name__}: {e}"})
+            sys.exit(1)
+    on_event("done", {"rows": sum(business_list.get_row_size()
+                                  for business_list in result.searches.values()),
+                      "exports": result.exports, "recipients": len(result.recipients),
+                      "timing": trace.summary().to_dict(orient="records"),
+                      "trace": trace.path if TRACE_FILES else None})
+
+
+def worker_cli(argv):
+    """
+    Command line entry point: python lead_agent.py worker [options]
+
+    Long-running worker for running many jobs per process. Reads one job per
+    line on stdin, either a JSON object {"id": ..., "request": "..."} (or
+    "calls" with already planned calls instead of "request") or a plain
+    request, and writes every progress event as a JSON line on stdout tagged
+    with the job id. One browser pool, lead index and dispatch queue are
+    shared by all jobs of the worker.
+    """
+    parser = pipeline_parser("lead_agent.py worker",
+                             "Run requests read from stdin (one per line), printing JSON line events.")
+    args = parser.parse_args(argv)
+
+    async def serve():
+        pool = BrowserPool()
+        lead_index = LeadIndex()
+        dispatch_queue = DispatchQueue(on_sent=lead_index.mark_messaged) if args.send else None
+        options = pipeline_options(args, pool, lead_index, dispatch_queue)
+        campaigns = []
+        number = 0
+        try:
+            while True:
+                line = await asyncio.to_thread(sys.stdin.readline)
+                if not line:
+                    break
+                if not line.strip():
+                    continue
+                number += 1
+                try:
+                    job = json.loads(line) if line.lstrip().startswith("{") else {"request": line.strip()}
+                except json.JSONDecodeError as e:
+                    write_event(event_json("job_failed", {"error": f"invalid job: {e}"}, job=number))
+                    continue
+                job_id = job.get("id", number)
+
+                def on_event(kind, data, job_id=job_id):
+                    write_event(event_json(kind, data, job=job_id))
+
+                with tracing("job", id=job_id) as trace:
+                    try:
+                        result = await run_pipeline(job.get("request"), job.get("calls"),
+                                                    on_event=on_event, **options)
+                    except Exception as e:
+                        logging.error(f"Job {job_id} failed: {type(e).__name__} - {e}")
+                        on_event("job_failed", {"error": f"{type(e).__name__}: {e}"})
+                        continue
+                campaigns.extend(result.campaigns)
+                on_event("job_done", {"exports": result.exports,
+                                      "recipients": len(result.recipients),
+                                      "seconds": round(trace.elapsed(), 2)})
+            if dispatch_queue is not None and campaigns:
+                await wait_for_campaigns(dispatch_queue, campaigns,
+                                         lambda kind, data: write_event(event_json(kind, data)))
+        finally:
+            pool.close()
+            if dispatch_queue is not None:
+                dispatch_queue.stop(timeout=5)
+
+    asyncio.run(serve())
+
+
+# Command line entry points, python lead_agent.py COMMAND ...
+CLI_COMMANDS = {"batch": batch_cli, "run": run_cli, "worker": worker_cli}
+
+
+logging.info(f"lead_agent imported in {(time.perf_counter() - _import_started) * 1000:.0f}ms")
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    if sys.argv[1:2] and sys.argv[1] in CLI_COMMANDS:
+        CLI_COMMANDS[sys.argv[1]](sys.argv[2:])
+    else:
+        asyncio.run(main())
@@ -0,0 +1,117 @@
+import asyncio
+import csv
+
+import pytest
+
+from lead_agent import PHONE_DUPLICATE, PHONE_VALID, BatchResult, Business, BusinessList
+
+
+def cafe(n, **kwargs):
+    return Business(name=f"Cafe {n}", phone_number=f"+92 300 12345{n:02d}", **kwargs)
+
+
+@pytest.fixture
+def in_tmp_path(tmp_path, monkeypatch):
+    monkeypatch.setattr(BusinessList, "save_at", str(tmp_path))
+    return tmp_path
+
+
+def read_csv(path):
+    with open(path, newline="", encoding="utf-8") as fp:
+        return list(csv.reader(fp))
+
+
+def test_dataframe_is_cached_until_rows_are_added():
+    businesses = BusinessList([cafe(0)])
+    frame = businesses.dataframe()
+    assert businesses.dataframe() is frame
+
+    businesses.append(cafe(1))
+    assert list(businesses.dataframe()["name"]) == ["Cafe 0", "Cafe 1"]
+
+
+def test_normalize_phones_refreshes_the_columns():
+    businesses = BusinessList([cafe(0), Business(name="Cafe 0 again", phone_number="+923001234500")])
+    assert list(businesses.dataframe()["phone_status"]) == [None, None]
+
+    businesses.normalize_phones()
+    frame = businesses.dataframe()
+    assert list(frame["phone_e164"]) == ["+923001234500", "+923001234500"]
+    assert list(frame["phone_status"]) == [PHONE_VALID, PHONE_DUPLICATE]
+
+
+def test_enrich_websites_refreshes_the_columns():
+    businesses = BusinessList([cafe(0, website="https://www.facebook.com/cafe0/")])
+    assert list(businesses.dataframe()["social_links"]) == [None]
+
+    # Social profile websites are recorded without fetching anything
+    asyncio.run(businesses.enrich_websites(cache=False))
+    frame = businesses.dataframe()
+    assert list(frame["emails"]) == [""]
+    assert list(frame["social_links"]) == ["https://www.facebook.com/cafe0"]
+
+
+def test_replaced_business_list_rebuilds_the_columns():
+    businesses = BusinessList([cafe(0), cafe(1)])
+    businesses.dataframe()
+    businesses.business_list = [cafe(2)]
+    assert list(businesses.dataframe()["name"]) == ["Cafe 2"]
+
+
+def test_save_to_csv_append_writes_only_new_rows(in_tmp_path):
+    businesses = BusinessList([cafe(0)])
+    path = businesses.save_to_csv("leads", append=True)
+    businesses.extend([cafe(1), cafe(2)])
+    assert businesses.save_to_csv("leads", append=True) == path
+    assert businesses.save_to_csv("leads", append=True) == path  # nothing new
+
+    rows = read_csv(path)
+    assert rows[0] == businesses.column_names()
+    assert [row[0] for row in rows[1:]] == ["Cafe 0", "Cafe 1", "Cafe 2"]
+
+
+def test_save_to_csv_without_append_rewrites_the_file(in_tmp_path):
+    businesses = BusinessList([cafe(0)])
+    businesses.save_to_csv("leads")
+    businesses.append(cafe(1))
+    rows = read_csv(businesses.save_to_csv("leads"))
+    assert [row[0] for row in rows] == ["name", "Cafe 0", "Cafe 1"]
+
+
+def test_batch_query_column_stays_aligned_with_rows(in_tmp_path):
+    batch = BatchResult()
+    batch.add("cafes in islamabad", BusinessList([cafe(0), cafe(1)]))
+    # Cafe 1 was already returned by the first search and is skipped
+    batch.add("coffee in islamabad", BusinessList([cafe(1), cafe(2)]))
+
+    assert batch.searches == {"cafes in islamabad": 2, "coffee in islamabad": 1}
+    frame = batch.dataframe()
+    assert list(frame.columns[:2]) == ["query", "name"]
+    assert list(zip(frame["query"], frame["name"])) == [
+        ("cafes in islamabad", "Cafe 0"),
+        ("cafes in islamabad", "Cafe 1"),
+        ("coffee in islamabad", "Cafe 2"),
+    ]
+
+    rows = read_csv(batch.save_to_csv("batch"))
+    assert rows[0][:2] == ["query", "name"]
+    assert [row[:2] for row in rows[1:]] == [
+        ["cafes in islamabad", "Cafe 0"],
+        ["cafes in islamabad", "Cafe 1"],
+        ["coffee in islamabad", "Cafe 2"],
+    ]
+
+
+def test_batch_append_keeps_queries_aligned(in_tmp_path):
+    batch = BatchResult()
+    batch.add("cafes in islamabad", BusinessList([cafe(0)]))
+    path = batch.save_to_csv("batch", append=True)
+    batch.add("coffee in islamabad", BusinessList([cafe(0), cafe(1)]))
+    batch.save_to_csv("batch", append=True)
+
+    rows = read_csv(path)
+    assert [row[:2] for row in rows] == [
+        ["query", "name"],
+        ["cafes in islamabad", "Cafe 0"],
+        ["coffee in islamabad", "Cafe 1"],
+    ]
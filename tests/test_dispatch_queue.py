@@ -0,0 +1,296 @@
+import os
+import subprocess
+import sys
+import threading
+import time
+
+import pytest
+
+import lead_agent
+from lead_agent import DispatchQueue
+
+FINAL_STATUSES = {"sent", "failed", "cancelled"}
+
+
+class StubSender:
+    """Records every send; fails the first `failures` attempts per number"""
+
+    name = "stub"
+
+    def __init__(self, failures=0):
+        self.failures = failures
+        self.sends = []  # (phone_number, message, monotonic time)
+        self._lock = threading.Lock()
+
+    def __call__(self, phone_number, message):
+        with self._lock:
+            self.sends.append((phone_number, message, time.monotonic()))
+            attempts = sum(number == phone_number for number, _, _ in self.sends)
+        if attempts <= self.failures:
+            raise RuntimeError("WhatsApp Web did not load")
+        return True
+
+
+def wait_for_jobs(queue, campaign, done, timeout=5):
+    """Polls the jobs of campaign until done(jobs) holds and returns them"""
+    deadline = time.monotonic() + timeout
+    while True:
+        jobs = queue.jobs([campaign])
+        if done(jobs):
+            return jobs
+        if time.monotonic() > deadline:
+            pytest.fail(f"jobs did not settle: {jobs}")
+        time.sleep(0.02)
+
+
+def all_final(jobs):
+    return all(job["status"] in FINAL_STATUSES for job in jobs)
+
+
+@pytest.fixture
+def make_queue(tmp_path):
+    queues = []
+
+    def make(sender, **kwargs):
+        kwargs.setdefault("interval", 0)
+        queue = DispatchQueue(sender, db_path=str(tmp_path / "dispatch.sqlite3"), **kwargs)
+        queues.append(queue)
+        return queue
+
+    yield make
+    for queue in queues:
+        queue.stop(timeout=5)
+
+
+def test_sends_every_queued_message(make_queue):
+    sender = StubSender()
+    sent = []
+    queue = make_queue(sender, on_sent=sent.append)
+
+    campaign = queue.enqueue(["+923001234567", "+923007654321"], "Hello!")
+    jobs = wait_for_jobs(queue, campaign, all_final)
+
+    assert [job["status"] for job in jobs] == ["sent", "sent"]
+    assert [job["attempts"] for job in jobs] == [1, 1]
+    assert [(number, message) for number, message, _ in sender.sends] == [
+        ("+923001234567", "Hello!"), ("+923007654321", "Hello!")]
+    assert sent == ["+923001234567", "+923007654321"]
+
+
+def test_retries_then_marks_failed(make_queue):
+    sender = StubSender(failures=10)
+    sent = []
+    queue = make_queue(sender, max_retries=2, on_sent=sent.append)
+
+    campaign = queue.enqueue(["+923001234567"], "Hello!")
+    [job] = wait_for_jobs(queue, campaign, all_final)
+
+    assert job["status"] == "failed"
+    assert job["attempts"] == 3
+    assert "WhatsApp Web did not load" in job["error"]
+    assert len(sender.sends) == 3
+    assert sent == []
+
+
+def test_retry_succeeds_after_transient_failure(make_queue):
+    sender = StubSender(failures=1)
+    queue = make_queue(sender, max_retries=2)
+
+    campaign = queue.enqueue(["+923001234567"], "Hello!")
+    [job] = wait_for_jobs(queue, campaign, all_final)
+
+    assert job["status"] == "sent"
+    assert job["attempts"] == 2
+
+
+def test_sender_reporting_failure_is_retried(make_queue):
+    queue = make_queue(lambda phone_number, message: False, max_retries=1)
+
+    campaign = queue.enqueue(["+923001234567"], "Hello!")
+    [job] = wait_for_jobs(queue, campaign, all_final)
+
+    assert job["status"] == "failed"
+    assert job["attempts"] == 2
+    assert job["error"] == "sender reported failure"
+
+
+def test_cancel_stops_unsent_messages(make_queue):
+    sender = StubSender()
+    # One token: the first message goes out at once, the rest wait a minute
+    queue = make_queue(sender, interval=60, burst=1)
+
+    campaign = queue.enqueue(["+923001234567", "+923007654321", "+923001111111"], "Hello!")
+    wait_for_jobs(queue, campaign, lambda jobs: jobs[0]["status"] == "sent")
+    queue.cancel(campaign)
+    jobs = queue.jobs([campaign])
+
+    assert [job["status"] for job in jobs] == ["sent", "cancelled", "cancelled"]
+    assert len(sender.sends) == 1
+
+
+def test_cancel_leaves_other_campaigns_queued(make_queue):
+    queue = make_queue(StubSender(), interval=60, burst=1)
+
+    first = queue.enqueue(["+923001234567"], "Hello!")
+    wait_for_jobs(queue, first, all_final)
+    second = queue.enqueue(["+923007654321"], "Hi!")
+    third = queue.enqueue(["+923001111111"], "Hey!")
+    queue.cancel(third)
+
+    assert [job["status"] for job in queue.jobs([second])] == ["queued"]
+    assert [job["status"] for job in queue.jobs([third])] == ["cancelled"]
+
+
+def test_enforces_interval_between_messages(make_queue):
+    sender = StubSender()
+    queue = make_queue(sender, interval=0.2, burst=1)
+
+    campaign = queue.enqueue(["+923001234567", "+923007654321", "+923001111111"], "Hello!")
+    wait_for_jobs(queue, campaign, all_final)
+
+    times = [sent_at for _, _, sent_at in sender.sends]
+    gaps = [later - earlier for earlier, later in zip(times, times[1:])]
+    assert len(gaps) == 2
+    assert min(gaps) >= 0.18
+
+
+def test_burst_sends_back_to_back(make_queue):
+    sender = StubSender()
+    queue = make_queue(sender, interval=60, burst=2)
+
+    campaign = queue.enqueue(["+923001234567", "+923007654321", "+923001111111"], "Hello!")
+    jobs = wait_for_jobs(queue, campaign,
+                         lambda jobs: [job["status"] for job in jobs].count("sent") == 2)
+
+    assert [job["status"] for job in jobs] == ["sent", "sent", "queued"]
+
+
+def test_interrupted_send_is_failed_on_restart(tmp_path):
+    db_path = str(tmp_path / "dispatch.sqlite3")
+    queue = DispatchQueue(StubSender(), db_path=db_path, interval=60, burst=1)
+    campaign = queue.enqueue(["+923001234567", "+923007654321"], "Hello!")
+    wait_for_jobs(queue, campaign, lambda jobs: jobs[0]["status"] == "sent")
+    queue.stop(timeout=5)
+    queue._execute("UPDATE jobs SET status = 'sending' WHERE status = 'queued'")
+
+    restarted = DispatchQueue(StubSender(), db_path=db_path, interval=60)
+    try:
+        jobs = restarted.jobs([campaign])
+    finally:
+        restarted.stop(timeout=5)
+
+    assert jobs[1]["status"] == "failed"
+    assert jobs[1]["error"] == "interrupted while sending"
+
+
+def test_restart_keeps_sends_of_live_owners(tmp_path):
+    db_path = str(tmp_path / "dispatch.sqlite3")
+    live = DispatchQueue(StubSender(), db_path=db_path, interval=60, burst=1)
+    try:
+        campaign = live.enqueue(["+923001234567", "+923007654321", "+923001111111",
+                                 "+923002222222"], "Hello!")
+        jobs = wait_for_jobs(live, campaign, lambda jobs: jobs[0]["status"] == "sent")
+        # The second message is being sent by the live queue; the others were
+        # mid-send in a process that crashed and one whose heartbeat stopped.
+        crashed = subprocess.Popen([sys.executable, "-c", "pass"])
+        crashed.wait()
+        live._execute("INSERT INTO owners VALUES ('crashed', ?, ?)", (crashed.pid, time.time()))
+        live._execute("INSERT INTO owners VALUES ('silent', ?, ?)",
+                      (os.getpid(), time.time() - 3600))
+        for job, owner in zip(jobs[1:], (live.owner, "crashed", "silent")):
+            live._execute("UPDATE jobs SET status = 'sending', owner = ? WHERE id = ?",
+                          (owner, job["id"]))
+
+        restarted = DispatchQueue(StubSender(), db_path=db_path, interval=60)
+        restarted.stop(timeout=5)
+        jobs = live.jobs([campaign])
+    finally:
+        live.stop(timeout=5)
+
+    assert [job["status"] for job in jobs] == ["sent", "sending", "failed", "failed"]
+
+
+def test_queues_sharing_a_database_send_only_their_own_jobs(make_queue):
+    first_sender, second_sender = StubSender(), StubSender()
+    first, second = make_queue(first_sender), make_queue(second_sender)
+
+    first_campaign = first.enqueue(["+923001234567", "+923007654321"], "Hello!")
+    second_campaign = second.enqueue(["+923001111111"], "Hi!")
+    wait_for_jobs(first, first_campaign, all_final)
+    wait_for_jobs(second, second_campaign, all_final)
+
+    assert [number for number, _, _ in first_sender.sends] == ["+923001234567", "+923007654321"]
+    assert [number for number, _, _ in second_sender.sends] == ["+923001111111"]
+
+
+def test_jobs_of_a_stopped_queue_are_adopted(make_queue):
+    first = make_queue(StubSender(), interval=60, burst=1)
+    campaign = first.enqueue(["+923001234567", "+923007654321"], "Hello!")
+    wait_for_jobs(first, campaign, lambda jobs: jobs[0]["status"] == "sent")
+    first.stop(timeout=5)
+
+    sender = StubSender()
+    second = make_queue(sender)
+    jobs = wait_for_jobs(second, campaign, all_final)
+    assert [job["status"] for job in jobs] == ["sent", "sent"]
+    assert [number for number, _, _ in sender.sends] == ["+923007654321"]
+
+
+def test_interval_is_shared_by_queues_on_one_database(make_queue):
+    first_sender, second_sender = StubSender(), StubSender()
+    first = make_queue(first_sender, interval=0.2, burst=1)
+    second = make_queue(second_sender, interval=0.2, burst=1)
+
+    campaigns = [(first, first.enqueue(["+923001234567", "+923007654321"], "Hello!")),
+                 (second, second.enqueue(["+923001111111", "+923002222222"], "Hi!"))]
+    for queue, campaign in campaigns:
+        wait_for_jobs(queue, campaign, all_final)
+
+    times = sorted(sent_at for _, _, sent_at in first_sender.sends + second_sender.sends)
+    gaps = [later - earlier for earlier, later in zip(times, times[1:])]
+    assert len(gaps) == 3
+    assert min(gaps) >= 0.18
+
+
+class OtherSender(StubSender):
+    """Stand-in for a second registered backend, tracking its instances"""
+
+    name = "other"
+    instances = []
+
+    def __init__(self):
+        super().__init__()
+        self.closed = False
+        OtherSender.instances.append(self)
+
+    def close(self):
+        self.closed = True
+
+
+def test_campaigns_use_the_sender_they_name(make_queue, monkeypatch):
+    monkeypatch.setitem(lead_agent.MESSAGE_SENDERS, OtherSender.name, OtherSender)
+    OtherSender.instances = []
+    default = StubSender()
+    queue = make_queue(default)
+
+    first = queue.enqueue(["+923001234567"], "Hello!", sender="other")
+    second = queue.enqueue(["+923007654321"], "Hi!")
+    third = queue.enqueue(["+923001111111"], "Hey!", sender="other")
+    for campaign in (first, second, third):
+        wait_for_jobs(queue, campaign, all_final)
+
+    # One session per backend, kept open between campaigns
+    [other] = OtherSender.instances
+    assert [number for number, _, _ in other.sends] == ["+923001234567", "+923001111111"]
+    assert [number for number, _, _ in default.sends] == ["+923007654321"]
+    assert not other.closed
+    assert [job["sender"] for job in queue.jobs([first, second])] == ["other", None]
+
+    queue.stop(timeout=5)
+    assert other.closed
+
+
+def test_unknown_sender_is_rejected(make_queue):
+    queue = make_queue(StubSender())
+    with pytest.raises(ValueError):
+        queue.enqueue(["+923001234567"], "Hello!", sender="carrier pigeon")
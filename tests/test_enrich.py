@@ -0,0 +1,139 @@
+import asyncio
+import os
+
+import pytest
+
+from benchmarks.fake_sites import FakeSites
+from lead_agent import Business, PageCache, enrich_businesses, extract_contacts
+
+
+def test_extract_contacts_finds_emails_and_profiles():
+    page = """
+        <a href="mailto:Info@Cafe.example">Email</a> info@cafe.example
+        <p>sales&#64;cafe.example</p>
+        <a href="https://www.facebook.com/cafe/">Facebook</a>
+        <a href="https://instagram.com/cafe">Instagram</a>
+        <a href="https://www.facebook.com/cafe">Facebook again</a>
+    """
+    emails, social_links, contact_url = extract_contacts(page, "https://cafe.example/")
+    assert emails == ["info@cafe.example", "sales@cafe.example"]
+    assert social_links == ["https://www.facebook.com/cafe", "https://instagram.com/cafe"]
+    assert contact_url is None
+
+
+def test_extract_contacts_skips_retina_image_names():
+    page = '<img src="/img/logo@2x.png"><img src="hero@3x.webp"> hello@cafe.example'
+    emails, _, _ = extract_contacts(page, "https://cafe.example/")
+    assert emails == ["hello@cafe.example"]
+
+
+def test_extract_contacts_skips_share_links():
+    page = """
+        <a href="https://www.facebook.com/sharer/sharer.php?u=x">Share</a>
+        <a href="https://twitter.com/intent/tweet?text=x">Tweet</a>
+        <a href="https://www.linkedin.com/">LinkedIn</a>
+        <a href="https://www.linkedin.com/company/cafe">Company</a>
+    """
+    _, social_links, _ = extract_contacts(page, "https://cafe.example/")
+    assert social_links == ["https://www.linkedin.com/company/cafe"]
+
+
+@pytest.mark.parametrize("page, expected", [
+    ('<a href="contact">Contact</a>', "https://cafe.example/about/contact"),
+    ('<a href="/Kontakt/">Kontakt</a>', "https://cafe.example/Kontakt/"),
+    ('<a href="https://other.example/contact">Theirs</a><a href="/impressum">Ours</a>',
+     "https://cafe.example/impressum"),
+    ('<a href="mailto:contact@cafe.example">Mail</a>', None),
+    ('<a href="/menu">Menu</a>', None),
+])
+def test_extract_contacts_finds_the_contact_page(page, expected):
+    _, _, contact_url = extract_contacts(page, "https://cafe.example/about/")
+    assert contact_url == expected
+
+
+@pytest.fixture
+def fake_sites():
+    with FakeSites(sites=20, page_kb=5) as sites:
+        yield sites
+
+
+def enrich(businesses, **kwargs):
+    return asyncio.run(enrich_businesses(businesses, **kwargs))
+
+
+def test_enriches_home_and_contact_pages(fake_sites):
+    # Site 1 has its email on the home page, site 3 only on its contact page
+    businesses = [Business(name="Cafe 1", website=fake_sites.url_for(1)),
+                  Business(name="Cafe 3", website=fake_sites.url_for(3))]
+    stats = enrich(businesses, cache=False)
+
+    assert businesses[0].emails == "info@business1.example"
+    assert businesses[0].social_links == ("https://www.facebook.com/business1; "
+                                          "https://instagram.com/business1")
+    assert businesses[1].emails == "hello@business3.example"
+    assert stats.fetched == 3
+    assert stats.with_emails == 2
+
+
+def test_shared_sites_are_fetched_once(fake_sites):
+    businesses = [Business(name=f"Branch {n}", website=fake_sites.url_for(1))
+                  for n in range(3)]
+    stats = enrich(businesses, cache=False)
+
+    assert fake_sites.requests == 1
+    assert stats.sites == 1
+    assert [business.emails for business in businesses] == ["info@business1.example"] * 3
+
+
+def test_social_profile_websites_are_not_fetched(fake_sites):
+    business = Business(name="Cafe", website="https://www.instagram.com/cafe/")
+    enrich([business], cache=False)
+
+    assert business.emails == ""
+    assert business.social_links == "https://www.instagram.com/cafe"
+    assert fake_sites.requests == 0
+
+
+def test_pages_are_capped_at_max_bytes():
+    with FakeSites(sites=2, page_kb=200) as sites:
+        business = Business(name="Cafe 1", website=sites.url_for(1))
+        stats = enrich([business], cache=False, max_bytes=10_000)
+
+    assert stats.truncated == 1
+    # The footer with the email is far beyond the cap
+    assert business.emails == ""
+
+
+def test_server_errors_are_not_cached(fake_sites, tmp_path):
+    cache = PageCache(directory=str(tmp_path))
+    business = Business(name="Cafe 9", website=fake_sites.url_for(9))  # HTTP 500
+    stats = enrich([business], cache=cache)
+
+    assert business.emails is None
+    assert stats.failed == 1
+    assert not os.path.exists(cache.directory) or os.listdir(cache.directory) == []
+
+    enrich([business], cache=cache)
+    assert fake_sites.requests == 2  # retried, not served from the cache
+
+
+def test_cached_pages_are_not_refetched(fake_sites, tmp_path):
+    cache = PageCache(directory=str(tmp_path))
+    enrich([Business(name="Cafe 1", website=fake_sites.url_for(1))], cache=cache)
+
+    business = Business(name="Cafe 1", website=fake_sites.url_for(1))
+    stats = enrich([business], cache=cache)
+    assert business.emails == "info@business1.example"
+    assert stats.cached == 1
+    assert stats.fetched == 0
+    assert fake_sites.requests == 1
+
+
+def test_page_cache_is_evicted_to_max_entries(fake_sites, tmp_path):
+    cache = PageCache(directory=str(tmp_path), max_entries=3)
+    businesses = [Business(name=f"Cafe {n}", website=fake_sites.url_for(n))
+                  for n in (1, 2, 4, 5, 7)]
+    stats = enrich(businesses, cache=cache)
+
+    assert stats.fetched == 5
+    assert len(os.listdir(cache.directory)) == 3
@@ -0,0 +1,114 @@
+import asyncio
+from unittest.mock import MagicMock
+
+import pytest
+
+import lead_agent
+from lead_agent import Business, LeadIndex
+
+
+def cafe(n, rating=4.0):
+    return Business(name=f"Cafe {n}", phone_number=f"+92 300 12345{n:02d}",
+                    reviews_average=rating, place_url=f"https://maps.example/place/{n}")
+
+
+@pytest.fixture
+def lead_index(tmp_path):
+    return LeadIndex(db_path=str(tmp_path / "leads.sqlite3"))
+
+
+def age(lead_index, seconds):
+    """Makes every indexed lead look extracted `seconds` earlier"""
+    with lead_index._db:
+        lead_index._db.execute("UPDATE leads SET last_seen = last_seen - ?", (seconds,))
+
+
+def test_get_many_returns_known_place_urls(lead_index):
+    assert lead_index.add_many([cafe(0), cafe(1)]) == 2
+    assert lead_index.add_many([cafe(1)]) == 0
+
+    found = lead_index.get_many([cafe(0).place_url, "https://maps.example/place/9"])
+    assert list(found) == [cafe(0).place_url]
+    assert found[cafe(0).place_url].name == "Cafe 0"
+
+
+def test_leads_older_than_max_age_are_not_reused(lead_index):
+    lead_index.max_age = 3600
+    lead_index.add_many([cafe(0)])
+    age(lead_index, 7200)
+    assert lead_index.get_many([cafe(0).place_url]) == {}
+
+    # Extracting it again makes it fresh
+    lead_index.add_many([cafe(0, rating=4.5)])
+    assert lead_index.get_many([cafe(0).place_url])[cafe(0).place_url].reviews_average == 4.5
+
+
+def test_updates_that_are_not_extractions_keep_the_age(lead_index):
+    lead_index.max_age = 3600
+    lead_index.add_many([cafe(0)])
+    age(lead_index, 7200)
+
+    enriched = cafe(0)
+    enriched.emails = "info@cafe0.example"
+    lead_index.add_many([enriched], extracted=False)
+    assert lead_index.get_many([cafe(0).place_url]) == {}
+    assert lead_index.contains(enriched)
+
+
+def scrape(lead_index, monkeypatch, place_urls, reuse_leads):
+    """Runs scrape_with_context with the browser parts replaced, returns (rows, extracted URLs)"""
+    extracted = []
+
+    async def collect_place_urls(*args, **kwargs):
+        return place_urls
+
+    async def scrape_details(context, urls, concurrency, waits, on_result, limiter, lean):
+        for url in urls:
+            extracted.append(url)
+            business = cafe(int(url.rsplit("/", 1)[1]), rating=5.0)
+            on_result(url, business)
+
+    monkeypatch.setattr(lead_agent, "collect_place_urls", collect_place_urls)
+    monkeypatch.setattr(lead_agent, "scrape_details", scrape_details)
+    context = MagicMock()
+
+    async def new_page():
+        return MagicMock(close=lambda: asyncio.sleep(0))
+    context.new_page = new_page
+
+    business_list = asyncio.run(lead_agent.scrape_with_context(
+        context, "cafes", len(place_urls), lean=False, lead_index=lead_index,
+        reuse_leads=reuse_leads))
+    return business_list, extracted
+
+
+def test_scrape_reuses_known_leads(lead_index, monkeypatch):
+    lead_index.add_many([cafe(0)])
+    urls = [cafe(0).place_url, cafe(1).place_url]
+
+    business_list, extracted = scrape(lead_index, monkeypatch, urls, reuse_leads=True)
+    assert extracted == [cafe(1).place_url]
+    assert [business.reviews_average for business in business_list.business_list] == [4.0, 5.0]
+    assert business_list.stats.cached_rows == 1
+    assert len(lead_index) == 2
+
+
+def test_scrape_without_reuse_extracts_everything(lead_index, monkeypatch):
+    lead_index.add_many([cafe(0)])
+    urls = [cafe(0).place_url, cafe(1).place_url]
+
+    business_list, extracted = scrape(lead_index, monkeypatch, urls, reuse_leads=False)
+    assert extracted == urls
+    assert [business.reviews_average for business in business_list.business_list] == [5.0, 5.0]
+    # The index holds the fresh details now
+    assert lead_index.get(cafe(0).place_url).reviews_average == 5.0
+
+
+def test_reused_leads_are_not_refreshed(lead_index, monkeypatch):
+    lead_index.max_age = 3600
+    lead_index.add_many([cafe(0)])
+    age(lead_index, 3000)
+
+    scrape(lead_index, monkeypatch, [cafe(0).place_url], reuse_leads=True)
+    age(lead_index, 1000)
+    assert lead_index.get(cafe(0).place_url) is None
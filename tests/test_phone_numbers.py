@@ -0,0 +1,58 @@
+from lead_agent import (PHONE_DUPLICATE, PHONE_INVALID, PHONE_LANDLINE, PHONE_VALID,
+                        normalize_phone_digits, normalize_phone_numbers)
+
+
+def normalized(phone_numbers, default_country_code="92"):
+    frame = normalize_phone_numbers(phone_numbers, default_country_code)
+    return list(zip(frame["phone_e164"], frame["phone_status"]))
+
+
+def test_international_formats():
+    assert normalized(["+1 212-367-7590", "0044 7911 123456", "+92 300-1234567"]) == [
+        ("+12123677590", PHONE_VALID),
+        ("+447911123456", PHONE_VALID),
+        ("+923001234567", PHONE_VALID),
+    ]
+
+
+def test_national_format_uses_default_country_code():
+    assert normalized(["0300 1234567"]) == [("+923001234567", PHONE_VALID)]
+
+
+def test_national_format_without_default_country_code_is_invalid():
+    assert normalized(["0300 1234567", "+92 300 1234567"], default_country_code="") == [
+        ("", PHONE_INVALID),
+        ("+923001234567", PHONE_VALID),
+    ]
+
+
+def test_landlines_are_flagged():
+    assert normalized(["051 1234567", "+44 20 7946 0958"]) == [
+        ("+92511234567", PHONE_LANDLINE),
+        ("+442079460958", PHONE_LANDLINE),
+    ]
+
+
+def test_invalid_and_missing_numbers():
+    assert normalized(["", None, "123", "call us"]) == [("", PHONE_INVALID)] * 4
+
+
+def test_repeats_are_duplicates_across_formats():
+    assert normalized(["+92 300 1234567", "0300 1234567", "0092 300 1234567"]) == [
+        ("+923001234567", PHONE_VALID),
+        ("+923001234567", PHONE_DUPLICATE),
+        ("+923001234567", PHONE_DUPLICATE),
+    ]
+
+
+def test_keeps_length_and_order():
+    numbers = ["", "+92 300 1234567", None, "051 1234567"]
+    frame = normalize_phone_numbers(numbers, "92")
+    assert len(frame) == len(numbers)
+    assert list(frame["phone_status"]) == [PHONE_INVALID, PHONE_VALID, PHONE_INVALID,
+                                           PHONE_LANDLINE]
+
+
+def test_single_number_digits_match_the_column():
+    for number in ["+92 300 1234567", "0300 1234567", "0092 300 1234567"]:
+        assert normalize_phone_digits(number, "92") == "923001234567"
@@ -0,0 +1,117 @@
+import asyncio
+
+import pytest
+
+from lead_agent import (DEFAULT_NUM_RESULTS, AgentPlanner, PlanCache, Planner,
+                        RuleBasedPlanner)
+
+
+def rule_plan(text):
+    return asyncio.run(RuleBasedPlanner().plan(text))
+
+
+def search(query, num_results=DEFAULT_NUM_RESULTS):
+    return [{"function_name": "search_Maps",
+             "args": {"query": query, "num_results": num_results}}], ""
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("Find cafes in Islamabad", search("cafes in Islamabad")),
+    ("10 cafes in Islamabad", search("cafes in Islamabad", 10)),
+    ("cafes in Islamabad, 10", search("cafes in Islamabad", 10)),
+    ("please show me the top 10 barber shops near Lahore.", search("barber shops near Lahore", 10)),
+    ("Show me barber shops in Malakand, maybe 10 of them", search("barber shops in Malakand", 10)),
+    ("search for 5 pizza places in New York", search("pizza places in New York", 5)),
+    ("list dentists in Karachi, 15 results", search("dentists in Karachi", 15)),
+])
+def test_rules_plan_plain_searches(text, expected):
+    assert rule_plan(text) == expected
+
+
+@pytest.mark.parametrize("text", [
+    "cafes in Islamabad",
+    "hello in spanish",
+    "jokes in french",
+    "weather in London",
+    "tell me a joke in French",
+    "what is the weather in London",
+    "Is it raining in Paris",
+    "translate hello in Spanish",
+    "Find me graphic design clients in New York",
+    "get me plumbing leads in Chicago",
+    "find cafes in Islamabad and send them 'Hello!'",
+    "find cafes in Islamabad and message the first 5",
+    "the best place to eat really good food in Lahore",
+    "hello",
+])
+def test_rules_leave_other_requests_to_the_next_planner(text):
+    assert rule_plan(text) is None
+
+
+def test_plan_cache_returns_copies():
+    cache = PlanCache()
+    planned_calls, _ = search("cafes in Islamabad")
+    cache.put("cafes in Islamabad", planned_calls)
+
+    cached = cache.get("cafes in Islamabad")
+    cached[0]["args"]["num_results"] = 99
+    assert cache.get("cafes in Islamabad") == planned_calls
+
+
+def test_plan_cache_keys_on_the_exact_trimmed_input():
+    cache = PlanCache()
+    planned_calls = [{"function_name": "prepare_whatsapp_message",
+                      "args": {"message": "Hello World"}}]
+    cache.put("send 'Hello World' to +923001234567", planned_calls)
+
+    assert cache.get("  send 'Hello World' to +923001234567\n") == planned_calls
+    assert cache.get("send 'hello world' to +923001234567") is None
+    assert cache.get("send 'Hello  World' to +923001234567") is None
+
+
+def test_plan_cache_expires_entries():
+    cache = PlanCache(ttl=-1)
+    cache.put("cafes in Islamabad", search("cafes in Islamabad")[0])
+    assert cache.get("cafes in Islamabad") is None
+
+
+def test_plan_cache_evicts_least_recently_used():
+    cache = PlanCache(max_entries=2)
+    for text in ("cafes in Islamabad", "bars in Lahore"):
+        cache.put(text, search(text)[0])
+    cache.get("cafes in Islamabad")
+    cache.put("gyms in Karachi", search("gyms in Karachi")[0])
+
+    assert cache.get("cafes in Islamabad") is not None
+    assert cache.get("bars in Lahore") is None
+    assert cache.get("gyms in Karachi") is not None
+
+
+class CountingPlanner(Planner):
+    """Plans every request as a search for its text, counting the calls"""
+
+    name = "counting"
+
+    def __init__(self):
+        self.calls = 0
+
+    async def plan(self, user_input):
+        self.calls += 1
+        return search(user_input)
+
+
+def test_agent_planner_tries_rules_first_then_caches():
+    fallback = CountingPlanner()
+    planner = AgentPlanner(planners=[RuleBasedPlanner(), fallback])
+
+    async def plan_all():
+        return [await planner.plan(text) for text in
+                ("find cafes in Islamabad", "Find me clients in Lahore", "Find me clients in Lahore")]
+
+    by_rules, by_fallback, cached = asyncio.run(plan_all())
+    assert by_rules == search("cafes in Islamabad")
+    assert by_fallback == cached == search("Find me clients in Lahore")
+    assert fallback.calls == 1
+    assert planner.stats.calls["rules"] == 1
+    assert planner.stats.calls["counting"] == 1
+    assert planner.stats.cache_hits == 1
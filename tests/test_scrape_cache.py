@@ -0,0 +1,77 @@
+import time
+
+from lead_agent import Business, BusinessList, ScrapeCache, cache_hit
+
+
+def business_list(count, reached_end=False, complete=True):
+    businesses = BusinessList([Business(name=f"Cafe {n}", phone_number=f"+9230012345{n:02d}")
+                               for n in range(count)])
+    businesses.stats.reached_end = reached_end
+    businesses.stats.complete = complete
+    return businesses
+
+
+def test_cache_hit_missing_entry():
+    assert cache_hit(None, 10) is None
+
+
+def test_cache_hit_serves_the_requested_rows():
+    entry = {"businesses": business_list(5).business_list, "exhausted": False}
+    hit = cache_hit(entry, 3)
+    assert [business.name for business in hit.business_list] == ["Cafe 0", "Cafe 1", "Cafe 2"]
+    assert hit.stats.cached_rows == 3
+    assert hit.stats.listings_found == 5
+    assert hit.business_list[0].phone_e164 == "+923001234500"
+
+
+def test_cache_hit_needs_enough_rows():
+    entry = {"businesses": business_list(2).business_list, "exhausted": False}
+    assert cache_hit(entry, 5) is None
+
+
+def test_cache_hit_serves_an_exhausted_feed():
+    entry = {"businesses": business_list(2).business_list, "exhausted": True}
+    hit = cache_hit(entry, 5)
+    assert hit.get_row_size() == 2
+    assert hit.stats.cached_rows == 2
+
+
+def test_round_trip_through_the_cache(tmp_path):
+    cache = ScrapeCache(directory=str(tmp_path))
+    cache.put("Cafes in Islamabad", 5, business_list(5))
+
+    entry = cache.get("cafes  in islamabad")
+    assert entry["requested"] == 5
+    assert entry["exhausted"] is False
+    assert cache_hit(entry, 5).get_row_size() == 5
+    assert cache_hit(entry, 6) is None
+
+
+def test_only_a_real_end_of_feed_is_exhausted(tmp_path):
+    cache = ScrapeCache(directory=str(tmp_path))
+    cache.put("cafes in islamabad", 20, business_list(3, reached_end=True))
+    cache.put("bars in islamabad", 20, business_list(3, reached_end=False))
+
+    assert cache_hit(cache.get("cafes in islamabad"), 20).get_row_size() == 3
+    assert cache_hit(cache.get("bars in islamabad"), 20) is None
+
+
+def test_expired_entries_are_dropped(tmp_path):
+    cache = ScrapeCache(directory=str(tmp_path), ttl=-1)
+    cache.put("cafes in islamabad", 5, business_list(5))
+    assert cache.get("cafes in islamabad") is None
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    cache = ScrapeCache(directory=str(tmp_path), max_entries=2)
+    cache.put("cafes in islamabad", 1, business_list(1))
+    time.sleep(0.01)
+    cache.put("bars in islamabad", 1, business_list(1))
+    time.sleep(0.01)
+    cache.get("cafes in islamabad")  # now the most recently used
+    time.sleep(0.01)
+    cache.put("gyms in islamabad", 1, business_list(1))
+
+    assert cache.get("cafes in islamabad") is not None
+    assert cache.get("bars in islamabad") is None
+    assert cache.get("gyms in islamabad") is not None
@@ -0,0 +1,101 @@
+import asyncio
+from unittest.mock import MagicMock
+
+import lead_agent
+from lead_agent import ScrapeStats, open_page, scraping_profile
+
+
+class FakeSession:
+    def __init__(self):
+        self.sent = []
+
+    async def send(self, method, params=None):
+        self.sent.append((method, params))
+
+
+class FakeContext:
+    """Records the listeners and DevTools commands of a browser context"""
+
+    def __init__(self):
+        self.session = FakeSession()
+        self.listeners = {}
+        self.routed = False
+
+    async def new_page(self):
+        return MagicMock(context=self)
+
+    async def new_cdp_session(self, page):
+        return self.session
+
+    async def route(self, *args):
+        self.routed = True
+
+    def on(self, event, listener):
+        self.listeners.setdefault(event, []).append(listener)
+
+    def remove_listener(self, event, listener):
+        self.listeners[event].remove(listener)
+
+
+def test_lean_pages_block_urls_without_routing():
+    context = FakeContext()
+    asyncio.run(open_page(context, lean=True))
+
+    [enable, (method, params)] = context.session.sent
+    assert enable == ("Network.enable", None)
+    assert method == "Network.setBlockedURLs"
+    assert "*/maps/vt*" in params["urls"]
+    # A route handler would turn off the browser's HTTP cache
+    assert not context.routed
+
+
+def test_full_pages_block_nothing():
+    context = FakeContext()
+    asyncio.run(open_page(context, lean=False))
+    assert context.session.sent == []
+
+
+def finished(failure=None):
+    return MagicMock(failure=failure)
+
+
+def test_profile_counts_requests_and_blocked_ones(monkeypatch):
+    monkeypatch.setattr(lead_agent, "MEASURE_TRAFFIC", False)
+    context = FakeContext()
+    stats = ScrapeStats(lean=True)
+
+    async def scrape():
+        async with scraping_profile(context, stats):
+            # Response sizes are not asked for unless measuring traffic
+            assert len(context.listeners["requestfinished"]) == 1
+            for listener in context.listeners["requestfinished"]:
+                listener(finished())
+            for listener in context.listeners["requestfailed"]:
+                listener(finished("net::ERR_BLOCKED_BY_CLIENT"))
+                listener(finished("net::ERR_CONNECTION_RESET"))
+
+    asyncio.run(scrape())
+    assert (stats.requests, stats.blocked_requests) == (1, 1)
+    assert context.listeners == {"requestfinished": [], "requestfailed": []}
+
+
+def test_profile_adds_up_response_sizes_when_measuring(monkeypatch):
+    monkeypatch.setattr(lead_agent, "MEASURE_TRAFFIC", True)
+    context = FakeContext()
+    stats = ScrapeStats()
+    request = MagicMock()
+
+    async def sizes():
+        return {"responseHeadersSize": 200, "responseBodySize": 1000}
+    request.sizes = sizes
+
+    async def scrape():
+        async with scraping_profile(context, stats):
+            for listener in context.listeners["requestfinished"]:
+                result = listener(request)
+                if asyncio.iscoroutine(result):
+                    await result
+
+    asyncio.run(scrape())
+    assert stats.requests == 1
+    assert stats.bytes_transferred == 1200